@@ -1,26 +1,37 @@
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 import os
 
 from .database import get_db
 from . import crud, models
-
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+from .cache import principal_cache
+from .hashing import hash_pool, get_context
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# EventSource cannot send headers, so event streams take a ticket in the URL instead of the
+# access token: it lapses within seconds and no other endpoint accepts it (its audience),
+# so one copied from an access log or the browser history is useless
+STREAM_TICKET_SECONDS = int(os.getenv("STREAM_TICKET_SECONDS", "30"))
+STREAM_AUDIENCE = "event-stream"
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_context().hash(password)
+
+# Async variants used by the API; the work runs in the hashing process pool
+async def get_password_hash_async(password: str) -> str:
+    return await hash_pool.hash(password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str):
+    return await hash_pool.verify_and_update(plain_password, hashed_password)
 
 def create_access_token(subject: str, expires_delta: timedelta | None = None) -> str:
     to_encode = {"sub": subject, "iat": datetime.now(tz=timezone.utc)}
@@ -29,6 +40,23 @@ def create_access_token(subject: str, expires_delta: timedelta | None = None) ->
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_stream_ticket(token: str) -> str:
+    """Stream ticket for the holder of a valid access token; the stream ends when that token expires"""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    now = datetime.now(tz=timezone.utc)
+    return jwt.encode({
+        "sub": payload["sub"], "aud": STREAM_AUDIENCE, "iat": now,
+        "exp": now + timedelta(seconds=STREAM_TICKET_SECONDS), "until": payload["exp"],
+    }, SECRET_KEY, algorithm=ALGORITHM)
+
+def read_stream_ticket(ticket: str) -> tuple:
+    """(email, unix time the stream has to end by); 401 when the ticket is invalid or lapsed"""
+    try:
+        payload = jwt.decode(ticket, SECRET_KEY, algorithms=[ALGORITHM], audience=STREAM_AUDIENCE)
+        return payload["sub"], int(payload["until"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired stream ticket")
+
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,11 +70,26 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+
+    # Cache hit: only the identity is attached, without a SELECT; any other column
+    # (role, total_minutes, ...) is read from the database on first access, so
+    # handlers that only need u.id cost nothing and the rest never see stale values
+    user_id = principal_cache.get(email)
+    if user_id is not None:
+        user = models.User(id=user_id, email=email)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
     user = crud.get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
+    principal_cache.set(email, user.id)
     return user
 
+def invalidate_principal(user: models.User):
+    """Drop the cached principal after the user's email changed or the user was deleted"""
+    principal_cache.invalidate(user.email)
+
 def require_admin(current_user: models.User = Depends(get_current_user)) -> models.User:
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
@@ -1,6 +1,17 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import BigInteger, Integer, cast, func, select
 from sqlalchemy.orm import Session
+
+try:
+    import numpy as np
+except ImportError:  # only the history backfill needs it
+    np = None
+
 from . import models
-from datetime import datetime, timedelta
+from .database import SessionLocal, dialect_insert, engine as default_engine
 
 # นิยามเหรียญทั้งหมด
 ALL_BADGES = [
@@ -13,57 +24,311 @@ ALL_BADGES = [
     {"id": "weekend_warrior", "name": "นักรบวันหยุด", "desc": "ขยันเรียนในวันเสาร์-อาทิตย์", "icon": "🏖️", "category": "Crazy"},
 ]
 
-def check_badges(db: Session, user: models.User):
-    unlocked = []
-    
-    # 1. Newbie (ได้ทุกคน)
-    unlocked.append("newbie")
-
-    # 2. Supporter (มี Enrollment)
-    enroll_count = db.query(models.Enrollment).filter(models.Enrollment.user_id == user.id).count()
-    if enroll_count > 0:
-        unlocked.append("supporter")
-
-    # 3. Time Based (1 Hour)
-    if user.total_minutes >= 60:
-        unlocked.append("one_hour")
-
-    # --- เช็คจากประวัติการเรียน (Logs) ---
-    # ดึง log 50 รายการล่าสุดมาเช็คพฤติกรรม
-    logs = db.query(models.StudyLog).filter(models.StudyLog.user_id == user.id).order_by(models.StudyLog.created_at.desc()).limit(50).all()
-    
-    if logs:
-        unlocked.append("first_class") # มี log แปลว่าเคยเรียน
-        
-        has_night = False
-        has_zombie = False
-        has_weekend = False
-
-        for log in logs:
-            # แปลงเวลาเป็นเวลาไทยคร่าวๆ (UTC+7)
-            th_time = log.created_at + timedelta(hours=7)
-            hour = th_time.hour
-            weekday = th_time.weekday() # 5=Sat, 6=Sun
-
-            if 22 <= hour or hour <= 2: has_night = True
-            if 3 <= hour <= 5: has_zombie = True
-            if weekday in [5, 6]: has_weekend = True
-
-        if has_night: unlocked.append("night_owl")
-        if has_zombie: unlocked.append("zombie")
-        if has_weekend: unlocked.append("weekend_warrior")
-
-    return unlocked
+# settings key listing the rules whose history has already been backfilled
+BACKFILLED_KEY = "badge_rules_backfilled"
+TH_OFFSET = timedelta(hours=7)
+
+# ==========================================
+#  RULES
+#  badge id -> (events, check(ctx) -> bool, vector(cols) -> mask | None).
+#  `check` runs on live events, with these contexts:
+#    signup      {}
+#    enrollment  {}
+#    progress    {}  a lesson was marked completed
+#    study       {"total_minutes": int, "times": [created_at (UTC), ...]}
+#  `vector` is the same test over a chunk of history (see backfill): numpy
+#  arrays keyed "user_id" plus "total_minutes" for users, or "hour" /
+#  "weekday" (Thai time) for study logs. It returns a boolean mask, or None
+#  when the chunk lacks the columns it needs.
+#  Rules must be monotone (once true for some history, true for any larger
+#  one) because unlocks are never taken back.
+# ==========================================
+RULES = {}
+
+
+def rule(badge_id: str, *events: str, vector):
+    def register(check):
+        RULES[badge_id] = (events, check, vector)
+        return check
+    return register
+
+
+def _th_times(ctx):
+    # แปลงเวลาเป็นเวลาไทย (UTC+7)
+    return (t + TH_OFFSET for t in ctx.get("times", ()))
+
+
+def _every(cols):
+    return np.ones(len(cols["user_id"]), dtype=bool)
+
+def _when(key, test):
+    return lambda cols: test(cols[key]) if key in cols else None
+
+
+@rule("newbie", "signup", vector=_every)
+def _newbie(ctx):
+    return True
+
+@rule("first_class", "study", "progress", vector=_every)
+def _first_class(ctx):
+    return True
+
+@rule("one_hour", "study", vector=_when("total_minutes", lambda m: m >= 60))
+def _one_hour(ctx):
+    return (ctx.get("total_minutes") or 0) >= 60
+
+@rule("supporter", "enrollment", vector=_every)
+def _supporter(ctx):
+    return True
+
+@rule("night_owl", "study", vector=_when("hour", lambda h: (h >= 22) | (h <= 2)))
+def _night_owl(ctx):
+    return any(t.hour >= 22 or t.hour <= 2 for t in _th_times(ctx))
+
+@rule("zombie", "study", vector=_when("hour", lambda h: (h >= 3) & (h <= 5)))
+def _zombie(ctx):
+    return any(3 <= t.hour <= 5 for t in _th_times(ctx))
+
+@rule("weekend_warrior", "study", vector=_when("weekday", lambda d: d >= 5))
+def _weekend_warrior(ctx):
+    return any(t.weekday() in (5, 6) for t in _th_times(ctx))
+
+
+def _unlock(conn, rows: list):
+    if rows:
+        stmt = dialect_insert(conn)(models.UserBadge).on_conflict_do_nothing(index_elements=["user_id", "badge_id"])
+        conn.execute(stmt, rows)
+
+
+def on_event(db, user_id: int, event: str, **ctx) -> list:
+    """Run the rules listening to `event` for one user.
+
+    Unlocks are written in the caller's transaction; returns the ids whose
+    rule matched (already unlocked ones included).
+    """
+    ids = [b for b, (events, check, _) in RULES.items() if event in events and check(ctx)]
+    now = datetime.utcnow()
+    _unlock(db, [{"user_id": user_id, "badge_id": b, "unlocked_at": now} for b in ids])
+    return ids
+
+# ==========================================
+#  READS
+# ==========================================
+def unlocked_ids(db: Session, user_id: int) -> set:
+    return set(db.scalars(select(models.UserBadge.badge_id).where(models.UserBadge.user_id == user_id)))
 
 def get_user_badges_status(db: Session, user: models.User):
-    my_unlocks = set(check_badges(db, user))
+    my_unlocks = unlocked_ids(db, user.id)
     my_showcase = user.showcase_badges.split(",") if user.showcase_badges else []
-    
+
     result = []
     for b in ALL_BADGES:
         item = b.copy()
         item["is_unlocked"] = b["id"] in my_unlocks
         item["is_showcased"] = b["id"] in my_showcase
         result.append(item)
-    
-    return result
\ No newline at end of file
+
+    return result
+
+# ==========================================
+#  BACKFILL
+# ==========================================
+def _epoch(col, dialect: str):
+    # whole seconds since 1970 computed by the database, so no datetime parsing per row
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", col), BigInteger)
+    return cast(func.strftime("%s", col), Integer)
+
+
+def _columns(part, names: tuple) -> dict:
+    # column by column through zip(): numpy is very slow at unpacking Row objects itself
+    cols = {name: np.fromiter(col, dtype=np.int64, count=len(part)) for name, col in zip(names, zip(*part))}
+    if "epoch" in cols:
+        local = cols.pop("epoch") + int(TH_OFFSET.total_seconds())
+        cols["hour"] = local // 3600 % 24
+        cols["weekday"] = (local // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+    return cols
+
+
+def backfill(conn, badge_ids=None, batch: int = 100000, progress=None, write=None) -> int:
+    """Evaluate rules (all by default) over the whole history and store the unlocks.
+
+    users, enrollments, completed progress and study_logs are streamed in
+    chunks of `batch` rows; every chunk becomes numpy arrays and each rule's
+    `vector` is applied to it at once. A bitmap per rule over user ids (seeded
+    with the unlocks that already exist) keeps each unlock to a single write,
+    so memory is bounded by the user count, not the history size. `conn` is a
+    Session or a Connection; `progress(source, rows_done, rows_total)` is
+    called after every chunk. `write(rows)` stores a chunk's unlocks, by
+    default in `conn`'s transaction (see run_backfill for per-chunk commits).
+    Returns the number of new unlocks written.
+    """
+    if np is None:
+        raise RuntimeError("badge backfill needs numpy (pip install numpy)")
+    U, E, P, L, B = models.User, models.Enrollment, models.Progress, models.StudyLog, models.UserBadge
+    dialect = (conn.get_bind() if hasattr(conn, "get_bind") else conn).dialect.name
+    ids = list(badge_ids or RULES)
+    write = write or (lambda rows: _unlock(conn, rows))
+    top = conn.execute(select(func.max(U.id))).scalar() or 0
+    # users created after this point are covered by the live events
+    seen = np.zeros((len(ids), top + 1), dtype=bool)
+    for i, b in enumerate(ids):
+        for part in conn.execute(select(B.user_id).where(B.badge_id == b).execution_options(yield_per=batch)).partitions():
+            uids = _columns(part, ("user_id",))["user_id"]
+            seen[i, uids[uids <= top]] = True
+
+    sources = [
+        ("signup", "users", select(U.id), ("user_id",)),
+        ("enrollment", "enrollments", select(E.user_id).where(E.user_id != None), ("user_id",)),
+        ("progress", "progress", select(P.user_id).where(P.completed == True, P.user_id != None), ("user_id",)),
+        ("study", "user_minutes", select(U.id, U.total_minutes).where(U.total_minutes > 0), ("user_id", "total_minutes")),
+        ("study", "study_logs", select(L.user_id, _epoch(L.created_at, dialect)).where(L.user_id != None, L.created_at != None), ("user_id", "epoch")),
+    ]
+    written = 0
+    for event, label, stmt, names in sources:
+        checks = [(i, RULES[b][2]) for i, b in enumerate(ids) if event in RULES[b][0]]
+        if not checks:
+            continue  # the source query is never run
+        done, total = 0, None
+        if progress:
+            total = conn.execute(select(func.count()).select_from(stmt.subquery())).scalar()
+            progress(label, done, total)
+        for part in conn.execute(stmt.execution_options(yield_per=batch)).partitions():
+            cols = _columns(part, names)
+            now, rows = datetime.utcnow(), []
+            for i, vector in checks:
+                mask = vector(cols)
+                if mask is None:
+                    continue
+                uids = cols["user_id"][mask]
+                uids = uids[uids <= top]
+                fresh = np.unique(uids[~seen[i, uids]])
+                if len(fresh):
+                    seen[i, fresh] = True
+                    rows.extend({"user_id": int(u), "badge_id": ids[i], "unlocked_at": now} for u in fresh)
+            if rows:
+                write(rows)
+            written += len(rows)
+            done += len(part)
+            if progress:
+                progress(label, done, total)
+    return written
+
+
+def backfilled_rules(conn) -> set:
+    value = conn.execute(select(models.Setting.value).where(models.Setting.key == BACKFILLED_KEY)).scalar()
+    return set(value.split(",")) if value else set()
+
+
+def mark_backfilled(conn, badge_ids):
+    value = ",".join(sorted(backfilled_rules(conn) | set(badge_ids)))
+    stmt = dialect_insert(conn)(models.Setting).values(key=BACKFILLED_KEY, value=value)
+    conn.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": value}))
+
+
+def pending_rules(conn) -> list:
+    """Rules whose history has not been backfilled yet"""
+    done = backfilled_rules(conn)
+    return [b for b in RULES if b not in done]
+
+
+def run_backfill(engine, badge_ids=None, batch: int = 100000, progress=None) -> int:
+    """backfill() with every chunk's unlocks committed on their own.
+
+    History is streamed on one connection and each chunk's INSERT is committed
+    on a second one, so the write lock is held for one chunk at a time rather
+    than the whole run (minutes for tens of millions of logs). The rules are
+    recorded as backfilled only after the last chunk; a run that stops half way
+    is simply started again, as unlocks are idempotent.
+    """
+    from .database import maintenance_engine
+
+    engine = maintenance_engine(engine)
+    ids = list(badge_ids or RULES)
+    with engine.connect() as reader, engine.connect() as writer:
+        def write(rows):
+            with writer.begin():
+                _unlock(writer, rows)
+
+        n = backfill(reader, ids, batch, progress, write)
+    with engine.begin() as conn:
+        mark_backfilled(conn, ids)
+    return n
+
+
+class BackfillJob:
+    """Runs run_backfill() in a background thread and reports its progress.
+
+    Started by an admin (POST /admin/badges/backfill) for any rules; new rules
+    are backfilled once per deploy with `manage.py backfill-badges`, not by
+    every worker at startup. Finished rules are recorded under BACKFILLED_KEY
+    in settings.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self.runs = 0
+        self.rules = []
+        self.progress = {}  # source -> (rows done, rows total)
+        self.unlocks = 0
+        self.started_at = None
+        self.seconds = 0.0
+        self.error = None
+
+    def _progress(self, source: str, done: int, total: int | None):
+        self.progress[source] = (done, total)
+        self.seconds = time.perf_counter() - self._t0
+
+    def pending(self) -> list:
+        with SessionLocal() as db:
+            return pending_rules(db)
+
+    def run(self, badge_ids=None) -> int:
+        """Backfill `badge_ids`, or every rule not backfilled yet when None"""
+        rules = list(badge_ids) if badge_ids else self.pending()
+        if not rules:
+            return 0
+        self.rules, self.progress, self.unlocks, self.error = rules, {}, 0, None
+        self.started_at, self._t0 = datetime.utcnow(), time.perf_counter()
+        self.unlocks = run_backfill(default_engine, rules, progress=self._progress)
+        self.runs += 1
+        self.seconds = time.perf_counter() - self._t0
+        return self.unlocks
+
+    def _run(self, badge_ids):
+        try:
+            self.run(badge_ids)
+        except Exception as e:
+            self.error = str(e)
+            print(f"⚠️ badge backfill failed: {e}")
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, badge_ids=None) -> bool:
+        """False when a run is already in progress"""
+        if self.running():
+            return False
+        self._thread = threading.Thread(target=self._run, args=(badge_ids,), name="badge-backfill", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "rules": self.rules,
+            "running": self.running(),
+            "runs": self.runs,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "progress": {src: {"done": d, "total": t} for src, (d, t) in self.progress.items()},
+            "unlocks": self.unlocks,
+            "seconds": round(self.seconds, 3),
+            "error": self.error,
+        }
+
+
+backfill_job = BackfillJob()
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Small thread-safe LRU cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# First page of comments keyed by lesson id: (lessons.comment_count when read, has more, items)
+comment_page_cache = TTLCache(
+    maxsize=int(os.getenv("COMMENT_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("COMMENT_CACHE_TTL", "300")),
+)
+
+# Token subject (email) -> user id, so authenticating skips the user lookup. Only the
+# identity is cached; every other column is loaded fresh when a handler reads it.
+# invalidate() is local to the worker: other workers may still resolve a deleted user
+# or an old email for up to PRINCIPAL_CACHE_TTL seconds.
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60")),
+)
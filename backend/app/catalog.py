@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models, schemas
+from .database import SessionLocal
+
+# How often a worker re-reads the shared catalog version from the settings table
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "5"))
+VERSION_KEY = "catalog_version"
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class CatalogSnapshot:
+    """Pre-serialized course catalog: list body + one detail body per course"""
+
+    def __init__(self, version: str, courses: list, details: dict):
+        self.version = version
+        self.courses = courses  # newest first, used for cursor slices
+        self.list_body = json.dumps(courses, ensure_ascii=False).encode()
+        self.list_etag = _etag(self.list_body)
+        self.details = {}
+        self.lesson_ids = {}
+        for cid, detail in details.items():
+            self.lesson_ids[cid] = [l["id"] for ch in detail["chapters"] for l in ch["lessons"]]
+            body = json.dumps(detail, ensure_ascii=False).encode()
+            self.details[cid] = (body, _etag(body))
+
+
+class Catalog:
+    """In-process course catalog (courses -> chapters -> lessons).
+
+    Rebuilt from one joined query when the catalog version changes. Writers call
+    bump(), which writes a new version token to `settings`, so every worker
+    notices within CATALOG_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    # --- invalidation ---
+    def bump(self, db: Session):
+        # a random token instead of an increment, so concurrent bumps never collide
+        db.merge(models.Setting(key=VERSION_KEY, value=uuid.uuid4().hex[:16]))
+        db.commit()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    # --- reads ---
+    def _db_version(self, db: Session) -> str:
+        s = db.get(models.Setting, VERSION_KEY, populate_existing=True)
+        return s.value if s else "0"
+
+    def fresh(self):
+        """Snapshot if it was validated recently, else None (no DB access)"""
+        snap = self._snapshot
+        if snap is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snap
+        return None
+
+    def snapshot(self, db: Session | None = None) -> CatalogSnapshot:
+        snap = self.fresh()
+        if snap is not None:
+            return snap
+        if db is None:
+            with SessionLocal() as own:
+                return self.snapshot(own)
+        with self._lock:
+            version = self._db_version(db)
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._build(db, version)
+                self.builds += 1
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    async def snapshot_async(self) -> CatalogSnapshot:
+        # Fast path never touches the DB; rebuilds run in the threadpool with their own session
+        return self.fresh() or await run_in_threadpool(self.snapshot)
+
+    def _build(self, db: Session, version: str) -> CatalogSnapshot:
+        C, Ch, L = models.Course, models.Chapter, models.Lesson
+        rows = db.execute(
+            select(C, Ch.id, Ch.title, Ch.order, L.id, L.title, L.youtube_id, L.duration, L.order, L.doc_url)
+            .outerjoin(Ch, Ch.course_id == C.id)
+            .outerjoin(L, L.chapter_id == Ch.id)
+            .order_by(C.id.desc(), Ch.order, Ch.id, L.order, L.id)
+        ).all()
+
+        details = {}
+        for c, ch_id, ch_title, ch_order, l_id, l_title, yt, dur, l_order, doc in rows:
+            d = details.get(c.id)
+            if d is None:
+                d = details[c.id] = {"course": c, "chapters": {}}
+            if ch_id is None:
+                continue
+            ch = d["chapters"].setdefault(ch_id, {"id": ch_id, "course_id": c.id, "title": ch_title, "order": ch_order, "lessons": []})
+            if l_id is not None:
+                ch["lessons"].append({
+                    "id": l_id, "chapter_id": ch_id, "title": l_title, "youtube_id": yt,
+                    "duration": dur or 0, "order": l_order, "doc_url": doc,
+                })
+
+        courses, out = [], {}
+        for cid, d in details.items():
+            chapters = list(d["chapters"].values())
+            lessons = [l for ch in chapters for l in ch["lessons"]]
+            summary = schemas.CourseRead.model_validate(d["course"]).model_copy(update={
+                "total_lessons": len(lessons),
+                "total_duration": sum(l["duration"] for l in lessons),
+            }).model_dump(mode="json")
+            courses.append(summary)
+            out[cid] = {**summary, "chapters": chapters}
+        return CatalogSnapshot(version, courses, out)
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "version": snap.version if snap else None,
+            "courses": len(snap.details) if snap else 0,
+            "builds": self.builds,
+        }
+
+
+catalog = Catalog()
@@ -1,9 +1,16 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, asc, desc, func
+from sqlalchemy.orm import Session, joinedload, aliased
+from sqlalchemy import or_, and_, asc, desc, func, select, insert, update, delete, bindparam
 from typing import Optional, Tuple, List, Dict, Any
-from . import models, schemas 
+from . import models, schemas, pagination, search, badges
+from .cache import comment_page_cache
+from .presence import presence
+from .events import presence_hub
+from .progress_buffer import progress_buffer, upsert_progress
+from .catalog import catalog, VERSION_KEY as CATALOG_VERSION_KEY
+from .leaderboard import leaderboard
+from .database import dialect_insert
 import json
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 
 # ==========================================
 #  HELPER FUNCTIONS (Audit & Utils)
@@ -87,12 +94,22 @@ def create_user(db: Session, email: str, hashed_password: str, full_name: str |
         dek_code=dek_code
     )
     db.add(user)
+    db.flush()
+    badges.on_event(db, user.id, "signup")
     db.commit()
     db.refresh(user)
     add_audit(db, "create_user", None, user.id, None, user)
     return user
 
-def admin_list_users(db: Session, q: Optional[str], page: int, page_size: int, sort: str, role: Optional[str], active: Optional[bool], grade: Optional[str], online_status: Optional[str]):
+def record_login(db: Session, user: models.User, new_hash: str | None = None):
+    user.last_login = datetime.utcnow()
+    # Transparent rehash when the stored hash uses outdated parameters
+    if new_hash:
+        user.hashed_password = new_hash
+    db.commit()
+    presence.touch(user.id)
+
+def admin_list_users(db: Session, q: Optional[str], page: int, page_size: int, sort: str, role: Optional[str], active: Optional[bool], grade: Optional[str], online_status: Optional[str], cursor: Optional[str] = None, total_mode: str = "exact"):
     qs = db.query(models.User)
     
     if q:
@@ -105,8 +122,11 @@ def admin_list_users(db: Session, q: Optional[str], page: int, page_size: int, s
     if grade and grade != "all":
         qs = qs.filter(models.User.grade_level == grade)
 
+    # Online state is the last_login window the presence registry writes back. `db` may be a
+    # read replica, so nothing is flushed here: a user is listed up to PRESENCE_FLUSH_INTERVAL
+    # after their activity (the live counts on the dashboard come from the registry itself)
     if online_status and online_status != "all":
-        limit_time = datetime.utcnow() - timedelta(minutes=5)
+        limit_time = datetime.utcnow() - presence.window
         if online_status == "online":
             qs = qs.filter(models.User.last_login >= limit_time)
         elif online_status == "offline":
@@ -115,12 +135,17 @@ def admin_list_users(db: Session, q: Optional[str], page: int, page_size: int, s
             qs = qs.filter(models.User.last_login >= limit_time, models.User.current_activity != None)
 
     col = models.User.id
-    if sort == "id:desc": qs = qs.order_by(desc(col))
-    else: qs = qs.order_by(asc(col))
+    descending = sort == "id:desc"
+    total, estimate = pagination.count_total(db, qs, total_mode)
 
-    total = qs.count()
-    items = qs.offset((page - 1) * page_size).limit(page_size).all()
-    return items, total
+    # Keyset paging from page 1 / a cursor; legacy OFFSET only for explicit page numbers
+    if cursor or page <= 1:
+        rows = pagination.keyset(qs, col, cursor, page_size, descending=descending).all()
+        items, next_cursor = pagination.page(rows, page_size)
+    else:
+        qs = qs.order_by(desc(col) if descending else asc(col))
+        items, next_cursor = qs.offset((page - 1) * page_size).limit(page_size).all(), None
+    return items, total, estimate, next_cursor
 
 def admin_update_user(db: Session, user: models.User, payload: schemas.AdminUserUpdate):
     old_snapshot = _serialize(user)
@@ -133,6 +158,7 @@ def admin_update_user(db: Session, user: models.User, payload: schemas.AdminUser
     
     db.commit()
     db.refresh(user)
+    leaderboard.set_profile(user.id, user.grade_level, user.dek_code)
     add_audit(db, "update_user", None, user.id, old_snapshot, user)
     return user
 
@@ -157,9 +183,12 @@ def create_course(db: Session, p: schemas.CourseCreate):
         highlights=p.highlights
     )
     db.add(c)
+    db.flush()
+    search.index_course(db, c)
     db.commit()
     db.refresh(c)
     add_audit(db, "create_course", None, c.id, None, c)
+    catalog.bump(db)
     return c
 
 def update_course(db: Session, course_id: int, p: schemas.CourseUpdate):
@@ -175,9 +204,11 @@ def update_course(db: Session, course_id: int, p: schemas.CourseUpdate):
     if p.target_audience is not None: c.target_audience = p.target_audience
     if p.highlights is not None: c.highlights = p.highlights
     
+    search.index_course(db, c)
     db.commit()
     db.refresh(c)
     add_audit(db, "update_course", None, c.id, old_snapshot, c)
+    catalog.bump(db)
     return c
 
 def delete_course(db: Session, course_id: int):
@@ -185,14 +216,18 @@ def delete_course(db: Session, course_id: int):
     if c:
         old_snapshot = _serialize(c)
         db.delete(c)
+        search.remove_course(db, course_id)
         db.commit()
         add_audit(db, "delete_course", None, course_id, old_snapshot, None)
+        catalog.bump(db)
+        leaderboard.drop_course(course_id)
         return True
     return False
 
 def create_chapter(db: Session, course_id: int, p: schemas.ChapterCreate):
     c = models.Chapter(course_id=course_id, title=p.title, order=p.order)
     db.add(c); db.commit(); db.refresh(c);
+    catalog.bump(db)
     return c
 
 def create_lesson(db: Session, chapter_id: int, p: schemas.LessonCreate):
@@ -200,7 +235,10 @@ def create_lesson(db: Session, chapter_id: int, p: schemas.LessonCreate):
         chapter_id=chapter_id, title=p.title, youtube_id=p.youtube_id, 
         doc_url=p.doc_url, duration=p.duration, order=p.order
     )
-    db.add(l); db.commit(); db.refresh(l);
+    db.add(l); db.flush()
+    search.index_lesson(db, l)
+    db.commit(); db.refresh(l)
+    catalog.bump(db)
     return l
 
 def update_lesson(db: Session, lesson_id: int, p: schemas.LessonUpdate):
@@ -211,15 +249,32 @@ def update_lesson(db: Session, lesson_id: int, p: schemas.LessonUpdate):
         if p.doc_url is not None: l.doc_url = p.doc_url
         if p.duration is not None: l.duration = p.duration
         if p.order is not None: l.order = p.order
+        search.index_lesson(db, l)
         db.commit()
+        catalog.bump(db)
         db.refresh(l)
     return l
 
 def delete_lesson(db: Session, lesson_id: int):
     l = db.query(models.Lesson).get(lesson_id)
     if l:
+        # everyone who had completed it loses one completed lesson in that course;
+        # the course leaderboard picks this up on its next refresh
+        completed_by = select(models.Progress.user_id).where(models.Progress.lesson_id == lesson_id, models.Progress.completed == True)
+        course_id = _lesson_course_id(db, lesson_id)
+        _add_completed(db, course_id, completed_by, -1)
+        # its ratings leave the course totals with it
+        if course_id is not None and l.rating_count:
+            C = models.Course
+            db.execute(
+                update(C).where(C.id == course_id)
+                .values(rating_sum=C.rating_sum - l.rating_sum, rating_count=C.rating_count - l.rating_count)
+            )
+        db.execute(delete(models.Rating).where(models.Rating.lesson_id == lesson_id))
         db.delete(l)
+        search.remove_lesson(db, l.id)
         db.commit()
+        catalog.bump(db)
         return True
     return False
 
@@ -241,8 +296,9 @@ def get_exam(db: Session, exam_id: int):
         joinedload(models.Exam.questions).joinedload(models.Question.choices)
     ).filter(models.Exam.id == exam_id).first()
 
-def list_exams(db: Session):
-    return db.query(models.Exam).all()
+def list_exams(db: Session, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_LIMIT):
+    rows = pagination.keyset(db.query(models.Exam), models.Exam.id, cursor, limit, descending=False).all()
+    return pagination.page(rows, limit)
 
 def add_question(db: Session, exam_id: int, p: schemas.QuestionCreate):
     q = models.Question(
@@ -309,8 +365,9 @@ def create_coupon(db: Session, p: schemas.CouponCreate):
     add_audit(db, "create_coupon", None, c.id, None, c)
     return c
 
-def list_coupons(db: Session):
-    return db.query(models.Coupon).order_by(desc(models.Coupon.created_at)).all()
+def list_coupons(db: Session, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_LIMIT):
+    rows = pagination.keyset(db.query(models.Coupon), models.Coupon.id, cursor, limit).all()
+    return pagination.page(rows, limit)
 
 def delete_coupon(db: Session, cid: int):
     c = db.query(models.Coupon).get(cid)
@@ -329,79 +386,302 @@ def get_coupons(db: Session, skip: int = 0, limit: int = 100):
 #  INTERACTION (Comments, Ratings, Progress)
 # ==========================================
 
-def get_lesson_comments(db: Session, lesson_id: int):
-    # Use joinedload to fetch user details with comments
-    return db.query(models.Comment).options(joinedload(models.Comment.user)).filter(models.Comment.lesson_id == lesson_id).order_by(desc(models.Comment.created_at)).all()
+# First pages up to this size are served from comment_page_cache
+COMMENT_HOT_PAGE = pagination.DEFAULT_LIMIT
+
+def comment_page_stmt(lesson_id: int, cursor: str | None, limit: int):
+    """Newest first, with only the author fields the comment list shows"""
+    C, U = models.Comment, models.User
+    stmt = (
+        select(C.id, C.user_id, C.text, C.created_at, U.full_name)
+        .outerjoin(U, U.id == C.user_id)
+        .where(C.lesson_id == lesson_id)
+    )
+    return pagination.keyset(stmt, C.id, cursor, limit, sort_col=C.created_at)
+
+def comment_items(rows) -> list:
+    return [
+        schemas.CommentRead(
+            id=cid, user_id=uid, text=text, created_at=at,
+            user=schemas.CommentAuthor(id=uid, full_name=name) if uid is not None else None,
+        )
+        for cid, uid, text, at, name in rows
+    ]
+
+def comment_first_page(lesson_id: int, count: int, rows=None, limit: int = COMMENT_HOT_PAGE):
+    """(newest comments, next cursor) from comment_page_cache; None on a miss.
+
+    Entries are tagged with the lessons.comment_count they were read at and
+    ignored once the count has moved on. After a miss the caller runs
+    comment_page_stmt(lesson_id, None, COMMENT_HOT_PAGE) and passes the rows
+    back in, which fills the cache.
+    """
+    if rows is None:
+        hit = comment_page_cache.get(lesson_id)
+        if hit is None or hit[0] != count:
+            return None
+    else:
+        hit = (count, len(rows) > COMMENT_HOT_PAGE, comment_items(rows[:COMMENT_HOT_PAGE]))
+        comment_page_cache.set(lesson_id, hit)
+    _, more, items = hit
+    page = items[:limit]
+    next_cursor = pagination.encode_cursor([page[-1].created_at, page[-1].id]) if page and (more or len(items) > limit) else None
+    return page, next_cursor
+
+def get_lesson_comments(db: Session, lesson_id: int, cursor: str | None = None, limit: int = pagination.DEFAULT_LIMIT):
+    """One page of comments and the next cursor (uncached; see crud_async for the API path)"""
+    rows = db.execute(comment_page_stmt(lesson_id, cursor, limit)).all()
+    rows, next_cursor = pagination.page(rows, limit, sort_attr="created_at")
+    return comment_items(rows), next_cursor
 
 def create_comment(db: Session, user_id: int, lesson_id: int, text: str):
     c = models.Comment(user_id=user_id, lesson_id=lesson_id, text=text, created_at=datetime.utcnow())
     db.add(c)
+    db.execute(
+        update(models.Lesson).where(models.Lesson.id == lesson_id)
+        .values(comment_count=models.Lesson.comment_count + 1)
+    )
     db.commit()
     db.refresh(c) # Refresh to get ID and CreatedAt
+    # other workers notice the new comment_count instead
+    comment_page_cache.invalidate(lesson_id)
     return c
 
+def _rating_avg(total, count) -> float:
+    return round(total / count, 2) if count else 0.0
+
 def set_lesson_rating(db: Session, user_id: int, lesson_id: int, score: int):
-    r = db.query(models.LessonRating).filter_by(user_id=user_id, lesson_id=lesson_id).first()
-    if r:
-        r.score = score
-    else:
-        r = models.LessonRating(user_id=user_id, lesson_id=lesson_id, score=score)
-        db.add(r)
+    """Store the user's score and shift the lesson and course sum/count by the difference.
+
+    A placeholder upsert (score NULL for a new row, unchanged otherwise) locks
+    the (user, lesson) row and returns the previous score, so concurrent
+    re-rates by one user are applied one after the other. Returns the
+    lesson's new {"avg", "count", "my"}, or None for an unknown lesson.
+    """
+    R, L, C = models.Rating, models.Lesson, models.Course
+    found = db.execute(
+        select(L.id, models.Chapter.course_id).outerjoin(models.Chapter, models.Chapter.id == L.chapter_id).where(L.id == lesson_id)
+    ).first()
+    if found is None:
+        return None
+    course_id = found.course_id
+    stmt = dialect_insert(db)(R).values(user_id=user_id, lesson_id=lesson_id, score=None)
+    old = db.execute(
+        stmt.on_conflict_do_update(index_elements=["user_id", "lesson_id"], set_={"score": R.score}).returning(R.score)
+    ).scalar()
+    db.execute(update(R).where(R.user_id == user_id, R.lesson_id == lesson_id).values(score=score))
+    d_sum, d_count = score - (old or 0), 0 if old is not None else 1
+    total, count = db.execute(
+        update(L).where(L.id == lesson_id)
+        .values(rating_sum=L.rating_sum + d_sum, rating_count=L.rating_count + d_count)
+        .returning(L.rating_sum, L.rating_count)
+    ).one()
+    if course_id is not None and (d_sum or d_count):
+        db.execute(
+            update(C).where(C.id == course_id)
+            .values(rating_sum=C.rating_sum + d_sum, rating_count=C.rating_count + d_count)
+        )
     db.commit()
-    db.refresh(r)
-    return r
+    return {"avg": _rating_avg(total, count), "count": count, "my": score}
+
+def get_lesson_rating(db: Session, user_id: int, lesson_id: int) -> dict:
+    R, L = models.Rating, models.Lesson
+    row = db.execute(
+        select(L.rating_sum, L.rating_count, R.score)
+        .outerjoin(R, and_(R.lesson_id == L.id, R.user_id == user_id))
+        .where(L.id == lesson_id)
+    ).first()
+    total, count, my = row or (0, 0, None)
+    return {"avg": _rating_avg(total, count), "count": count, "my": my or 0}
+
+def _course_rating_rows(db: Session, user_id: int, course_id: int) -> list:
+    """(course sum, course count, lesson id, lesson sum, lesson count, my score, lesson comment count) per lesson"""
+    R, L, Ch, C = models.Rating, models.Lesson, models.Chapter, models.Course
+    return db.execute(
+        select(C.rating_sum, C.rating_count, L.id, L.rating_sum, L.rating_count, R.score, L.comment_count)
+        .outerjoin(Ch, Ch.course_id == C.id)
+        .outerjoin(L, L.chapter_id == Ch.id)
+        .outerjoin(R, and_(R.lesson_id == L.id, R.user_id == user_id))
+        .where(C.id == course_id)
+        .order_by(Ch.order, L.order, L.id)
+    ).all()
+
+def _course_ratings(course_id: int, rows: list) -> dict:
+    total, count = rows[0][:2] if rows else (0, 0)
+    return {
+        "course_id": course_id,
+        "avg": _rating_avg(total, count),
+        "count": count,
+        "lessons": [
+            {"lesson_id": lid, "avg": _rating_avg(total, count), "count": count, "my": my or 0}
+            for _, _, lid, total, count, my, _ in rows if lid is not None
+        ],
+    }
+
+def get_course_ratings(db: Session, user_id: int, course_id: int):
+    """Every lesson's average and count plus the user's own scores, in one query"""
+    rows = _course_rating_rows(db, user_id, course_id)
+    return _course_ratings(course_id, rows) if rows else None
+
+# ==========================================
+#  LEARNING ROOM
+# ==========================================
+# Queries get_learning_room may run once the principal and catalog are cached:
+# the user's course progress, course ratings with comment counts, and the
+# first comment page when it is not cached (tools/check_room_queries.py)
+ROOM_QUERY_BUDGET = 3
+
+def get_learning_room(db: Session, user_id: int, course_id: int, lesson_id: int | None = None):
+    """What the learning room needs to open a lesson, within ROOM_QUERY_BUDGET queries.
+
+    Returns (pre-serialized course detail, schemas.LearningRoomState), or None when the course
+    or lesson is not in the catalog. Without lesson_id the room opens at the
+    first lesson not completed yet.
+    """
+    snap = catalog.snapshot(db)
+    detail = snap.details.get(course_id)
+    lesson_ids = snap.lesson_ids.get(course_id, [])
+    if detail is None or (lesson_id is not None and lesson_id not in lesson_ids):
+        return None
+
+    P = models.Progress
+    progress = db.execute(
+        select(P.lesson_id, P.completed, P.seconds_watched).where(P.user_id == user_id, P.lesson_id.in_(lesson_ids))
+    ).all() if lesson_ids else []
+    completed = [lid for lid, done, _ in progress if done]
+    if lesson_id is None and lesson_ids:
+        done = set(completed)
+        lesson_id = next((lid for lid in lesson_ids if lid not in done), lesson_ids[0])
+    seconds = progress_buffer.get(user_id, lesson_id)
+    if seconds is None:
+        seconds = next((s or 0 for lid, _, s in progress if lid == lesson_id), 0)
+
+    rows = _course_rating_rows(db, user_id, course_id)
+    # a course without lessons comes back as one outer-joined row with lesson and count NULL
+    count = next((n for _, _, lid, _, _, _, n in rows if lid == lesson_id), 0) or 0
+    comments, next_cursor = [], None
+    if count:
+        comments, next_cursor = comment_first_page(lesson_id, count) or comment_first_page(
+            lesson_id, count, db.execute(comment_page_stmt(lesson_id, None, COMMENT_HOT_PAGE)).all()
+        )
+    return detail[0], schemas.LearningRoomState(
+        lesson_id=lesson_id,
+        completed_ids=completed,
+        seconds=seconds,
+        comment_count=count,
+        comments=comments,
+        comments_next_cursor=next_cursor,
+        ratings=_course_ratings(course_id, rows),
+    )
 
-def get_lesson_rating_avg(db: Session, lesson_id: int):
-    # แก้จาก models.LessonRating เป็น models.Rating
-    res = db.query(func.avg(models.Rating.score)).filter(models.Rating.lesson_id == lesson_id).scalar()
-    return res or 0.00
+def _lesson_course_id(db, lesson_id: int):
+    return db.scalar(
+        select(models.Chapter.course_id)
+        .join(models.Lesson, models.Lesson.chapter_id == models.Chapter.id)
+        .where(models.Lesson.id == lesson_id)
+    )
 
-def get_user_lesson_rating(db: Session, user_id: int, lesson_id: int):
-    # แก้จาก models.LessonRating เป็น models.Rating
-    r = db.query(models.Rating).filter(models.Rating.user_id == user_id, models.Rating.lesson_id == lesson_id).first()
-    return r.score if r else 0
+def _add_completed(db, course_id, user_ids, delta: int):
+    """Shift enrollments.completed_lessons for these users (an id or a subquery) in one course.
+
+    For a single user id the new count is returned (None when not enrolled).
+    """
+    if course_id is None:
+        return None
+    E = models.Enrollment
+    stmt = update(E).values(completed_lessons=E.completed_lessons + delta)
+    if isinstance(user_ids, int):
+        return db.execute(stmt.where(E.course_id == course_id, E.user_id == user_ids).returning(E.completed_lessons)).scalar()
+    db.execute(stmt.where(E.course_id == course_id, E.user_id.in_(user_ids)))
+    return None
 
 def toggle_lesson_progress(db: Session, user_id: int, lesson_id: int):
-    p = db.query(models.LessonProgress).filter_by(user_id=user_id, lesson_id=lesson_id).first()
-    if p:
-        if p.completed_at: p.completed_at = None
-        else: p.completed_at = datetime.utcnow()
-    else:
-        p = models.LessonProgress(user_id=user_id, lesson_id=lesson_id, completed_at=datetime.utcnow())
-        db.add(p)
+    # a new row starts completed; an existing one flips
+    completed = upsert_progress(
+        db,
+        [{"user_id": user_id, "lesson_id": lesson_id, "completed": True, "seconds_watched": 0, "last_updated": datetime.utcnow()}],
+        ("last_updated",),
+        overrides={"completed": ~models.Progress.completed},
+        returning=models.Progress.completed,
+    )
+    course_id = _lesson_course_id(db, lesson_id)
+    count = _add_completed(db, course_id, user_id, 1 if completed else -1)
+    if completed:
+        badges.on_event(db, user_id, "progress")
     db.commit()
-    return True
+    if count is not None:
+        leaderboard.set_completed(user_id, course_id, count)
+    return bool(completed)
 
 def update_lesson_progress_time(db: Session, user_id: int, lesson_id: int, seconds: int):
-    p = db.query(models.LessonProgress).filter_by(user_id=user_id, lesson_id=lesson_id).first()
-    if p:
-        p.last_watched_second = seconds
-    else:
-        p = models.LessonProgress(user_id=user_id, lesson_id=lesson_id, last_watched_second=seconds)
-        db.add(p)
+    # Unbuffered write; the heartbeat endpoint goes through progress_buffer instead
+    upsert_progress(
+        db,
+        [{"user_id": user_id, "lesson_id": lesson_id, "completed": False, "seconds_watched": seconds, "last_updated": datetime.utcnow()}],
+        ("seconds_watched", "last_updated"),
+    )
     db.commit()
 
 def get_lesson_progress_time(db: Session, user_id: int, lesson_id: int):
-    p = db.query(models.LessonProgress).filter_by(user_id=user_id, lesson_id=lesson_id).first()
-    return p.last_watched_second if p else 0
+    seconds = progress_buffer.get(user_id, lesson_id)
+    if seconds is not None:
+        return seconds
+    p = db.query(models.Progress.seconds_watched).filter_by(user_id=user_id, lesson_id=lesson_id).first()
+    return (p[0] or 0) if p else 0
 
 def get_user_progress_in_course(db: Session, user_id: int, course_id: int):
-    return db.query(models.Progress.lesson_id).join(models.Lesson).join(models.Chapter).filter(
+    # The course's lesson ids come from the catalog snapshot: one indexed progress lookup, no joins
+    lesson_ids = catalog.snapshot(db).lesson_ids.get(course_id)
+    if not lesson_ids:
+        return []
+    return db.query(models.Progress.lesson_id).filter(
         models.Progress.user_id == user_id,
         models.Progress.completed == True,
-        models.Chapter.course_id == course_id
+        models.Progress.lesson_id.in_(lesson_ids)
     ).all()
 
+def check_completion_counters(conn, fix: bool = False, batch: int = 5000):
+    """Compare enrollments.completed_lessons with progress; returns (checked, mismatched).
+
+    With fix=True mismatched counters are rewritten in bulk. `conn` is a Session or a Connection.
+    """
+    E, P, L, Ch = models.Enrollment, models.Progress, models.Lesson, models.Chapter
+    res = conn.execute(
+        select(E.id, E.completed_lessons, func.count(func.distinct(P.lesson_id)))
+        .select_from(E)
+        .outerjoin(Ch, Ch.course_id == E.course_id)
+        .outerjoin(L, L.chapter_id == Ch.id)
+        .outerjoin(P, (P.lesson_id == L.id) & (P.user_id == E.user_id) & (P.completed == True))
+        .group_by(E.id, E.completed_lessons)
+        .execution_options(yield_per=batch)
+    )
+    table = E.__table__
+    fix_stmt = update(table).where(table.c.id == bindparam("eid")).values(completed_lessons=bindparam("n"))
+    checked = mismatched = 0
+    for part in res.partitions():
+        wrong = [{"eid": eid, "n": actual} for eid, stored, actual in part if stored != actual]
+        checked += len(part)
+        mismatched += len(wrong)
+        if fix and wrong:
+            conn.execute(fix_stmt, wrong)
+    return checked, mismatched
+
 # ==========================================
 #  STATS, PAYMENTS, SETTINGS, AUDIT, REPORTS
 # ==========================================
 
-def list_audit(db: Session, action, actor_id, target_id, d1, d2, page, page_size, sort):
-    qs = db.query(models.AuditLog).order_by(desc(models.AuditLog.created_at))
+def list_audit(db: Session, action, actor_id, target_id, d1, d2, page, page_size, sort, cursor=None, total_mode="exact"):
+    qs = db.query(models.AuditLog)
     if action: qs = qs.filter(models.AuditLog.action.ilike(f"%{action}%"))
-    total = qs.count()
-    items = qs.offset((page-1)*page_size).limit(page_size).all()
-    return items, total
+    total, estimate = pagination.count_total(db, qs, total_mode)
+    # ids are assigned in insert order, so id desc == newest first and keyset stays on the PK
+    if cursor or page <= 1:
+        rows = pagination.keyset(qs, models.AuditLog.id, cursor, page_size).all()
+        items, next_cursor = pagination.page(rows, page_size)
+    else:
+        qs = qs.order_by(desc(models.AuditLog.id))
+        items, next_cursor = qs.offset((page-1)*page_size).limit(page_size).all(), None
+    return items, total, estimate, next_cursor
 
 def get_payment_stats(db: Session):
     total_rev = db.query(func.sum(models.Payment.amount)).filter(models.Payment.status == "approved").scalar() or 0.0
@@ -410,10 +690,11 @@ def get_payment_stats(db: Session):
     recent = db.query(models.Payment).filter(models.Payment.status == "approved", models.Payment.created_at >= (datetime.utcnow() - timedelta(days=7))).all()
     return {"total_revenue": total_rev, "pending_count": pending, "top_courses": [{"title": t, "amount": a} for t, a in top], "recent_payments": recent}
 
-def get_payments(db: Session, status: str = None):
-    q = db.query(models.Payment).order_by(models.Payment.created_at.desc())
+def get_payments(db: Session, status: str = None, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_LIMIT):
+    q = db.query(models.Payment)
     if status: q = q.filter(models.Payment.status == status)
-    return q.all()
+    rows = pagination.keyset(q, models.Payment.id, cursor, limit, sort_col=models.Payment.created_at).all()
+    return pagination.page(rows, limit, sort_attr="created_at")
 
 def approve_payment(db: Session, payment_id: int, action: str):
     p = db.query(models.Payment).get(payment_id)
@@ -439,93 +720,312 @@ def get_enrollment(db: Session, user_id: int, course_id: int):
 
 def create_enrollment(db: Session, user_id: int, course_id: int):
     if get_enrollment(db, user_id, course_id): return None
-    e = models.Enrollment(user_id=user_id, course_id=course_id)
-    db.add(e); db.commit(); return e
+    # lessons completed before enrolling (free previews) count from the start
+    done = db.scalar(
+        select(func.count(func.distinct(models.Progress.lesson_id)))
+        .join(models.Lesson, models.Lesson.id == models.Progress.lesson_id)
+        .join(models.Chapter, models.Chapter.id == models.Lesson.chapter_id)
+        .where(models.Progress.user_id == user_id, models.Progress.completed == True, models.Chapter.course_id == course_id)
+    )
+    e = models.Enrollment(user_id=user_id, course_id=course_id, completed_lessons=done or 0)
+    db.add(e)
+    badges.on_event(db, user_id, "enrollment")
+    db.commit()
+    leaderboard.set_completed(user_id, course_id, e.completed_lessons)
+    return e
 
 def get_my_courses(db: Session, user_id: int):
-    return db.query(models.Enrollment).filter(models.Enrollment.user_id == user_id).all()
+    lesson_ids = catalog.snapshot(db).lesson_ids
+    out = []
+    for e in db.query(models.Enrollment).filter(models.Enrollment.user_id == user_id).all():
+        total = len(lesson_ids.get(e.course_id, ()))
+        done = min(e.completed_lessons or 0, total)
+        out.append({
+            "id": e.id, "course_id": e.course_id, "user_id": e.user_id, "enrolled_at": e.enrolled_at,
+            "completed_lessons": done, "total_lessons": total,
+            "percent_complete": round(done * 100 / total, 1) if total else 0.0,
+        })
+    return out
+
+# ==========================================
+#  FRIENDS
+#  Every friendship is two rows, (a, b) and (b, a), so "friends of X" is one
+#  range scan on ux_friends_user_friend and mutual friends are a self-join.
+# ==========================================
+# Friend-of-friend candidates considered before ranking by shared courses
+SUGGESTION_POOL = 200
 
 def add_friend(db: Session, user_id: int, friend_email: str):
     f = get_user_by_email(db, friend_email)
     if not f or f.id == user_id: return False
-    return True
-
-def get_friends(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id != user_id).limit(5).all()
-
-def get_leaderboard(db: Session, limit: int = 10):
-    # ✅ FIX: ใช้ models.Progress ให้ถูกต้อง (แก้ Error 500 Leaderboard)
-    return db.query(
-        models.User, 
-        func.count(models.Progress.lesson_id).label('score')
-    ).outerjoin(
-        models.Progress, 
-        (models.Progress.user_id == models.User.id) & (models.Progress.completed == True)
-    ).group_by(models.User.id).order_by(desc('score')).limit(limit).all()
+    now = datetime.utcnow()
+    stmt = dialect_insert(db)(models.Friend).on_conflict_do_nothing(index_elements=["user_id", "friend_id"])
+    db.execute(stmt, [
+        {"user_id": user_id, "friend_id": f.id, "created_at": now},
+        {"user_id": f.id, "friend_id": user_id, "created_at": now},
+    ])
+    db.commit()
+    presence_hub.friends_changed(user_id, f.id, True)
+    return f
+
+def remove_friend(db: Session, user_id: int, friend_id: int) -> bool:
+    F = models.Friend
+    res = db.execute(delete(F).where(or_(
+        and_(F.user_id == user_id, F.friend_id == friend_id),
+        and_(F.user_id == friend_id, F.friend_id == user_id),
+    )))
+    db.commit()
+    if res.rowcount:
+        presence_hub.friends_changed(user_id, friend_id, False)
+    return res.rowcount > 0
+
+def friend_ids(db: Session, user_id: int) -> list:
+    return list(db.scalars(select(models.Friend.friend_id).where(models.Friend.user_id == user_id)))
+
+def mutual_friend_counts(db: Session, user_id: int, other_ids: list) -> dict:
+    """other user id -> friends in common with user_id, one grouped query for the whole batch"""
+    if not other_ids:
+        return {}
+    F, G = models.Friend, aliased(models.Friend)
+    return dict(db.execute(
+        select(G.user_id, func.count())
+        .select_from(F).join(G, G.friend_id == F.friend_id)
+        .where(F.user_id == user_id, G.user_id.in_(other_ids))
+        .group_by(G.user_id)
+    ).all())
+
+def get_friends(db: Session, user_id: int, cursor: str | None = None, limit: int = pagination.DEFAULT_LIMIT):
+    """[(User, mutual friend count)] newest friendship first, plus the next cursor"""
+    F = models.Friend
+    stmt = select(F.id, models.User).join(models.User, models.User.id == F.friend_id).where(F.user_id == user_id)
+    rows, next_cursor = pagination.page(db.execute(pagination.keyset(stmt, F.id, cursor, limit)).all(), limit)
+    mutual = mutual_friend_counts(db, user_id, [u.id for _, u in rows])
+    return [(u, mutual.get(u.id, 0)) for _, u in rows], next_cursor
+
+def suggest_friends(db: Session, user_id: int, limit: int = 10):
+    """[(User, mutual friends, shared courses)] for people user_id may know.
+
+    Candidates are friends of friends (the SUGGESTION_POOL with most mutual
+    friends), or classmates when the user has no friends yet, ranked by
+    courses in common and then mutual friends. Three grouped queries whatever
+    the size of the friend list.
+    """
+    F, G, E = models.Friend, aliased(models.Friend), models.Enrollment
+    mine = select(F.friend_id).where(F.user_id == user_id)
+    my_courses = select(E.course_id).where(E.user_id == user_id)
+    shared_count = func.count(func.distinct(E.course_id))
+
+    mutual = dict(db.execute(
+        select(G.friend_id, func.count())
+        .where(G.user_id.in_(mine), G.friend_id != user_id, G.friend_id.not_in(mine))
+        .group_by(G.friend_id)
+        .order_by(func.count().desc(), G.friend_id)
+        .limit(SUGGESTION_POOL)
+    ).all())
+    if mutual:
+        shared = dict(db.execute(
+            select(E.user_id, shared_count)
+            .where(E.user_id.in_(list(mutual)), E.course_id.in_(my_courses))
+            .group_by(E.user_id)
+        ).all())
+    else:
+        shared = dict(db.execute(
+            select(E.user_id, shared_count)
+            .where(E.course_id.in_(my_courses), E.user_id != user_id)
+            .group_by(E.user_id)
+            .order_by(shared_count.desc(), E.user_id)
+            .limit(SUGGESTION_POOL)
+        ).all())
+
+    ranked = sorted(set(mutual) | set(shared), key=lambda uid: (-shared.get(uid, 0), -mutual.get(uid, 0), uid))[:limit]
+    users = {u.id: u for u in db.scalars(select(models.User).where(models.User.id.in_(ranked)))}
+    return [(users[uid], mutual.get(uid, 0), shared.get(uid, 0)) for uid in ranked if uid in users]
 
 def update_user_activity(db: Session, user_id: int, activity: str):
-    u = db.query(models.User).get(user_id)
-    if u:
-        u.current_activity = activity
-        u.last_login = datetime.utcnow()
-        db.commit()
-
-def record_study_time(db: Session, user_id: int, minutes: int):
-    today = datetime.utcnow().date()
-    log = db.query(models.StudyLog).filter_by(user_id=user_id, date=today).first()
-    if log: log.minutes += minutes
-    else: log = models.StudyLog(user_id=user_id, date=today, minutes=minutes); db.add(log)
-    u = db.query(models.User).get(user_id)
-    if u: u.total_minutes += minutes
+    # Written back to users.last_login / current_activity in batches by the presence flusher
+    presence.touch(user_id, activity)
+
+# Offline clients may replay old events; anything older than this is dropped
+STUDY_EVENT_MAX_AGE = timedelta(days=7)
+# An event this recent also sets the user's presence activity
+STUDY_EVENT_LIVE_WINDOW = timedelta(minutes=2)
+# Study days follow Thai local time, so an evening session lands on the right day
+STUDY_DAY_OFFSET = timedelta(hours=7)
+
+def study_day(at: datetime) -> date:
+    return (at + STUDY_DAY_OFFSET).date()
+
+def _upsert_study_daily(db, rows: list):
+    """rows: [{user_id, day, minutes, events}]; added onto existing (user_id, day) rows"""
+    if not rows:
+        return
+    stmt = dialect_insert(db)(models.StudyDaily)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={
+            "minutes": models.StudyDaily.minutes + stmt.excluded.minutes,
+            "events": models.StudyDaily.events + stmt.excluded.events,
+        },
+    )
+    db.execute(stmt, rows)
+
+def _study_days(db: Session, user_id: int, start: date, end: date) -> dict:
+    return dict(db.execute(
+        select(models.StudyDaily.day, models.StudyDaily.minutes)
+        .where(models.StudyDaily.user_id == user_id, models.StudyDaily.day.between(start, end))
+    ).all())
+
+def record_study_events(db: Session, user_id: int, events: List[schemas.StudyEvent]) -> dict:
+    """Apply a batch of study events in one transaction with a single total_minutes update.
+
+    Future timestamps are clamped to now. An event whose timestamp is already
+    logged for this user is a client retry and is ignored.
+    """
+    now = datetime.utcnow()
+    rows, stamped, skipped = [], set(), 0
+    for e in events:
+        at = e.at or now
+        if at.tzinfo is not None:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        at = min(at, now)
+        if at < now - STUDY_EVENT_MAX_AGE:
+            skipped += 1
+            continue
+        if e.at is not None:
+            if at in stamped:
+                continue
+            stamped.add(at)
+        rows.append({"user_id": user_id, "lesson_id": e.lesson_id, "minutes": e.minutes, "created_at": at, "activity": e.activity})
+
+    seen = set()
+    if stamped:
+        seen = set(db.scalars(
+            select(models.StudyLog.created_at)
+            .where(models.StudyLog.user_id == user_id, models.StudyLog.created_at.in_(stamped))
+        ))
+    fresh = [r for r in rows if r["created_at"] not in seen]
+    duplicates = len(events) - skipped - len(fresh)
+
+    if fresh:
+        db.execute(insert(models.StudyLog), [{k: v for k, v in r.items() if k != "activity"} for r in fresh])
+        days = {}
+        for r in fresh:
+            minutes, count = days.get(study_day(r["created_at"]), (0, 0))
+            days[study_day(r["created_at"])] = (minutes + r["minutes"], count + 1)
+        _upsert_study_daily(db, [
+            {"user_id": user_id, "day": d, "minutes": m, "events": n} for d, (m, n) in days.items()
+        ])
+        total, grade, dek = db.execute(
+            update(models.User).where(models.User.id == user_id)
+            .values(total_minutes=func.coalesce(models.User.total_minutes, 0) + sum(r["minutes"] for r in fresh))
+            .returning(models.User.total_minutes, models.User.grade_level, models.User.dek_code)
+        ).one()
+        today = study_day(now)
+        weekly = sum(_study_days(db, user_id, today - timedelta(days=6), today).values())
+        badges.on_event(db, user_id, "study", total_minutes=total, times=[r["created_at"] for r in fresh])
+    else:
+        total = db.scalar(select(models.User.total_minutes).where(models.User.id == user_id))
     db.commit()
+    if fresh:
+        leaderboard.set_minutes(user_id, total, grade, dek)
+        leaderboard.set_weekly(user_id, weekly)
 
-def get_weekly_study_stats(db: Session, user_id: int):
-    today = datetime.utcnow().date()
-    start_date = today - timedelta(days=6)
-    
-    # ✅ FIX: ใช้ created_at และแปลงเป็น Date
-    logs = db.query(
-        func.date(models.StudyLog.created_at).label("log_date"), 
-        func.sum(models.StudyLog.minutes).label("total_minutes")
-    ).filter(
-        models.StudyLog.user_id == user_id, 
-        models.StudyLog.created_at >= start_date
-    ).group_by(
-        func.date(models.StudyLog.created_at)
-    ).all()
+    latest = max(rows, key=lambda r: r["created_at"], default=None)
+    if latest and latest["created_at"] >= now - STUDY_EVENT_LIVE_WINDOW:
+        presence.touch(user_id, latest["activity"])
+    else:
+        presence.touch(user_id)
+    return {"accepted": len(fresh), "duplicates": duplicates, "skipped": skipped, "total_minutes": total or 0}
 
-    data_map = {str(log.log_date): log.total_minutes for log in logs}
+def record_study_time(db: Session, user_id: int, minutes: int, activity: str | None = None):
+    # legacy single-minute endpoint: keep accepting whatever it accepted before
+    return record_study_events(db, user_id, [schemas.StudyEvent.model_construct(minutes=minutes, at=None, lesson_id=None, activity=activity)])
+
+def get_weekly_study_stats(db: Session, user_id: int):
+    today = study_day(datetime.utcnow())
+    data_map = _study_days(db, user_id, today - timedelta(days=6), today)
     labels = []
     data = []
     
     for i in range(6, -1, -1):
         d = today - timedelta(days=i)
-        d_str = str(d)
         labels.append(d.strftime("%a")) 
-        data.append(data_map.get(d_str, 0))
+        data.append(data_map.get(d, 0))
         
     return {"labels": labels, "data": data}
 
+def get_monthly_study_stats(db: Session, user_id: int, months: int = 12):
+    today = study_day(datetime.utcnow())
+    y, m = today.year, today.month - (months - 1)
+    while m < 1:
+        y, m = y - 1, m + 12
+    totals = {}
+    for d, minutes in _study_days(db, user_id, date(y, m, 1), today).items():
+        key = d.strftime("%Y-%m")
+        totals[key] = totals.get(key, 0) + minutes
+    labels = []
+    for _ in range(months):
+        labels.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return {"labels": labels, "data": [totals.get(k, 0) for k in labels]}
+
+def get_study_heatmap(db: Session, user_id: int, days: int = 365):
+    """Sparse day -> minutes map for an activity calendar"""
+    today = study_day(datetime.utcnow())
+    start = today - timedelta(days=days - 1)
+    data = _study_days(db, user_id, start, today)
+    return {
+        "start": start.isoformat(),
+        "end": today.isoformat(),
+        "days": {d.isoformat(): v for d, v in sorted(data.items())},
+        "total_minutes": sum(data.values()),
+        "active_days": len(data),
+        "max_minutes": max(data.values(), default=0),
+    }
+
+def rebuild_study_daily(conn, batch: int = 10000) -> int:
+    """Recompute study_daily from study_logs, streaming the logs in batches.
+
+    Partial sums are flushed every `batch` distinct (user, day) keys; the upsert
+    adds them up, so memory stays bounded however large study_logs is.
+    `conn` is a Session or a Connection. Returns the number of logs read.
+    """
+    conn.execute(delete(models.StudyDaily))
+    L = models.StudyLog
+    res = conn.execute(
+        select(L.user_id, L.created_at, L.minutes)
+        .where(L.user_id != None, L.created_at != None)
+        .execution_options(yield_per=batch)
+    )
+    acc, n = {}, 0
+    for part in res.partitions():
+        for user_id, at, minutes in part:
+            key = (user_id, study_day(at))
+            m, c = acc.get(key, (0, 0))
+            acc[key] = (m + (minutes or 0), c + 1)
+        n += len(part)
+        if len(acc) >= batch:
+            _upsert_study_daily(conn, [{"user_id": u, "day": d, "minutes": m, "events": c} for (u, d), (m, c) in acc.items()])
+            acc = {}
+    _upsert_study_daily(conn, [{"user_id": u, "day": d, "minutes": m, "events": c} for (u, d), (m, c) in acc.items()])
+    return n
+
+
+# Bookkeeping rows the server keeps in settings: never served by GET /settings or written by the editor
+INTERNAL_SETTING_KEYS = frozenset({CATALOG_VERSION_KEY, badges.BACKFILLED_KEY})
 
 def get_all_settings(db: Session):
     #return {} # 👈 ลองแก้เป็นแบบนี้บรรทัดเดียว แล้วรีเฟรชหน้าเว็บดู
-    return {s.key: s.value for s in db.query(models.Setting).all()}
+    q = db.query(models.Setting).filter(models.Setting.key.notin_(INTERNAL_SETTING_KEYS))
+    return {s.key: s.value for s in q.all()}
 
 def get_setting(db: Session, key: str):
     s = db.query(models.Setting).filter(models.Setting.key == key).first()
     return s.value if s else None
 
 def set_setting(db: Session, key: str, value: str):
-    s = db.query(models.Setting).filter(models.Setting.key == key).first()
-    if s:
-        s.value = value
-    else:
-        s = models.Setting(key=key, value=value)
-        db.add(s)
-    db.commit()
-    return s
-
-def set_setting(db: Session, key: str, value: str):
+    if key in INTERNAL_SETTING_KEYS:
+        raise ValueError(f"{key} is managed by the server")
     s = db.query(models.Setting).filter(models.Setting.key == key).first()
     if s:
         s.value = value
@@ -560,10 +1060,11 @@ def update_settings(db: Session, p: schemas.SettingsUpdate):
     
     return get_all_settings(db)
 
-def get_all_reports(db, status=None): 
-    q = db.query(models.Report).order_by(models.Report.created_at.desc())
+def get_all_reports(db, status=None, cursor=None, limit=pagination.DEFAULT_LIMIT): 
+    q = db.query(models.Report)
     if status: q = q.filter(models.Report.status == status)
-    return q.all()
+    rows = pagination.keyset(q, models.Report.id, cursor, limit, sort_col=models.Report.created_at).all()
+    return pagination.page(rows, limit, sort_attr="created_at")
 def create_report(db, uid, p): 
     r = models.Report(user_id=uid, target_type=p.target_type, target_id=p.target_id, reason=p.reason); db.add(r); db.commit(); return r
 def update_report_status(db, rid, st): 
@@ -0,0 +1,54 @@
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, pagination
+from .crud import INTERNAL_SETTING_KEYS, COMMENT_HOT_PAGE, comment_first_page, comment_page_stmt, comment_items
+
+# ==========================================
+#  ASYNC READS (hot public endpoints)
+#  Mirrors of the crud.py functions with the same names; nothing here may
+#  rely on lazy loading because AsyncSession cannot lazy-load.
+# ==========================================
+
+async def get_leaderboard_users(db: AsyncSession, user_ids: list) -> dict:
+    """user_id -> (User, completed lessons over all enrollments) for the ids on a board page"""
+    if not user_ids:
+        return {}
+    done = (
+        select(models.Enrollment.user_id, func.sum(models.Enrollment.completed_lessons).label("done"))
+        .where(models.Enrollment.user_id.in_(user_ids))
+        .group_by(models.Enrollment.user_id)
+        .subquery()
+    )
+    res = await db.execute(
+        select(models.User, func.coalesce(done.c.done, 0))
+        .outerjoin(done, done.c.user_id == models.User.id)
+        .where(models.User.id.in_(user_ids))
+    )
+    return {u.id: (u, n) for u, n in res.all()}
+
+async def get_all_settings(db: AsyncSession):
+    res = await db.execute(
+        select(models.Setting.key, models.Setting.value).where(models.Setting.key.notin_(INTERNAL_SETTING_KEYS))
+    )
+    return {k: v for k, v in res.all()}
+
+async def get_lesson_comments(db: AsyncSession, lesson_id: int, cursor: str | None = None, limit: int = pagination.DEFAULT_LIMIT):
+    """(page of comments, next cursor, lesson comment count).
+
+    The first page of each lesson is cached together with the
+    lessons.comment_count it was read at; a cached page is used only while
+    the count still matches, so a comment posted on any worker is seen at
+    once for the price of one primary-key lookup.
+    """
+    count = await db.scalar(select(models.Lesson.comment_count).where(models.Lesson.id == lesson_id))
+    if not count:
+        return [], None, 0
+    if cursor is None and limit <= COMMENT_HOT_PAGE:
+        page = comment_first_page(lesson_id, count, limit=limit)
+        if page is None:
+            rows = (await db.execute(comment_page_stmt(lesson_id, None, COMMENT_HOT_PAGE))).all()
+            page = comment_first_page(lesson_id, count, rows, limit)
+        return (*page, count)
+    rows = (await db.execute(comment_page_stmt(lesson_id, cursor, limit))).all()
+    rows, next_cursor = pagination.page(rows, limit, sort_attr="created_at")
+    return comment_items(rows), next_cursor, count
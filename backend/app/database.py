@@ -1,22 +1,255 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
+from starlette.requests import Request
 import os
+import threading
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+# Optional read-only replica for heavy read endpoints (admin dashboards)
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+# After a client's own write its reads stay on the primary for this long
+READ_STICKY_SECONDS = float(os.getenv("READ_STICKY_SECONDS", "5"))
+# How long a failed replica is skipped before it is tried again
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
 
-# For SQLite, needed for multithreading in dev
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+# "production" applies the pool/pragma profile below, "default" keeps SQLAlchemy defaults
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))  # negative = KiB
+
+PG_STATEMENT_TIMEOUT = int(os.getenv("PG_STATEMENT_TIMEOUT", "30000"))  # ms, 0 = off
+PG_APPLICATION_NAME = os.getenv("PG_APPLICATION_NAME", "edtech-api")
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+def _sqlite_on_connect(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cur.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cur.close()
+
+def make_engine(url: str, profile: str = DB_PROFILE, **kwargs):
+    """Create an engine with the pool/pragma profile for the given URL"""
+    if url.startswith("sqlite"):
+        # For SQLite, needed for multithreading in dev
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+        if profile != "production" or _is_memory_sqlite(url):
+            return create_engine(url, **kwargs)
+        engine = create_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            **kwargs,
+        )
+        event.listen(engine, "connect", _sqlite_on_connect)
+        return engine
+
+    if profile != "production":
+        return create_engine(url, **kwargs)
+    connect_args = kwargs.pop("connect_args", {})
+    if url.startswith("postgresql"):
+        connect_args.setdefault("application_name", PG_APPLICATION_NAME)
+        connect_args.setdefault("keepalives", 1)
+        connect_args.setdefault("keepalives_idle", 30)
+        if PG_STATEMENT_TIMEOUT:
+            connect_args.setdefault("options", f"-c statement_timeout={PG_STATEMENT_TIMEOUT}")
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=True,  # idle connections past pool_size get recycled instead of kept warm
+        connect_args=connect_args,
+        **kwargs,
+    )
+
+
+def maintenance_engine(engine):
+    """The same database without PG_STATEMENT_TIMEOUT, for migrations and backfills.
+
+    CREATE INDEX CONCURRENTLY on a large table and pg_advisory_lock waits run
+    far longer than any request should; cancelling them leaves INVALID indexes
+    or aborts a worker's boot. Request engines keep the timeout, and NullPool
+    means no unbounded connection lingers in a pool afterwards.
+    """
+    if engine.dialect.name != "postgresql":
+        return engine
+    return create_engine(
+        engine.url,
+        poolclass=NullPool,
+        connect_args={"application_name": f"{PG_APPLICATION_NAME}-maintenance", "options": "-c statement_timeout=0"},
+    )
+
+
+def dialect_insert(bind):
+    """The dialect's insert() construct, which has on_conflict_do_update / do_nothing.
+
+    `bind` is an engine, a connection or a session.
+    """
+    if hasattr(bind, "get_bind"):
+        bind = bind.get_bind()
+    if bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+engine = make_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+read_engine = make_engine(READ_DATABASE_URL) if READ_DATABASE_URL else None
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if read_engine else None
+
+# --- read-your-writes stickiness ---
+# Keyed by the caller's Authorization header: a client that just wrote through
+# get_db reads from the primary until its window expires.
+_sticky = {}
+_sticky_lock = threading.Lock()
+_replica_down_until = 0.0
+
+def _client_key(request: Request | None):
+    return request.headers.get("authorization") if request is not None else None
+
+def mark_write(key):
+    if not key:
+        return
+    now = time.monotonic()
+    with _sticky_lock:
+        _sticky[key] = now + READ_STICKY_SECONDS
+        if len(_sticky) > 10000:
+            for k in [k for k, exp in _sticky.items() if exp <= now]:
+                del _sticky[k]
+
+def is_sticky(key) -> bool:
+    if not key:
+        return False
+    with _sticky_lock:
+        exp = _sticky.get(key)
+        return exp is not None and exp > time.monotonic()
+
+@event.listens_for(SessionLocal, "after_flush")
+def _note_write(session, _ctx):
+    session.info["wrote"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _mark_sticky(session):
+    if session.info.pop("wrote", False):
+        mark_write(session.info.get("client_key"))
+
 # Dependency
-def get_db():
+def get_db(request: Request = None):
     db = SessionLocal()
+    db.info["client_key"] = _client_key(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request = None):
+    """Session for read-only endpoints: replica when configured and healthy, else primary"""
+    global _replica_down_until
+    key = _client_key(request)
+    if ReadSessionLocal is None or is_sticky(key) or time.monotonic() < _replica_down_until:
+        yield from get_db(request)
+        return
+    db = ReadSessionLocal()
+    try:
+        # checking out the connection is enough: a fresh one connects, a pooled one is
+        # verified by pool_pre_ping, so a dead replica fails here without an extra query
+        db.connection()
+    except OperationalError as e:
+        db.close()
+        _replica_down_until = time.monotonic() + READ_REPLICA_RETRY_SECONDS
+        print(f"⚠️ read replica unavailable, using primary: {e}")
+        yield from get_db(request)
+        return
     try:
         yield db
     finally:
         db.close()
+
+
+# ==========================================
+#  ASYNC PATH (read-heavy endpoints)
+# ==========================================
+
+def async_url(url: str) -> str:
+    """Map a sync URL to its async driver: aiosqlite for SQLite, asyncpg for Postgres"""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme in ("postgres", "postgresql", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+def make_async_engine(url: str, profile: str = DB_PROFILE):
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    aurl = async_url(url)
+    if aurl.startswith("sqlite"):
+        if profile != "production" or _is_memory_sqlite(url):
+            return create_async_engine(aurl)
+        engine = create_async_engine(aurl, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        event.listen(engine.sync_engine, "connect", _sqlite_on_connect)
+        return engine
+    if profile != "production":
+        return create_async_engine(aurl)
+    server_settings = {"application_name": PG_APPLICATION_NAME}
+    if PG_STATEMENT_TIMEOUT:
+        server_settings["statement_timeout"] = str(PG_STATEMENT_TIMEOUT)
+    return create_async_engine(
+        aurl,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=True,
+        connect_args={"server_settings": server_settings} if aurl.startswith("postgresql+asyncpg") else {},
+    )
+
+# Created on first use so the async driver is only imported by processes that need it
+_async_lock = threading.Lock()
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_sessionmaker():
+    global _async_engine, _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        with _async_lock:
+            if _AsyncSessionLocal is None:
+                _async_engine = make_async_engine(DATABASE_URL)
+                _AsyncSessionLocal = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _AsyncSessionLocal
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+async def dispose_async_engine():
+    if _async_engine is not None:
+        await _async_engine.dispose()
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from .presence import presence
+
+# Seconds between keep-alive comments on an idle stream (proxies drop silent connections)
+HEARTBEAT_INTERVAL = float(os.getenv("EVENTS_HEARTBEAT_INTERVAL", "25"))
+# How often expired presence entries are swept so friends hear about users going offline
+SWEEP_INTERVAL = float(os.getenv("EVENTS_SWEEP_INTERVAL", "15"))
+# EventSource reconnect delay sent to clients, in milliseconds
+RETRY_MS = 5000
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscriber:
+    """One open stream: the friends it watches and the changes not sent yet.
+
+    Changes are coalesced per friend, so a slow client holds at most one
+    pending entry per friend no matter how often their presence flips.
+    """
+
+    __slots__ = ("user_id", "friends", "pending", "friend_changes", "wake", "closed")
+
+    def __init__(self, user_id: int, friends):
+        self.user_id = user_id
+        self.friends = set(friends)
+        self.pending = {}  # friend id -> {"id", "online", "activity"}
+        self.friend_changes = {}  # friend id -> added (True) / removed (False)
+        self.wake = asyncio.Event()
+        self.closed = False
+
+
+class PresenceHub:
+    """Pushes friends' presence changes to open event streams.
+
+    Every stream of a worker is registered here with its friend ids, indexed
+    by the friend it watches, so a presence change costs one dict lookup plus
+    one buffer write per watching stream. Changes reach the hub from the
+    presence registry (any thread) and are handed to the event loop with
+    call_soon_threadsafe; all subscriber state is only touched on the loop.
+
+    Users active on another worker arrive with that registry's periodic merge
+    (PRESENCE_FLUSH_INTERVAL), and friend-list changes made on another worker
+    reach a stream when it reconnects.
+    """
+
+    def __init__(self, heartbeat: float = HEARTBEAT_INTERVAL, sweep_interval: float = SWEEP_INTERVAL):
+        self.heartbeat = heartbeat
+        self.sweep_interval = sweep_interval
+        self._loop = None
+        self._watchers = {}  # watched user id -> {Subscriber}
+        self._streams = {}  # user id -> {Subscriber} (a user may have several tabs open)
+        self._stop = threading.Event()
+        self._thread = None
+        self.connections = 0
+        self.connects = 0
+        self.events = 0
+        self.changes = 0
+
+    # --- presence side (any thread) ---
+    def _on_presence(self, user_id: int, online: bool, activity):
+        loop = self._loop
+        # unsynchronised read: a miss only means nobody on this worker watches the user
+        if loop is not None and user_id in self._watchers:
+            try:
+                loop.call_soon_threadsafe(self._fanout, user_id, {"id": user_id, "online": online, "activity": activity})
+            except RuntimeError:
+                pass  # loop closed during shutdown
+
+    def friends_changed(self, user_id: int, friend_id: int, added: bool):
+        """Called after a friendship between the two users was stored or removed"""
+        loop = self._loop
+        if loop is not None and (user_id in self._streams or friend_id in self._streams):
+            try:
+                loop.call_soon_threadsafe(self._relink, user_id, friend_id, added)
+            except RuntimeError:
+                pass
+
+    # --- loop side ---
+    def _fanout(self, user_id: int, state: dict):
+        self.changes += 1
+        for sub in self._watchers.get(user_id, ()):
+            sub.pending[user_id] = state
+            sub.wake.set()
+
+    def _watch(self, sub: Subscriber, friend_id: int):
+        sub.friends.add(friend_id)
+        self._watchers.setdefault(friend_id, set()).add(sub)
+
+    def _unwatch(self, sub: Subscriber, friend_id: int):
+        sub.friends.discard(friend_id)
+        watching = self._watchers.get(friend_id)
+        if watching is not None:
+            watching.discard(sub)
+            if not watching:
+                del self._watchers[friend_id]
+
+    def _relink(self, user_id: int, friend_id: int, added: bool):
+        for a, b in ((user_id, friend_id), (friend_id, user_id)):
+            for sub in self._streams.get(a, ()):
+                (self._watch if added else self._unwatch)(sub, b)
+                sub.pending.pop(b, None)
+                sub.friend_changes[b] = added
+                sub.wake.set()
+
+    def connect(self, user_id: int, friend_ids) -> Subscriber:
+        """Register a stream; must be called on the event loop"""
+        self._loop = asyncio.get_running_loop()
+        sub = Subscriber(user_id, ())
+        for fid in friend_ids:
+            self._watch(sub, fid)
+        self._streams.setdefault(user_id, set()).add(sub)
+        self.connections += 1
+        self.connects += 1
+        return sub
+
+    def disconnect(self, sub: Subscriber):
+        for fid in list(sub.friends):
+            self._unwatch(sub, fid)
+        streams = self._streams.get(sub.user_id)
+        if streams is not None:
+            streams.discard(sub)
+            if not streams:
+                del self._streams[sub.user_id]
+        self.connections -= 1
+
+    def snapshot(self, sub: Subscriber) -> dict:
+        online = []
+        for fid in sub.friends:
+            if presence.is_online(fid):
+                online.append({"id": fid, "activity": presence.activity(fid)})
+        return {"online": online}
+
+    async def stream(self, user_id: int, friend_ids, until: float | None = None):
+        """Server-sent events for one connection until the client goes away, the hub
+        stops or `until` (unix time, the access token's expiry) passes.
+
+        event: snapshot  {"online": [{"id", "activity"}]}; friends not listed are offline
+        event: presence  [{"id", "online", "activity"}] changes since the last message
+        event: friends   [{"id", "added"}] friendships added or removed
+        event: expired   {} the credentials ran out; the stream ends after it
+        """
+        # registered on first iteration so a response that never starts cannot leak a subscriber
+        sub = self.connect(user_id, friend_ids)
+        try:
+            yield f"retry: {RETRY_MS}\n" + _sse("snapshot", self.snapshot(sub))
+            while not sub.closed:
+                wait = self.heartbeat if until is None else min(self.heartbeat, until - time.time())
+                if wait <= 0:
+                    yield _sse("expired", {})
+                    return
+                try:
+                    await asyncio.wait_for(sub.wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    if until is None or time.time() < until:
+                        yield ": ping\n\n"
+                    continue
+                sub.wake.clear()
+                out = []
+                if sub.friend_changes:
+                    changes, sub.friend_changes = sub.friend_changes, {}
+                    out.append(_sse("friends", [{"id": fid, "added": added} for fid, added in changes.items()]))
+                if sub.pending:
+                    pending, sub.pending = sub.pending, {}
+                    out.append(_sse("presence", list(pending.values())))
+                if out:
+                    self.events += len(out)
+                    yield "".join(out)
+        finally:
+            self.disconnect(sub)
+
+    def close_all(self):
+        """End every open stream (on the event loop); clients reconnect to another worker"""
+        for streams in list(self._streams.values()):
+            for sub in streams:
+                sub.closed = True
+                sub.wake.set()
+
+    # --- background sweep ---
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                presence.expire()
+            except Exception as e:
+                print(f"⚠️ presence sweep failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        presence.add_listener(self._on_presence)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="presence-sweep", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        presence.remove_listener(self._on_presence)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self.close_all)
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "connected_users": len(self._streams),
+            "watched_users": len(self._watchers),
+            "connects": self.connects,
+            "presence_changes": self.changes,
+            "events_sent": self.events,
+        }
+
+
+presence_hub = PresenceHub()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+# pbkdf2 cost; hashes stored with fewer rounds are upgraded on the next login
+HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+# 0 = no process pool, hash in Starlette's threadpool instead
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE", str(max(HASH_WORKERS, 1) * 8)))
+
+
+def make_context(rounds: int = HASH_ROUNDS):
+    from passlib.context import CryptContext  # deferred: only needed on first hash/verify
+
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+    )
+
+
+# --- functions executed inside the worker processes ---
+_contexts = {}
+
+def get_context(rounds: int = HASH_ROUNDS):
+    ctx = _contexts.get(rounds)
+    if ctx is None:
+        ctx = _contexts[rounds] = make_context(rounds)
+    return ctx
+
+def _hash(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(password)
+
+def _verify_and_update(password: str, hashed: str, rounds: int):
+    return get_context(rounds).verify_and_update(password, hashed)
+
+
+class HashPool:
+    """Process pool for password hashing with a bounded number of in-flight jobs.
+
+    When the queue is full new jobs are rejected with 503 + Retry-After instead of
+    piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE, rounds: int = HASH_ROUNDS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.rounds = rounds
+        self._executor = None
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.inflight >= self.queue_size:
+                self.rejected += 1
+                raise HTTPException(503, "ระบบกำลังยุ่ง กรุณาลองใหม่อีกครั้ง", headers={"Retry-After": "1"})
+            self.inflight += 1
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return await run_in_threadpool(fn, *args)
+            return await asyncio.wrap_future(executor.submit(fn, *args))
+        finally:
+            with self._lock:
+                self.inflight -= 1
+                self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """Returns (ok, new_hash); new_hash is set when the stored hash is outdated"""
+        return await self._run(_verify_and_update, password, hashed, self.rounds)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "rounds": self.rounds,
+                "inflight": self.inflight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+hash_pool = HashPool()
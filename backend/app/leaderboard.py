@@ -0,0 +1,322 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sortedcontainers import SortedList
+from sqlalchemy import func, select
+
+from . import models
+from .database import SessionLocal
+
+# How often every worker re-reads the boards from the database
+REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "300"))
+SCOPES = ("all", "week", "course", "grade", "dek")
+
+_UID_BITS = 32
+_UID_MASK = (1 << _UID_BITS) - 1
+
+
+def _key(score: int, user_id: int) -> int:
+    # one int per entry: higher score first, then lower user id
+    return (-score << _UID_BITS) | user_id
+
+
+def _unkey(k: int) -> tuple:
+    return k & _UID_MASK, -(k >> _UID_BITS)
+
+
+def _label(value):
+    # dek_code is a string column but older rows hold ints
+    return str(value) if value not in (None, "") else None
+
+
+class Board:
+    """One ranking: user_id -> score plus the same entries in rank order.
+
+    Only positive scores are kept; the initial `scores` dict is taken over as
+    is and must hold positive values only. set/rank are O(log n); a slice of
+    the ranking costs O(log n + k).
+    """
+
+    __slots__ = ("_scores", "_keys")
+
+    def __init__(self, scores: dict | None = None):
+        self._scores = scores if scores is not None else {}
+        # _key inlined: this runs for every user on every rebuild
+        self._keys = SortedList([(-s << _UID_BITS) | uid for uid, s in self._scores.items()])
+
+    def __len__(self):
+        return len(self._scores)
+
+    def score(self, user_id: int) -> int:
+        return self._scores.get(user_id, 0)
+
+    def set(self, user_id: int, score: int):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._keys.remove(_key(old, user_id))
+            del self._scores[user_id]
+        if score > 0:
+            self._scores[user_id] = score
+            self._keys.add(_key(score, user_id))
+
+    def rank(self, user_id: int) -> int | None:
+        score = self._scores.get(user_id)
+        return None if score is None else self._keys.index(_key(score, user_id)) + 1
+
+    def slice(self, start: int, stop: int) -> list:
+        """[(rank, user_id, score)] for 0-based positions start..stop"""
+        start = max(start, 0)
+        return [(start + i + 1, *_unkey(k)) for i, k in enumerate(self._keys.islice(start, stop))]
+
+
+class Leaderboard:
+    """In-memory ranked boards, rebuilt from the database and patched in place.
+
+    Boards: ("all", None) total minutes, ("week", None) minutes over the last
+    seven study days, ("course", course_id) completed lessons, and all-time
+    minutes split by ("grade", grade_level) / ("dek", dek_code). Course boards
+    are loaded on first use (load_course) rather than at startup.
+
+    Writers call the set_* methods after their commit with absolute values, so
+    the worker that served the request is current right away; other workers
+    catch up on the next refresh (every REFRESH_INTERVAL seconds), which also
+    rolls the weekly window. Updates that land while a rebuild is running are
+    replayed onto the new boards, which is safe because they are absolute.
+    """
+
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._boards = {}
+        self._profiles = {}  # user_id -> (grade, dek) for users on a grade/dek board
+        self._journal = None  # updates received during a rebuild
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.built_at = None
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.updates = 0
+
+    # --- reads ---
+    def board(self, scope: str, key=None) -> Board | None:
+        return self._boards.get((scope, key))
+
+    def top(self, scope: str, key=None, limit: int = 10, offset: int = 0) -> list:
+        with self._lock:
+            b = self.board(scope, key)
+            return b.slice(offset, offset + limit) if b else []
+
+    def around(self, scope: str, key, user_id: int, span: int = 5) -> dict:
+        """The user's rank and score plus up to `span` entries on each side"""
+        with self._lock:
+            b = self.board(scope, key)
+            rank = b.rank(user_id) if b else None
+            return {
+                "rank": rank,
+                "score": b.score(user_id) if b else 0,
+                "total": len(b) if b else 0,
+                "around": b.slice(rank - 1 - span, rank + span) if rank else [],
+            }
+
+    def profile(self, user_id: int) -> tuple:
+        return self._profiles.get(user_id, (None, None))
+
+    # --- incremental updates ---
+    def _apply(self, op, *args):
+        with self._lock:
+            op(*args)
+            self.updates += 1
+            if self._journal is not None:
+                self._journal.append((op.__name__, args))
+
+    def _board(self, scope: str, key=None) -> Board:
+        b = self._boards.get((scope, key))
+        if b is None:
+            b = self._boards[(scope, key)] = Board()
+        return b
+
+    def _set_minutes(self, user_id, total, grade, dek):
+        self._set_profile(user_id, grade, dek)
+        self._board("all").set(user_id, total)
+        for scope, label in zip(("grade", "dek"), self.profile(user_id)):
+            if label:
+                self._board(scope, label).set(user_id, total)
+
+    def _set_profile(self, user_id, grade, dek):
+        new = (_label(grade), _label(dek))
+        old = self.profile(user_id)
+        if new == old:
+            return
+        score = self._board("all").score(user_id)
+        for scope, before, after in zip(("grade", "dek"), old, new):
+            if before != after:
+                if before:
+                    self._board(scope, before).set(user_id, 0)
+                if after:
+                    self._board(scope, after).set(user_id, score)
+        if any(new):
+            self._profiles[user_id] = new
+        else:
+            self._profiles.pop(user_id, None)
+
+    def _set_weekly(self, user_id, minutes):
+        self._board("week").set(user_id, minutes)
+
+    def _set_completed(self, user_id, course_id, count):
+        # a course board that is not loaded yet will read the new count when it is
+        b = self._boards.get(("course", course_id))
+        if b is not None:
+            b.set(user_id, count)
+
+    def _drop_course(self, course_id):
+        self._boards.pop(("course", course_id), None)
+
+    def set_minutes(self, user_id: int, total: int, grade=None, dek=None):
+        self._apply(self._set_minutes, user_id, total or 0, grade, dek)
+
+    def set_profile(self, user_id: int, grade, dek):
+        self._apply(self._set_profile, user_id, grade, dek)
+
+    def set_weekly(self, user_id: int, minutes: int):
+        self._apply(self._set_weekly, user_id, minutes or 0)
+
+    def set_completed(self, user_id: int, course_id: int, count: int):
+        self._apply(self._set_completed, user_id, course_id, count or 0)
+
+    def drop_course(self, course_id: int):
+        """Forget a deleted course's board so refreshes stop querying it"""
+        self._apply(self._drop_course, course_id)
+
+    # --- rebuild ---
+    def _course_scores(self, conn, course_ids) -> dict:
+        E = models.Enrollment
+        scores = {("course", cid): {} for cid in course_ids}
+        for uid, course_id, count in conn.execute(
+            select(E.user_id, E.course_id, E.completed_lessons)
+            .where(E.course_id.in_(course_ids), E.completed_lessons > 0)
+        ):
+            scores[("course", course_id)][uid] = count
+        return scores
+
+    def load_course(self, course_id: int, conn=None):
+        """Load one course board if it is not loaded yet"""
+        if ("course", course_id) in self._boards:
+            return
+        if conn is None:
+            with SessionLocal() as own:
+                return self.load_course(course_id, own)
+        board = Board(self._course_scores(conn, [course_id])[("course", course_id)])
+        with self._lock:
+            self._boards.setdefault(("course", course_id), board)
+
+    def build(self, conn, since: date, course_ids=(), batch: int = 50000) -> tuple:
+        """Read the boards from the database; returns (boards, profiles)"""
+        U, D = models.User, models.StudyDaily
+        scores = defaultdict(dict)
+        profiles = {}
+        res = conn.execute(
+            select(U.id, U.total_minutes, U.grade_level, U.dek_code)
+            .where(U.total_minutes > 0)
+            .execution_options(yield_per=batch)
+        )
+        # group by the raw (grade, dek) pair first so the per-user loop stays
+        # a single dict store; the few groups are then merged into the boards
+        groups = defaultdict(dict)
+        for part in res.partitions():
+            for uid, total, grade, dek in part:
+                groups[grade, dek][uid] = total
+        everyone = scores[("all", None)]
+        for (grade, dek), members in groups.items():
+            everyone.update(members)
+            labels = (_label(grade), _label(dek))
+            if any(labels):
+                profiles.update(dict.fromkeys(members, labels))
+                for scope, label in zip(("grade", "dek"), labels):
+                    if label:
+                        scores[(scope, label)].update(members)
+
+        scores[("week", None)] = dict(conn.execute(
+            select(D.user_id, func.sum(D.minutes))
+            .where(D.day >= since)
+            .group_by(D.user_id)
+            .having(func.sum(D.minutes) > 0)
+        ).all())
+
+        if course_ids:
+            scores.update(self._course_scores(conn, list(course_ids)))
+        return {key: Board(s) for key, s in scores.items()}, profiles
+
+    def rebuild(self, conn=None) -> float:
+        """Rebuild all boards and swap them in; returns the seconds it took"""
+        from .crud import study_day
+
+        with self._rebuild_lock:
+            t0 = time.perf_counter()
+            with self._lock:
+                self._journal = []
+            try:
+                since = study_day(datetime.utcnow()) - timedelta(days=6)
+                # course boards loaded so far are refreshed too
+                courses = [key for scope, key in list(self._boards) if scope == "course"]
+                if conn is None:
+                    with SessionLocal() as own:
+                        boards, profiles = self.build(own, since, courses)
+                else:
+                    boards, profiles = self.build(conn, since, courses)
+                with self._lock:
+                    self._boards, self._profiles = boards, profiles
+                    for name, args in self._journal:
+                        getattr(self, name)(*args)
+            finally:
+                with self._lock:
+                    self._journal = None
+            self.builds += 1
+            self.built_at = datetime.utcnow()
+            self.build_seconds = time.perf_counter() - t0
+            return self.build_seconds
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"⚠️ leaderboard refresh failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"⚠️ leaderboard warm-up failed: {e}")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            boards = len(self._boards)
+            ranked = len(self._boards.get(("all", None)) or ())
+        return {
+            "boards": boards,
+            "ranked_users": ranked,
+            "builds": self.builds,
+            "build_seconds": round(self.build_seconds, 3),
+            "built_at": self.built_at.isoformat() if self.built_at else None,
+            "updates": self.updates,
+        }
+
+
+leaderboard = Leaderboard()
@@ -1,24 +1,37 @@
-import os, time, json, re, urllib.request, io
+import os, time, json, re, io
+_IMPORT_T0 = time.perf_counter()
 from pathlib import Path
-from fastapi import FastAPI, Depends, HTTPException, status, Form, File, UploadFile, Query, Body, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, status, Form, File, UploadFile, Query, Body, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import Response, StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 
-from .database import Base, engine, get_db
-from . import models, schemas, crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import Base, engine, SessionLocal, get_db, get_read_db, get_async_db, dispose_async_engine
+from . import models, schemas, crud, crud_async, pagination, search
 from .auth import create_access_token, get_current_user, require_admin, verify_password, get_password_hash, get_current_active_user
+from .auth import get_password_hash_async, verify_and_update_password_async, oauth2_scheme, create_stream_ticket, read_stream_ticket, STREAM_TICKET_SECONDS
+from .hashing import hash_pool
+from .presence import presence
+from .events import presence_hub
+from .progress_buffer import progress_buffer
+from .youtube import duration_resolver
+from .leaderboard import leaderboard, SCOPES as LEADERBOARD_SCOPES
+from . import startup
+from .catalog import catalog
+from .cache import principal_cache, comment_page_cache
 from .models import User
 from .schemas import SettingsUpdate, AdminUserListResponse, UserUpdateMe
 from .promptpay import make_qr_image
 
 from collections import defaultdict
 
-from .badges import get_user_badges_status
+from .badges import get_user_badges_status, unlocked_ids, backfill_job, RULES as BADGE_RULES
 
 load_dotenv()
 
@@ -28,17 +41,49 @@ MY_PROMPTPAY_ID = "0630218621"  # ใส่เบอร์ PromptPay ของ
 app = FastAPI(title="MingSmileyFace API", version="2.2.0")
 STATIC_DIR = Path("static")
 UPLOAD_DIR = STATIC_DIR / "uploads"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"]
 )
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+def _startup():
+    t0 = time.perf_counter()
+    with startup.phase("schema"):
+        startup.ensure_schema(engine, Base.metadata)
+    with startup.phase("upload_dirs"):
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    with startup.phase("presence"):
+        presence.start()
+        presence_hub.start()
+    with startup.phase("youtube_durations"):
+        duration_resolver.start()
+    with startup.phase("progress_buffer"):
+        progress_buffer.start()
+    with startup.phase("leaderboard"):
+        leaderboard.start()
+    with startup.phase("badge_rules"):
+        # backfilled once per deploy (manage.py backfill-badges), never by every worker
+        pending = backfill_job.pending()
+        if pending:
+            print(f"⚠️ badge rules without history: {', '.join(pending)}; run `python manage.py backfill-badges`")
+    startup.record("startup_total", t0)
+
+@app.on_event("shutdown")
+async def _shutdown():
+    presence_hub.stop()
+    presence.stop()
+    progress_buffer.stop()
+    duration_resolver.stop()
+    leaderboard.stop()
+    backfill_job.stop()
+    hash_pool.shutdown()
+    await dispose_async_engine()
 
 BKK_TZ = timezone(timedelta(hours=7))
 
@@ -48,18 +93,6 @@ def _bkk_text(dt: datetime) -> str:
 def _bkk_iso(dt: datetime) -> str:
     return dt.replace(tzinfo=timezone.utc).astimezone(BKK_TZ).isoformat() if dt else ""
 
-def get_youtube_duration(video_id: str) -> int:
-    try:
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        with urllib.request.urlopen(url) as response:
-            html = response.read().decode()
-            match = re.search(r'"lengthSeconds":"(\d+)"', html)
-            if match:
-                return round(int(match.group(1)) / 60)
-    except:
-        pass
-    return 0
-
 @app.get("/ping")
 def ping():
     return {"ok": True, "msg": "pong"}
@@ -68,20 +101,24 @@ def ping():
 #  AUTH
 # ==========================================
 @app.post("/auth/signup", response_model=schemas.UserRead, status_code=201)
-def signup(payload: schemas.UserCreate, db: Session = Depends(get_db)):
-    if crud.get_user_by_email(db, payload.email):
+async def signup(payload: schemas.UserCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(crud.get_user_by_email, db, payload.email):
         raise HTTPException(400, "Email registered")
-    u = crud.create_user(db, payload.email, get_password_hash(payload.password), payload.full_name, payload.nickname, payload.grade_level)
-    return u
+    hashed = await get_password_hash_async(payload.password)
+    u = await run_in_threadpool(crud.create_user, db, payload.email, hashed, payload.full_name, payload.nickname, payload.grade_level)
+    return await run_in_threadpool(schemas.UserRead.model_validate, u)
 
 @app.post("/auth/login", response_model=schemas.Token)
-def login(payload: schemas.UserLogin, db: Session = Depends(get_db)):
-    u = crud.get_user_by_email(db, payload.email)
-    if not u or not verify_password(payload.password, u.hashed_password):
+async def login(payload: schemas.UserLogin, db: Session = Depends(get_db)):
+    u = await run_in_threadpool(crud.get_user_by_email, db, payload.email)
+    if not u:
         raise HTTPException(401, "Invalid credentials")
-    u.last_login = datetime.utcnow()
-    db.commit()
-    return {"access_token": create_access_token(u.email), "token_type": "bearer"}
+    ok, new_hash = await verify_and_update_password_async(payload.password, u.hashed_password)
+    if not ok:
+        raise HTTPException(401, "Invalid credentials")
+    email = u.email
+    await run_in_threadpool(crud.record_login, db, u, new_hash)
+    return {"access_token": create_access_token(email), "token_type": "bearer"}
 
 # ==========================================
 #  USER & PROFILE
@@ -98,6 +135,7 @@ def update_user_me(user_data: UserUpdateMe, current_user: User = Depends(get_cur
     if user_data.dek_code is not None: current_user.dek_code = user_data.dek_code
     db.commit()
     db.refresh(current_user)
+    leaderboard.set_profile(current_user.id, current_user.grade_level, current_user.dek_code)
     return current_user
 
 @app.post("/users/me/upload-image")
@@ -122,13 +160,42 @@ async def upload_user_image(file: UploadFile = File(...), db: Session = Depends(
 # ==========================================
 #  COURSES (Public & Admin)
 # ==========================================
-@app.get("/courses", response_model=List[schemas.CourseRead])
-def list_c(db: Session = Depends(get_db)):
-    return crud.list_courses(db)
+def _cached_json(request: Request, body: bytes, etag: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-@app.get("/courses/{id}", response_model=schemas.CourseRead)
-def get_c(id: int, db: Session = Depends(get_db)):
-    return crud.get_course(db, id)
+@app.get("/courses", response_model=List[schemas.CourseRead])
+async def list_c(request: Request, response: Response, cursor: str | None = None, limit: int | None = Query(None, ge=1, le=pagination.MAX_LIMIT)):
+    snap = await catalog.snapshot_async()
+    if cursor is None and limit is None:
+        return _cached_json(request, snap.list_body, snap.list_etag)
+    # Slice of the in-memory catalog, keyed on course id (newest first)
+    limit = limit or pagination.DEFAULT_LIMIT
+    after = pagination.decode_cursor(cursor, (int,))
+    items = [c for c in snap.courses if after is None or c["id"] < after[0]]
+    if len(items) > limit:
+        items = items[:limit]
+        pagination.set_next_cursor(response, pagination.encode_cursor([items[-1]["id"]]))
+    return items
+
+@app.get("/courses/{id}", response_model=schemas.CourseDetailRead)
+async def get_c(id: int, request: Request):
+    snap = await catalog.snapshot_async()
+    item = snap.details.get(id)
+    if item is None:
+        raise HTTPException(404, "Course not found")
+    return _cached_json(request, *item)
+
+@app.get("/search", response_model=List[schemas.SearchHit])
+def search_catalog(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: str | None = Query(None, pattern="^(course|lesson)$"),
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    return search.search(db, q, limit, kind)
 
 @app.post("/admin/courses", response_model=schemas.CourseRead)
 def create_c(p: schemas.CourseCreate, db: Session = Depends(get_db), _=Depends(require_admin)):
@@ -148,15 +215,22 @@ def add_chap(id: int, p: schemas.ChapterCreate, db: Session = Depends(get_db), _
 
 @app.post("/admin/chapters/{id}/lessons", response_model=schemas.LessonRead)
 def add_l(id: int, p: schemas.LessonCreate, db: Session = Depends(get_db), _=Depends(require_admin)):
+    # Known durations come from the cache; unknown ones are resolved in the background
     if p.duration == 0 and p.youtube_id:
-        p.duration = get_youtube_duration(p.youtube_id)
-    return crud.create_lesson(db, id, p)
+        p.duration = duration_resolver.cached(db, p.youtube_id) or 0
+    l = crud.create_lesson(db, id, p)
+    if not l.duration and l.youtube_id:
+        duration_resolver.enqueue(l.youtube_id)
+    return l
 
 @app.patch("/admin/lessons/{id}", response_model=schemas.LessonRead)
 def upd_l(id: int, p: schemas.LessonUpdate, db: Session = Depends(get_db), _=Depends(require_admin)):
     if p.youtube_id and (p.duration is None or p.duration == 0):
-        p.duration = get_youtube_duration(p.youtube_id)
-    return crud.update_lesson(db, id, p)
+        p.duration = duration_resolver.cached(db, p.youtube_id) or 0
+    l = crud.update_lesson(db, id, p)
+    if l and not l.duration and l.youtube_id:
+        duration_resolver.enqueue(l.youtube_id)
+    return l
 
 @app.delete("/admin/lessons/{id}", status_code=204)
 def del_l(id: int, db: Session = Depends(get_db), _=Depends(require_admin)):
@@ -238,13 +312,27 @@ def my_prog(cid: int, db: Session = Depends(get_db), u=Depends(get_current_user)
     r = crud.get_user_progress_in_course(db, u.id, cid)
     return {"completed_ids": [x[0] for x in r]}
 
+@app.get("/courses/{cid}/room", response_model=schemas.LearningRoom)
+@app.get("/courses/{cid}/lessons/{lid}/room", response_model=schemas.LearningRoom)
+def learning_room(cid: int, lid: int | None = None, db: Session = Depends(get_db), u=Depends(get_current_user)):
+    # one request, one session: course, progress, resume position, comments and ratings
+    room = crud.get_learning_room(db, u.id, cid, lid)
+    if room is None:
+        raise HTTPException(404, "Course or lesson not found")
+    course_body, state = room
+    # the catalog's pre-serialized course detail (CourseDetailRead) is spliced in as is; the
+    # rest of LearningRoom is a validated LearningRoomState, whose JSON always has fields
+    body = b'{"course":' + course_body + b"," + state.model_dump_json().encode()[1:]
+    return Response(content=body, media_type="application/json")
+
 @app.post("/courses/{cid}/lessons/{lid}/toggle-progress")
 def tog_prog(cid: int, lid: int, db: Session = Depends(get_db), u=Depends(get_current_user)):
     return {"completed": crud.toggle_lesson_progress(db, u.id, lid)}
 
 @app.post("/courses/{cid}/lessons/{lid}/progress")
-def upd_prog_time(cid: int, lid: int, p: schemas.ProgressUpdate, db: Session = Depends(get_db), u=Depends(get_current_user)):
-    crud.update_lesson_progress_time(db, u.id, lid, p.seconds)
+def upd_prog_time(cid: int, lid: int, p: schemas.ProgressHeartbeat, u=Depends(get_current_user)):
+    # Coalesced in memory, written in batches by progress_buffer
+    progress_buffer.record(u.id, lid, max(p.seconds, 0))
     return {"status": "ok"}
 
 @app.get("/courses/{cid}/lessons/{lid}/progress")
@@ -253,46 +341,140 @@ def get_prog_time(cid: int, lid: int, db: Session = Depends(get_db), u=Depends(g
 
 @app.post("/users/me/study-time")
 def add_study_time(p: schemas.StudyTimeCreate, db: Session = Depends(get_db), u=Depends(get_current_user)):
-    crud.record_study_time(db, u.id, p.minutes)
-    crud.update_user_activity(db, u.id, "กำลังเรียน")
+    crud.record_study_time(db, u.id, p.minutes, "กำลังเรียน")
     return {"status": "ok"}
 
+@app.post("/users/me/study-events", response_model=schemas.StudyEventResult)
+def add_study_events(p: schemas.StudyEventBatch, db: Session = Depends(get_db), u=Depends(get_current_user)):
+    result = crud.record_study_events(db, u.id, p.events)
+    return result
+
 @app.get("/users/me/study-stats")
 def get_study_stats(db: Session = Depends(get_db), u=Depends(get_current_user)):
     return crud.get_weekly_study_stats(db, u.id)
 
+@app.get("/users/me/study-stats/monthly")
+def get_study_stats_monthly(months: int = Query(12, ge=1, le=36), db: Session = Depends(get_db), u=Depends(get_current_user)):
+    return crud.get_monthly_study_stats(db, u.id, months)
+
+@app.get("/users/me/study-stats/heatmap")
+def get_study_heatmap(days: int = Query(365, ge=7, le=366), db: Session = Depends(get_db), u=Depends(get_current_user)):
+    return crud.get_study_heatmap(db, u.id, days)
+
 @app.post("/users/me/friends")
 def add_friend_api(email: str = Form(...), db: Session = Depends(get_db), u=Depends(get_current_user)): 
     if not crud.add_friend(db, u.id, email):
         raise HTTPException(404, "Failed")
     return {"message": "Added"}
 
+@app.delete("/users/me/friends/{friend_id}")
+def remove_friend_api(friend_id: int, db: Session = Depends(get_db), u=Depends(get_current_user)):
+    if not crud.remove_friend(db, u.id, friend_id):
+        raise HTTPException(404, "Not friends")
+    return {"message": "Removed"}
+
 @app.get("/users/me/friends", response_model=List[schemas.FriendRead])
-def my_friends(db: Session = Depends(get_db), u=Depends(get_current_user)):
-    fs = crud.get_friends(db, u.id)
-    now = datetime.utcnow()
+def my_friends(response: Response, cursor: str | None = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db), u=Depends(get_current_user)):
+    fs, next_cursor = crud.get_friends(db, u.id, cursor, limit)
+    pagination.set_next_cursor(response, next_cursor)
     out = []
-    for f in fs:
-        online = False
-        if f.last_login:
-            online = (now - f.last_login).total_seconds() < 300
+    for f, mutual in fs:
         item = schemas.FriendRead.model_validate(f)
-        item.is_online = online
-        if not online:
-            item.current_activity = None
+        item.is_online = presence.is_online(f.id)
+        item.current_activity = presence.activity(f.id)
+        item.mutual_friends = mutual
         out.append(item)
     return out
 
+@app.get("/users/me/friends/suggestions", response_model=List[schemas.FriendSuggestion])
+def friend_suggestions(limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db), u=Depends(get_current_user)):
+    return [
+        schemas.FriendSuggestion.model_validate(f).model_copy(update={"mutual_friends": mutual, "shared_courses": shared})
+        for f, mutual, shared in crud.suggest_friends(db, u.id, limit)
+    ]
+
+@app.post("/users/me/friends/stream-ticket")
+def friends_stream_ticket(token: str = Depends(oauth2_scheme), u=Depends(get_current_user)):
+    return {"ticket": create_stream_ticket(token), "expires_in": STREAM_TICKET_SECONDS}
+
+def _stream_principal(ticket: str):
+    email, until = read_stream_ticket(ticket)
+    with SessionLocal() as db:
+        u = crud.get_user_by_email(db, email=email)
+        if u is None:
+            raise HTTPException(401, "Invalid or expired stream ticket")
+        return u.id, crud.friend_ids(db, u.id), until
+
+@app.get("/users/me/friends/stream")
+async def friends_stream(ticket: str):
+    # ?ticket= from POST /users/me/friends/stream-ticket; no session is held while the stream is open
+    uid, friend_ids, until = await run_in_threadpool(_stream_principal, ticket)
+    return StreamingResponse(
+        presence_hub.stream(uid, friend_ids, until),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+LEADERBOARD_SCOPE = Query("all", pattern=f"^({'|'.join(LEADERBOARD_SCOPES)})$")
+# largest id a 32-bit INTEGER column holds; bigger keys would overflow in the driver
+MAX_ID = 2**31 - 1
+
+async def _board_key(scope: str, key: str | None, u=None):
+    # grade / dek boards default to the caller's own; course boards load on first use,
+    # only for courses in the catalog so arbitrary keys cannot pile up boards
+    if scope in ("all", "week"):
+        return None
+    if scope == "course":
+        if not (key and len(key) <= 10 and key.isascii() and key.isdigit() and int(key) <= MAX_ID):
+            raise HTTPException(400, "course leaderboard needs key=<course id>")
+        course_id = int(key)
+        if leaderboard.board(scope, course_id) is None:
+            if course_id not in (await catalog.snapshot_async()).details:
+                raise HTTPException(404, "Course not found")
+            await run_in_threadpool(leaderboard.load_course, course_id)
+        return course_id
+    if key is None and u is not None:
+        key = u.grade_level if scope == "grade" else u.dek_code
+    if not key:
+        raise HTTPException(400, f"{scope} leaderboard needs a key")
+    return str(key)
+
+async def _leaderboard_items(db: AsyncSession, rows: list):
+    users = await crud_async.get_leaderboard_users(db, [uid for _, uid, _ in rows])
+    out = []
+    for rank, uid, score in rows:
+        if uid not in users:
+            continue  # deleted since the last refresh
+        u, done = users[uid]
+        out.append(schemas.LeaderboardItem(
+            id=u.id, full_name=u.full_name or u.email.split("@")[0], nickname=u.nickname, avatar_url=u.avatar_url,
+            completed_count=done, total_minutes=u.total_minutes or 0, rank=rank, score=score,
+        ))
+    return out
+
 @app.get("/leaderboard", response_model=List[schemas.LeaderboardItem])
-def leaderboard(db: Session = Depends(get_db)):
-    return [schemas.LeaderboardItem(id=u.id, full_name=u.full_name or u.email.split("@")[0], avatar_url=u.avatar_url, completed_count=s, total_minutes=u.total_minutes) for u,s in crud.get_leaderboard(db)]
+async def leaderboard_top(scope: str = LEADERBOARD_SCOPE, key: str | None = None, limit: int = Query(10, ge=1, le=100), offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_async_db)):
+    return await _leaderboard_items(db, leaderboard.top(scope, await _board_key(scope, key), limit, offset))
+
+@app.get("/leaderboard/me", response_model=schemas.LeaderboardMe)
+async def leaderboard_me(scope: str = LEADERBOARD_SCOPE, key: str | None = None, around: int = Query(5, ge=0, le=25), db: AsyncSession = Depends(get_async_db), u=Depends(get_current_user)):
+    board_key = await _board_key(scope, key, u)
+    me = leaderboard.around(scope, board_key, u.id, around)
+    return schemas.LeaderboardMe(
+        scope=scope, key=None if board_key is None else str(board_key),
+        rank=me["rank"], score=me["score"], total=me["total"],
+        around=await _leaderboard_items(db, me["around"]),
+    )
 
 # ==========================================
 #  INTERACTION (Comment/Rate)
 # ==========================================
 @app.get("/lessons/{id}/comments", response_model=List[schemas.CommentRead])
-def get_comments(id: int, db: Session = Depends(get_db), u=Depends(get_current_user)):
-    return crud.get_lesson_comments(db, id)
+async def get_comments(id: int, response: Response, cursor: str | None = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: AsyncSession = Depends(get_async_db), u=Depends(get_current_user)):
+    items, next_cursor, total = await crud_async.get_lesson_comments(db, id, cursor, limit)
+    pagination.set_next_cursor(response, next_cursor)
+    response.headers["X-Total-Count"] = str(total)
+    return items
 
 @app.post("/lessons/{id}/comments", response_model=schemas.CommentRead)
 def post_comment(id: int, p: schemas.CommentCreate, db: Session = Depends(get_db), u=Depends(get_current_user)):
@@ -300,12 +482,21 @@ def post_comment(id: int, p: schemas.CommentCreate, db: Session = Depends(get_db
 
 @app.get("/lessons/{id}/rating")
 def get_rating(id: int, db: Session = Depends(get_db), u=Depends(get_current_user)):
-    return {"avg": crud.get_lesson_rating_avg(db, id), "my": crud.get_user_lesson_rating(db, u.id, id)}
+    return crud.get_lesson_rating(db, u.id, id)
 
 @app.post("/lessons/{id}/rate")
 def rate_lesson(id: int, p: schemas.RatingCreate, db: Session = Depends(get_db), u=Depends(get_current_user)):
-    crud.set_lesson_rating(db, u.id, id, p.score)
-    return {"status": "ok"}
+    r = crud.set_lesson_rating(db, u.id, id, p.score)
+    if r is None:
+        raise HTTPException(404, "Lesson not found")
+    return {"status": "ok", **r}
+
+@app.get("/courses/{id}/ratings", response_model=schemas.CourseRatings)
+def course_ratings(id: int, db: Session = Depends(get_db), u=Depends(get_current_user)):
+    r = crud.get_course_ratings(db, u.id, id)
+    if r is None:
+        raise HTTPException(404, "Course not found")
+    return r
 
 # ==========================================
 #  ADMIN (Coupons, Exams, Reports, Settings)
@@ -318,8 +509,10 @@ def create_coupon(p: schemas.CouponCreate, db: Session = Depends(get_db), _=Depe
     return c
 
 @app.get("/admin/coupons", response_model=List[schemas.CouponRead])
-def list_coupons(db: Session = Depends(get_db), _=Depends(require_admin)):
-    return crud.list_coupons(db)
+def list_coupons(response: Response, cursor: str | None = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db), _=Depends(require_admin)):
+    items, next_cursor = crud.list_coupons(db, cursor, limit)
+    pagination.set_next_cursor(response, next_cursor)
+    return items
 
 @app.delete("/admin/coupons/{id}")
 def delete_coupon(id: int, db: Session = Depends(get_db), _=Depends(require_admin)):
@@ -348,8 +541,10 @@ def cr_exam(p: schemas.ExamCreate, db: Session = Depends(get_db), _=Depends(requ
     return crud.create_exam(db, p)
 
 @app.get("/exams", response_model=List[schemas.ExamRead])
-def l_exam(db: Session = Depends(get_db)):
-    return crud.list_exams(db)
+def l_exam(response: Response, cursor: str | None = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db)):
+    items, next_cursor = crud.list_exams(db, cursor, limit)
+    pagination.set_next_cursor(response, next_cursor)
+    return items
 
 @app.get("/exams/{id}", response_model=schemas.ExamRead)
 def g_exam(id: int, db: Session = Depends(get_db)):
@@ -386,11 +581,13 @@ def adm_list_users(
     active: bool | None = None,
     grade: str | None = None,
     online_status: str | None = None,
-    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    total: str = Query("exact", pattern="^(exact|approx|none)$"),
+    db: Session = Depends(get_read_db),
     _ = Depends(require_admin)
 ):
-    i, t = crud.admin_list_users(db, q, page, page_size, sort, role, active, grade, online_status)
-    return {"items": i, "meta": {"page": page, "page_size": page_size, "total": t}}
+    i, t, est, nxt = crud.admin_list_users(db, q, page, page_size, sort, role, active, grade, online_status, cursor, total)
+    return {"items": i, "meta": {"page": page, "page_size": page_size, "total": t, "total_is_estimate": est, "next_cursor": nxt}}
 
 @app.patch("/admin/users/{uid}")
 def adm_update_user(uid: int, p: schemas.AdminUserUpdate, db: Session = Depends(get_db), _=Depends(require_admin)):
@@ -400,16 +597,23 @@ def adm_update_user(uid: int, p: schemas.AdminUserUpdate, db: Session = Depends(
     return crud.admin_update_user(db, u, p)
 
 @app.get("/admin/metrics")
-def adm_metrics(db: Session = Depends(get_db), _=Depends(require_admin)):
+def adm_metrics(db: Session = Depends(get_read_db), _=Depends(require_admin)):
     t = db.query(models.User).count()
     a = db.query(models.User).filter_by(role="admin").count()
-    limit = datetime.utcnow() - timedelta(minutes=5)
-    o = db.query(models.User).filter(models.User.last_login >= limit).count()
+    o = presence.online_count()
     n = db.query(models.User).filter(models.User.created_at >= datetime.utcnow().date()).count()
-    return {"total_users": t, "admins": a, "active_users": o, "new_users_today": n}
+    return {"total_users": t, "admins": a, "active_users": o, "studying_users": presence.studying_count(), "new_users_today": n}
+
+@app.get("/admin/cache-stats")
+def adm_cache_stats(_=Depends(require_admin)):
+    return {"principal": principal_cache.stats(), "comment_pages": comment_page_cache.stats(), "password_hashing": hash_pool.stats(), "presence": presence.stats(), "presence_streams": presence_hub.stats(), "catalog": catalog.stats(), "youtube_durations": duration_resolver.stats(), "progress": progress_buffer.stats(), "leaderboard": leaderboard.stats(), "badges": backfill_job.stats()}
+
+@app.get("/admin/startup")
+def adm_startup(_=Depends(require_admin)):
+    return {"mode": startup.STARTUP_SCHEMA_MODE, "timings_ms": startup.timings}
 
 @app.get("/admin/payment-stats")
-def pay_stats(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
+def pay_stats(db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_active_user)):
     if current_user.role != "admin": raise HTTPException(status_code=403, detail="Not authorized")
     
     today = datetime.utcnow().date()
@@ -447,16 +651,18 @@ def pay_stats(db: Session = Depends(get_db), current_user: models.User = Depends
     return {"labels": labels, "data": data}
 
 @app.get("/admin/payments", response_model=List[schemas.PaymentRead])
-def l_pays(status: str | None = None, db: Session = Depends(get_db), _=Depends(require_admin)):
-    return crud.get_payments(db, status)
+def l_pays(response: Response, status: str | None = None, cursor: str | None = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db), _=Depends(require_admin)):
+    items, next_cursor = crud.get_payments(db, status, cursor, limit)
+    pagination.set_next_cursor(response, next_cursor)
+    return items
 
 @app.post("/admin/payments/{id}/{act}")
 def proc_pay(id: int, act: str, db: Session = Depends(get_db), _=Depends(require_admin)):
     return {"status": "ok", "new_status": crud.approve_payment(db, id, act).status}
 
 @app.get("/settings")
-def get_set(db: Session = Depends(get_db)):
-    return crud.get_all_settings(db)
+async def get_set(db: AsyncSession = Depends(get_async_db)):
+    return await crud_async.get_all_settings(db)
 
 @app.patch("/admin/settings")
 def upd_set(p: SettingsUpdate, db: Session = Depends(get_db), _=Depends(require_admin)):
@@ -487,8 +693,10 @@ def delete_banner_image(url: str = Body(..., embed=True), db: Session = Depends(
     return {"images": imgs}
 
 @app.get("/admin/reports", response_model=List[dict])
-def list_reports(status: str | None = None, db: Session = Depends(get_db), _=Depends(require_admin)):
-    return crud.get_all_reports(db, status)
+def list_reports(response: Response, status: str | None = None, cursor: str | None = None, limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(get_db), _=Depends(require_admin)):
+    items, next_cursor = crud.get_all_reports(db, status, cursor, limit)
+    pagination.set_next_cursor(response, next_cursor)
+    return items
 
 @app.post("/reports")
 def report_problem(p: schemas.ReportCreate, db: Session = Depends(get_db), u=Depends(get_current_user)):
@@ -508,10 +716,12 @@ def adm_audit(
     page: int = 1,
     page_size: int = 20,
     sort: str = "created_at:desc",
-    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    total: str = Query("exact", pattern="^(exact|approx|none)$"),
+    db: Session = Depends(get_read_db),
     _ = Depends(require_admin)
 ):
-    r, t = crud.list_audit(db, action, actor_id, target_id, None, None, page, page_size, sort)
+    r, t, est, nxt = crud.list_audit(db, action, actor_id, target_id, None, None, page, page_size, sort, cursor, total)
     items = []
     for x in r:
         diffs = crud._compute_diff(x.data)
@@ -526,7 +736,7 @@ def adm_audit(
             created_at_iso_bkk=_bkk_iso(x.created_at),
             diff=diffs
         ))
-    return {"items": items, "meta": {"page": page, "page_size": page_size, "total": t}}
+    return {"items": items, "meta": {"page": page, "page_size": page_size, "total": t, "total_is_estimate": est, "next_cursor": nxt}}
 
 
 # ==========================================
@@ -543,9 +753,9 @@ def update_showcase(badges: List[str] = Body(...), db: Session = Depends(get_db)
         raise HTTPException(400, "เลือกโชว์ได้สูงสุด 3 อัน")
     
     # Validate: ต้องเป็นเหรียญที่ปลดล็อกแล้วเท่านั้น
-    unlocked_ids = set([b['id'] for b in get_user_badges_status(db, u) if b['is_unlocked']])
+    unlocked = unlocked_ids(db, u.id)
     for bid in badges:
-        if bid not in unlocked_ids:
+        if bid not in unlocked:
             raise HTTPException(400, f"คุณยังไม่ได้รับเหรียญ {bid}")
             
     # Save as comma separated string
@@ -553,6 +763,20 @@ def update_showcase(badges: List[str] = Body(...), db: Session = Depends(get_db)
     db.commit()
     return {"status": "ok", "showcase": u.showcase_badges}
 
+@app.post("/admin/badges/backfill", status_code=202)
+def adm_badge_backfill(badges: Optional[List[str]] = Body(None), _=Depends(require_admin)):
+    # all rules when no ids are given; progress is reported by the GET below
+    unknown = set(badges or ()) - set(BADGE_RULES)
+    if unknown:
+        raise HTTPException(400, f"Unknown badges: {', '.join(sorted(unknown))}")
+    if not backfill_job.start(badges or list(BADGE_RULES)):
+        raise HTTPException(409, "A badge backfill is already running")
+    return backfill_job.stats()
+
+@app.get("/admin/badges/backfill")
+def adm_badge_backfill_status(_=Depends(require_admin)):
+    return backfill_job.stats()
+
 
 @app.get("/users/{user_id}/public", response_model=schemas.UserPublicProfile)
 def get_public_profile_api(user_id: int, db: Session = Depends(get_db), u=Depends(get_current_user)):
@@ -560,4 +784,6 @@ def get_public_profile_api(user_id: int, db: Session = Depends(get_db), u=Depend
     profile = crud.get_public_profile(db, user_id)
     if not profile:
         raise HTTPException(404, "User not found")
-    return profile
\ No newline at end of file
+    return profile
+
+startup.record("import", _IMPORT_T0)
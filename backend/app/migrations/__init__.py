@@ -0,0 +1,211 @@
+"""
+Versioned schema migrations.
+
+Each revision is a module in this package named rNNNN_<slug>.py that defines
+`revision` (int), `name` (str) and `upgrade(op)`. Applied revisions are
+recorded in the `schema_migrations` table, so `upgrade()` only runs what is
+missing. Revisions must be idempotent (IF NOT EXISTS / column checks) because a
+revision that fails half way is simply run again.
+
+A revision that rewrites existing rows (backfills, rebuilds, dedupes) sets
+`heavy = True`. Worker startup does not apply those on a database that
+already holds data; run `migrate` as a release step instead.
+
+  python manage.py migrate          # apply pending revisions
+  python manage.py migrations       # show applied / pending
+"""
+import importlib
+import os
+import pkgutil
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import text, inspect
+
+MIGRATIONS_TABLE = "schema_migrations"
+PG_LOCK_ID = 728_310_001  # pg_advisory_lock key so only one process migrates at a time
+
+
+def load_revisions():
+    revs = []
+    for info in pkgutil.iter_modules(__path__):
+        if info.name.startswith("r") and info.name[1:5].isdigit():
+            revs.append(importlib.import_module(f"{__name__}.{info.name}"))
+    revs.sort(key=lambda m: m.revision)
+    return revs
+
+def head() -> int:
+    revs = load_revisions()
+    return revs[-1].revision if revs else 0
+
+
+class Operations:
+    """What a revision's upgrade(op) gets to work with"""
+
+    def __init__(self, engine, log=print, fresh: bool = False):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.log = log
+        # the database had no tables when this upgrade started: there is no existing data
+        self.fresh = fresh
+
+    def execute(self, sql: str, params=None):
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), params or {})
+
+    @contextmanager
+    def transaction(self):
+        with self.engine.begin() as conn:
+            yield conn
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.engine).has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column in {c["name"] for c in inspect(self.engine).get_columns(table)}
+
+    def add_column(self, table: str, column: str, ddl: str):
+        if self.has_table(table) and not self.has_column(table, column):
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    def create_index(self, name: str, table: str, columns: list, unique: bool = False):
+        """Build an index without holding a long write lock.
+
+        Postgres: CREATE INDEX CONCURRENTLY outside a transaction (an INVALID
+        leftover from an interrupted build is dropped and rebuilt).
+        SQLite: one short transaction per index; busy_timeout lets writers queue
+        behind it instead of failing.
+        """
+        cols = ", ".join(columns)
+        uq = "UNIQUE " if unique else ""
+        t0 = time.perf_counter()
+        if self.dialect == "postgresql":
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                invalid = conn.execute(text(
+                    "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                    "WHERE c.relname = :n AND NOT i.indisvalid"
+                ), {"n": name}).first()
+                if invalid:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                conn.execute(text(f"CREATE {uq}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"))
+        else:
+            self.execute(f"CREATE {uq}INDEX IF NOT EXISTS {name} ON {table} ({cols})")
+        self.log(f"   index {name} on {table}({cols}) in {time.perf_counter() - t0:.2f}s")
+
+    def drop_index(self, name: str):
+        if self.dialect == "postgresql":
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        else:
+            self.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def analyze(self, table: str):
+        self.execute(f"ANALYZE {table}")
+
+
+def _ensure_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+def applied_versions(engine) -> set:
+    if not inspect(engine).has_table(MIGRATIONS_TABLE):
+        return set()
+    with engine.connect() as conn:
+        return {r[0] for r in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+def current_version(engine) -> int:
+    return max(applied_versions(engine), default=0)
+
+@contextmanager
+def _sqlite_lock(engine):
+    """Exclusive lock file next to the database, released when the process exits"""
+    path = engine.url.database
+    if not path or path == ":memory:" or engine.url.query.get("mode") == "memory":
+        yield  # private to this process
+        return
+    with open(f"{path}.migrate-lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # gives up after ~10s
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+@contextmanager
+def _migration_lock(engine):
+    if engine.dialect.name == "sqlite":
+        with _sqlite_lock(engine):
+            yield
+        return
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": PG_LOCK_ID})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": PG_LOCK_ID})
+
+def upgrade(engine, target: int | None = None, log=print, metadata=None, heavy: bool = True) -> list:
+    """Apply every pending revision up to `target` (default: head).
+
+    Processes migrating at the same time queue on a lock and re-read what is
+    applied once they hold it, so each revision runs once. `metadata` creates
+    missing tables first under the same lock. With heavy=False it stops
+    before the first pending heavy revision unless the database had no
+    tables yet (nothing to rewrite).
+    """
+    from ..database import maintenance_engine
+
+    engine = maintenance_engine(engine)
+    done = []
+    with _migration_lock(engine):
+        fresh = not inspect(engine).get_table_names()
+        if metadata is not None:
+            metadata.create_all(bind=engine)
+        _ensure_table(engine)
+        applied = applied_versions(engine)
+        op = Operations(engine, log, fresh)
+        for rev in load_revisions():
+            if rev.revision in applied or (target is not None and rev.revision > target):
+                continue
+            if getattr(rev, "heavy", False) and not heavy and not fresh:
+                log(f"⏸ {rev.revision:04d} {rev.name} rewrites existing data; run `python manage.py migrate`")
+                break
+            log(f"▶ applying {rev.revision:04d} {rev.name}")
+            t0 = time.perf_counter()
+            rev.upgrade(op)
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": rev.revision, "n": rev.name, "t": datetime.utcnow()},
+                )
+            log(f"✅ {rev.revision:04d} done in {time.perf_counter() - t0:.2f}s")
+            done.append(rev.revision)
+    return done
+
+def status(engine) -> list:
+    applied = applied_versions(engine)
+    return [(rev.revision, rev.name, rev.revision in applied) for rev in load_revisions()]
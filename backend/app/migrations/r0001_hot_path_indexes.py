@@ -0,0 +1,20 @@
+"""Composite indexes for the foreign keys / sort keys used on hot paths"""
+
+revision = 1
+name = "hot_path_indexes"
+
+INDEXES = [
+    ("ix_enrollments_user_course", "enrollments", ["user_id", "course_id"]),
+    ("ix_progress_user_lesson", "progress", ["user_id", "lesson_id"]),
+    ("ix_study_logs_user_created", "study_logs", ["user_id", "created_at"]),
+    ("ix_payments_status_created", "payments", ["status", "created_at"]),
+    ("ix_comments_lesson_created", "comments", ["lesson_id", "created_at"]),
+    ("ix_audit_logs_created_action", "audit_logs", ["created_at", "action"]),
+]
+
+
+def upgrade(op):
+    for index_name, table, columns in INDEXES:
+        if op.has_table(table):
+            op.create_index(index_name, table, columns)
+            op.analyze(table)
@@ -0,0 +1,28 @@
+"""Full-text search index for courses and lessons (see app/search.py)"""
+
+revision = 2
+name = "search_index"
+heavy = True
+
+
+def upgrade(op):
+    from app import search
+
+    if op.dialect == "postgresql":
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS {search.DOC_TABLE} ("
+            "kind VARCHAR(10) NOT NULL, ref_id INTEGER NOT NULL, course_id INTEGER, title VARCHAR, "
+            "tsv TSVECTOR NOT NULL, PRIMARY KEY (kind, ref_id))"
+        )
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON {search.DOC_TABLE} USING GIN (tsv)")
+        op.create_index("ix_search_documents_course", search.DOC_TABLE, ["course_id"])
+    else:
+        op.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {search.FTS_TABLE} USING fts5("
+            "head, body, kind UNINDEXED, ref_id UNINDEXED, course_id UNINDEXED, title UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 0', prefix = '2 3')"
+        )
+        op.execute(f"INSERT INTO {search.FTS_TABLE} ({search.FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    if op.has_table("courses") and op.has_table("lessons"):
+        with op.transaction() as conn:
+            op.log(f"   indexed {search.rebuild(conn)} documents")
@@ -0,0 +1,10 @@
+"""Persistent cache of resolved YouTube durations (see app/youtube.py)"""
+
+revision = 3
+name = "youtube_durations"
+
+
+def upgrade(op):
+    from app import models
+
+    models.YoutubeDuration.__table__.create(op.engine, checkfirst=True)
@@ -0,0 +1,8 @@
+"""study_logs.lesson_id for per-lesson study events"""
+
+revision = 4
+name = "study_log_lesson"
+
+
+def upgrade(op):
+    op.add_column("study_logs", "lesson_id", "INTEGER REFERENCES lessons(id)")
@@ -0,0 +1,14 @@
+"""study_daily rollup, backfilled from study_logs"""
+
+revision = 5
+name = "study_daily"
+heavy = True
+
+
+def upgrade(op):
+    from app import crud, models
+
+    models.StudyDaily.__table__.create(op.engine, checkfirst=True)
+    if op.has_table("study_logs"):
+        with op.transaction() as conn:
+            op.log(f"   rolled up {crud.rebuild_study_daily(conn)} study logs")
@@ -0,0 +1,15 @@
+"""enrollments.completed_lessons counter, filled from progress"""
+
+revision = 6
+name = "enrollment_completion"
+heavy = True
+
+
+def upgrade(op):
+    from app import crud
+
+    op.add_column("enrollments", "completed_lessons", "INTEGER NOT NULL DEFAULT 0")
+    if op.has_table("progress"):
+        with op.transaction() as conn:
+            checked, fixed = crud.check_completion_counters(conn, fix=True)
+            op.log(f"   {checked} enrollments checked, {fixed} counters set")
@@ -0,0 +1,45 @@
+"""Unique (user_id, lesson_id) on progress so writes can be single upserts.
+
+Existing duplicates are merged first (completed if any row was, the furthest
+position, the latest timestamp). If rows are duplicated again before the
+unique index is built the build fails and the revision is simply re-run.
+"""
+from sqlalchemy import text
+
+revision = 7
+name = "progress_unique"
+heavy = True
+
+
+def _merge_duplicates(conn) -> int:
+    groups = conn.execute(text(
+        "SELECT user_id, lesson_id FROM progress WHERE user_id IS NOT NULL AND lesson_id IS NOT NULL "
+        "GROUP BY user_id, lesson_id HAVING COUNT(*) > 1"
+    )).all()
+    for user_id, lesson_id in groups:
+        key = {"u": user_id, "l": lesson_id}
+        rows = conn.execute(text(
+            "SELECT id, completed, seconds_watched, last_updated FROM progress "
+            "WHERE user_id = :u AND lesson_id = :l ORDER BY id"
+        ), key).all()
+        keep = rows[-1].id
+        conn.execute(text(
+            "UPDATE progress SET completed = :c, seconds_watched = :s, last_updated = :t WHERE id = :id"
+        ), {
+            "id": keep,
+            "c": any(r.completed for r in rows),
+            "s": max((r.seconds_watched or 0) for r in rows),
+            "t": max((r.last_updated for r in rows if r.last_updated), default=None),
+        })
+        conn.execute(text("DELETE FROM progress WHERE user_id = :u AND lesson_id = :l AND id <> :id"), {**key, "id": keep})
+    return len(groups)
+
+
+def upgrade(op):
+    if not op.has_table("progress"):
+        return
+    with op.transaction() as conn:
+        op.log(f"   merged {_merge_duplicates(conn)} duplicated (user, lesson) pairs")
+    op.create_index("ux_progress_user_lesson", "progress", ["user_id", "lesson_id"], unique=True)
+    op.drop_index("ix_progress_user_lesson")  # the unique index covers the same lookups
+    op.analyze("progress")
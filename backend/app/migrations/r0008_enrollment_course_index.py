@@ -0,0 +1,9 @@
+"""(course_id, completed_lessons) on enrollments for per-course leaderboards"""
+
+revision = 8
+name = "enrollment_course_index"
+
+
+def upgrade(op):
+    op.create_index("ix_enrollments_course_completed", "enrollments", ["course_id", "completed_lessons"])
+    op.analyze("enrollments")
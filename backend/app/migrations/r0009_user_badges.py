@@ -0,0 +1,18 @@
+"""user_badges: persisted badge unlocks.
+
+History is replayed into it by `manage.py backfill-badges` (every rule
+counts as new there), not here. A brand-new database has no history, so
+there every rule is recorded as backfilled right away.
+"""
+
+revision = 9
+name = "user_badges"
+
+
+def upgrade(op):
+    from app import badges, models
+
+    models.UserBadge.__table__.create(op.engine, checkfirst=True)
+    if op.fresh:
+        with op.transaction() as conn:
+            badges.mark_backfilled(conn, badges.RULES)
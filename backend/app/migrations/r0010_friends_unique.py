@@ -0,0 +1,28 @@
+"""Symmetric friend edges with a unique (user_id, friend_id) index.
+
+Self edges and duplicates are removed and every edge gets its reverse
+before the index is built.
+"""
+from sqlalchemy import text
+
+revision = 10
+name = "friends_unique"
+heavy = True
+
+
+def upgrade(op):
+    if not op.has_table("friends"):
+        return
+    with op.transaction() as conn:
+        conn.execute(text("DELETE FROM friends WHERE user_id IS NULL OR friend_id IS NULL OR user_id = friend_id"))
+        conn.execute(text(
+            "DELETE FROM friends WHERE id NOT IN (SELECT MIN(id) FROM friends GROUP BY user_id, friend_id)"
+        ))
+        added = conn.execute(text(
+            "INSERT INTO friends (user_id, friend_id, created_at) "
+            "SELECT f.friend_id, f.user_id, f.created_at FROM friends f WHERE NOT EXISTS "
+            "(SELECT 1 FROM friends g WHERE g.user_id = f.friend_id AND g.friend_id = f.user_id)"
+        )).rowcount
+        op.log(f"   added {added} reverse friend edges")
+    op.create_index("ux_friends_user_friend", "friends", ["user_id", "friend_id"], unique=True)
+    op.analyze("friends")
@@ -0,0 +1,15 @@
+"""lessons.comment_count counter, filled from comments"""
+
+revision = 11
+name = "lesson_comment_count"
+heavy = True
+
+
+def upgrade(op):
+    op.add_column("lessons", "comment_count", "INTEGER NOT NULL DEFAULT 0")
+    if op.has_table("comments"):
+        n = op.execute(
+            "UPDATE lessons SET comment_count = "
+            "(SELECT COUNT(*) FROM comments WHERE comments.lesson_id = lessons.id)"
+        ).rowcount
+        op.log(f"   {n} lesson comment counts set")
@@ -0,0 +1,38 @@
+"""Unique (user_id, lesson_id) on ratings and rating sum/count on lessons and courses.
+
+Duplicated ratings keep the latest row (highest id). Aggregates ignore rows
+without a score, as crud.set_lesson_rating does.
+"""
+from sqlalchemy import text
+
+revision = 12
+name = "rating_aggregates"
+heavy = True
+
+
+def upgrade(op):
+    for table in ("lessons", "courses"):
+        op.add_column(table, "rating_sum", "INTEGER NOT NULL DEFAULT 0")
+        op.add_column(table, "rating_count", "INTEGER NOT NULL DEFAULT 0")
+    if not op.has_table("ratings"):
+        return
+    with op.transaction() as conn:
+        conn.execute(text("DELETE FROM ratings WHERE user_id IS NULL OR lesson_id IS NULL"))
+        n = conn.execute(text(
+            "DELETE FROM ratings WHERE id NOT IN "
+            "(SELECT MAX(id) FROM ratings GROUP BY user_id, lesson_id)"
+        )).rowcount
+        op.log(f"   removed {n} duplicated ratings")
+    op.create_index("ux_ratings_user_lesson", "ratings", ["user_id", "lesson_id"], unique=True)
+    with op.transaction() as conn:
+        conn.execute(text(
+            "UPDATE lessons SET "
+            "rating_sum = (SELECT COALESCE(SUM(score), 0) FROM ratings WHERE ratings.lesson_id = lessons.id), "
+            "rating_count = (SELECT COUNT(score) FROM ratings WHERE ratings.lesson_id = lessons.id)"
+        ))
+        conn.execute(text(
+            "UPDATE courses SET "
+            "rating_sum = (SELECT COALESCE(SUM(l.rating_sum), 0) FROM lessons l JOIN chapters ch ON ch.id = l.chapter_id WHERE ch.course_id = courses.id), "
+            "rating_count = (SELECT COALESCE(SUM(l.rating_count), 0) FROM lessons l JOIN chapters ch ON ch.id = l.chapter_id WHERE ch.course_id = courses.id)"
+        ))
+    op.analyze("ratings")
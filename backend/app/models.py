@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, DateTime, Date, Text, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -33,6 +33,8 @@ class User(Base):
 
 class Friend(Base):
     __tablename__ = "friends"
+    # both directions are stored, so a user's friends are one range scan on this index
+    __table_args__ = (Index("ux_friends_user_friend", "user_id", "friend_id", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     friend_id = Column(Integer, ForeignKey("users.id"))
@@ -43,14 +45,31 @@ class Friend(Base):
 
 class StudyLog(Base):
     __tablename__ = "study_logs"
+    __table_args__ = (Index("ix_study_logs_user_created", "user_id", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
+    lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=True)
     minutes = Column(Integer)
     # ✅ เพิ่ม created_at
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="study_logs")
 
+class StudyDaily(Base):
+    """Minutes studied per user per day (Bangkok time), maintained on ingestion"""
+    __tablename__ = "study_daily"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    minutes = Column(Integer, nullable=False, default=0)
+    events = Column(Integer, nullable=False, default=0)
+
+class UserBadge(Base):
+    """Badges a user has unlocked; written by the rules in app/badges.py"""
+    __tablename__ = "user_badges"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    badge_id = Column(String, primary_key=True)
+    unlocked_at = Column(DateTime, default=datetime.utcnow)
+
 class Course(Base):
     __tablename__ = "courses"
     id = Column(Integer, primary_key=True, index=True)
@@ -63,6 +82,9 @@ class Course(Base):
     target_audience = Column(String, nullable=True)
     # ✅ เพิ่ม created_at
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Sum / count of lesson ratings over the whole course, kept in step by crud.set_lesson_rating
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     chapters = relationship("Chapter", back_populates="course", cascade="all, delete-orphan")
     enrollments = relationship("Enrollment", back_populates="course")
@@ -86,6 +108,11 @@ class Lesson(Base):
     duration = Column(Integer, default=0)
     order = Column(Integer)
     doc_url = Column(String, nullable=True)
+    # Comments on this lesson, kept in step by crud.create_comment
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Sum / count of ratings.score for this lesson, kept in step by crud.set_lesson_rating
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     chapter = relationship("Chapter", back_populates="lessons")
     progress = relationship("Progress", back_populates="lesson", cascade="all, delete-orphan")
@@ -94,10 +121,16 @@ class Lesson(Base):
 
 class Enrollment(Base):
     __tablename__ = "enrollments"
+    __table_args__ = (
+        Index("ix_enrollments_user_course", "user_id", "course_id"),
+        Index("ix_enrollments_course_completed", "course_id", "completed_lessons"),  # course leaderboards
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     course_id = Column(Integer, ForeignKey("courses.id"))
     enrolled_at = Column(DateTime, default=datetime.utcnow)
+    # Completed lessons of this course, kept in step by crud.toggle_lesson_progress / delete_lesson
+    completed_lessons = Column(Integer, nullable=False, default=0, server_default="0")
     
     user = relationship("User", back_populates="enrollments")
     # ✅ FIX: แก้ back_populates ให้ตรงกับ Class Course ("enrollments")
@@ -105,6 +138,8 @@ class Enrollment(Base):
 
 class Progress(Base):
     __tablename__ = "progress"
+    # one row per (user, lesson): every write is an INSERT ... ON CONFLICT on this key
+    __table_args__ = (Index("ux_progress_user_lesson", "user_id", "lesson_id", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     lesson_id = Column(Integer, ForeignKey("lessons.id"))
@@ -116,6 +151,7 @@ class Progress(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (Index("ix_payments_status_created", "status", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     course_id = Column(Integer, ForeignKey("courses.id"))
@@ -165,6 +201,7 @@ class Choice(Base):
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (Index("ix_comments_lesson_created", "lesson_id", "created_at"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     lesson_id = Column(Integer, ForeignKey("lessons.id"))
@@ -175,6 +212,8 @@ class Comment(Base):
 
 class Rating(Base):
     __tablename__ = "ratings"
+    # one rating per user and lesson: re-rating is an upsert
+    __table_args__ = (Index("ux_ratings_user_lesson", "user_id", "lesson_id", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     lesson_id = Column(Integer, ForeignKey("lessons.id"))
@@ -200,9 +239,16 @@ class Setting(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (Index("ix_audit_logs_created_action", "created_at", "action"),)
     id = Column(Integer, primary_key=True, index=True)
     action = Column(String)
     actor_id = Column(Integer, nullable=True)
     target_id = Column(Integer, nullable=True)
     data = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+class YoutubeDuration(Base):
+    """Resolved video length per youtube_id (minutes, same unit as Lesson.duration)"""
+    __tablename__ = "youtube_durations"
+    youtube_id = Column(String, primary_key=True)
+    duration = Column(Integer, nullable=False)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
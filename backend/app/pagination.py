@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select, tuple_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+# Above this many rows an approximate count on SQLite is reported as "at least N"
+APPROX_COUNT_CAP = 10000
+
+
+# ==========================================
+#  CURSORS
+#  Opaque urlsafe-base64 JSON of the last row's (sort key, id)
+# ==========================================
+
+def encode_cursor(values) -> str:
+    out = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(out, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None, shape: tuple[type, ...]):
+    """Decode a cursor into a list matching shape (one python type per key column).
+
+    Anything else -- bad base64/JSON, a scalar, the wrong length or element
+    types -- is a client error, never a 500 further down.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        values = [datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in values]
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+    if len(values) != len(shape) or not all(
+        isinstance(v, t) and not isinstance(v, bool) for v, t in zip(values, shape)
+    ):
+        raise HTTPException(400, "Invalid cursor")
+    return values
+
+
+def keyset(stmt, id_col, cursor: str | None, limit: int, sort_col=None, descending: bool = True):
+    """Apply a (sort_col, id) keyset window to a Query or Select.
+
+    Without sort_col the id alone is the key. Fetches limit + 1 rows so
+    page() can tell whether there is a next page.
+    """
+    cols = [sort_col, id_col] if sort_col is not None else [id_col]
+    values = decode_cursor(cursor, tuple(c.type.python_type for c in cols))
+    if values is not None:
+        key = tuple_(*cols) if len(cols) > 1 else cols[0]
+        bound = tuple_(*values) if len(cols) > 1 else values[0]
+        stmt = stmt.filter(key < bound if descending else key > bound)
+    order = [c.desc() if descending else c.asc() for c in cols]
+    return stmt.order_by(*order).limit(limit + 1)
+
+def page(rows, limit: int, sort_attr: str | None = None, id_attr: str = "id"):
+    """Trim the extra row fetched by keyset() and build the next cursor"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    values = ([getattr(last, sort_attr)] if sort_attr else []) + [getattr(last, id_attr)]
+    return rows, encode_cursor(values)
+
+def set_next_cursor(response: Response, next_cursor: str | None):
+    """List endpoints keep a plain JSON array body; the cursor goes in a header"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+
+# ==========================================
+#  TOTALS
+# ==========================================
+
+def count_total(db, query, mode: str = "exact"):
+    """Returns (total, is_estimate). mode: exact | approx | none"""
+    if mode == "none":
+        return None, True
+    if mode == "exact":
+        return query.order_by(None).count(), False
+    if db.bind.dialect.name == "postgresql":
+        # planner row estimate: no table scan. Sent with the driver's own bind parameters rather
+        # than literals through text(), which would read a ":word" inside a search term as a bind
+        compiled = query.order_by(None).statement.compile(db.bind, compile_kwargs={"render_postcompile": True})
+        plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+        return int(plan[0]["Plan"]["Plan Rows"]), True
+    capped = query.order_by(None).limit(APPROX_COUNT_CAP + 1).subquery()
+    n = db.execute(select(func.count()).select_from(capped)).scalar()
+    return min(n, APPROX_COUNT_CAP), n > APPROX_COUNT_CAP
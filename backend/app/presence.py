@@ -0,0 +1,224 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from . import models
+from .database import SessionLocal
+
+ONLINE_WINDOW = int(os.getenv("PRESENCE_ONLINE_WINDOW", "300"))  # seconds
+FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "30"))
+
+# touch() default: seen now, current activity left as it is
+_KEEP = object()
+
+
+class PresenceRegistry:
+    """Who is online / studying, kept in memory.
+
+    Entries are ordered by last_seen (oldest first) so expiring offline users is
+    a pop from the front. last_login/current_activity are written back to the
+    users table in one batched UPDATE every FLUSH_INTERVAL seconds, and the same
+    cycle merges in users seen by other worker processes.
+
+    Listeners added with add_listener() are called as fn(user_id, online,
+    activity) whenever a user comes online, goes offline or changes activity.
+    They run under the registry lock, so they must only hand the change off.
+    """
+
+    def __init__(self, window: int = ONLINE_WINDOW, flush_interval: float = FLUSH_INTERVAL):
+        self.window = timedelta(seconds=window)
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()  # user_id -> (last_seen, activity)
+        self._dirty = {}
+        self._studying = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    # --- reads ---
+    def _prune(self, now: datetime):
+        limit = now - self.window
+        while self._entries:
+            uid, (seen, activity) = next(iter(self._entries.items()))
+            if seen >= limit:
+                break
+            self._entries.popitem(last=False)
+            if activity:
+                self._studying -= 1
+            self._notify(uid, False, None)
+
+    def _notify(self, user_id: int, online: bool, activity):
+        for fn in self._listeners:
+            try:
+                fn(user_id, online, activity)
+            except Exception as e:
+                print(f"⚠️ presence listener failed: {e}")
+
+    def add_listener(self, fn):
+        if fn not in self._listeners:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def is_online(self, user_id: int) -> bool:
+        with self._lock:
+            item = self._entries.get(user_id)
+            return item is not None and item[0] >= datetime.utcnow() - self.window
+
+    def activity(self, user_id: int):
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None or item[0] < datetime.utcnow() - self.window:
+                return None
+            return item[1]
+
+    def online_count(self) -> int:
+        with self._lock:
+            self._prune(datetime.utcnow())
+            return len(self._entries)
+
+    def studying_count(self) -> int:
+        with self._lock:
+            self._prune(datetime.utcnow())
+            return self._studying
+
+    def online_ids(self) -> list:
+        with self._lock:
+            self._prune(datetime.utcnow())
+            return list(self._entries)
+
+    def studying_ids(self) -> list:
+        with self._lock:
+            self._prune(datetime.utcnow())
+            return [uid for uid, (_, activity) in self._entries.items() if activity]
+
+    # --- writes ---
+    def _put(self, user_id: int, seen: datetime, activity):
+        old = self._entries.pop(user_id, None)
+        if old is not None and old[1]:
+            self._studying -= 1
+        self._entries[user_id] = (seen, activity)
+        if activity:
+            self._studying += 1
+        if old is None or old[1] != activity:
+            self._notify(user_id, True, activity)
+
+    def touch(self, user_id: int, activity=_KEEP):
+        """Mark the user as seen now; pass activity (None clears it) to change what they are doing"""
+        now = datetime.utcnow()
+        with self._lock:
+            self._prune(now)
+            if activity is _KEEP:
+                pending = self._dirty.get(user_id)
+                if pending is not None:
+                    activity = pending[1]  # an explicit change not flushed yet still has to be written
+                item = self._entries.get(user_id)
+                self._put(user_id, now, item[1] if item is not None else None)
+            else:
+                self._put(user_id, now, activity)
+            self._dirty[user_id] = (now, activity)
+
+    def expire(self) -> int:
+        """Drop users whose window has passed (listeners hear them go offline); returns the online count"""
+        return self.online_count()
+
+    # --- database sync ---
+    def flush(self, db=None):
+        """Write pending last_login/current_activity values in one batch"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        own = db is None
+        db = db or SessionLocal()
+        changed = [{"id": uid, "last_login": seen, "current_activity": activity}
+                   for uid, (seen, activity) in dirty.items() if activity is not _KEEP]
+        seen_only = [{"id": uid, "last_login": seen} for uid, (seen, activity) in dirty.items() if activity is _KEEP]
+        try:
+            for rows in (changed, seen_only):
+                if rows:
+                    db.execute(update(models.User), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # keep the rows for the next cycle unless they were touched again meanwhile
+            with self._lock:
+                for uid, item in dirty.items():
+                    self._dirty.setdefault(uid, item)
+            raise
+        finally:
+            if own:
+                db.close()
+        self.flushes += 1
+        self.flushed_rows += len(dirty)
+        return len(dirty)
+
+    def load(self, db):
+        """Merge users recently seen according to the database (other workers, restarts)"""
+        now = datetime.utcnow()
+        rows = db.execute(
+            select(models.User.id, models.User.last_login, models.User.current_activity)
+            .where(models.User.last_login >= now - self.window)
+        ).all()
+        with self._lock:
+            # expired entries go first so returning users are reported as coming online
+            self._prune(now)
+            changed = False
+            for uid, seen, activity in rows:
+                item = self._entries.get(uid)
+                if item is None or item[0] < seen:
+                    self._put(uid, seen, activity)
+                    changed = True
+            if changed:
+                # restore last_seen ordering after out-of-order inserts
+                ordered = sorted(self._entries.items(), key=lambda kv: kv[1][0])
+                self._entries = OrderedDict(ordered)
+            self._prune(now)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                with SessionLocal() as db:
+                    self.flush(db)
+                    self.load(db)
+            except Exception as e:
+                print(f"⚠️ presence flush failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        try:
+            with SessionLocal() as db:
+                self.load(db)
+        except Exception as e:
+            print(f"⚠️ presence warm-up failed: {e}")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="presence-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "online": self.online_count(),
+            "studying": self.studying_count(),
+            "pending_writes": len(self._dirty),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
+
+
+presence = PresenceRegistry()
@@ -0,0 +1,127 @@
+import os
+import threading
+from datetime import datetime
+
+from . import models
+from .database import SessionLocal, dialect_insert
+
+FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "10"))
+# flush early when this many (user, lesson) positions are waiting
+MAX_PENDING = int(os.getenv("PROGRESS_MAX_PENDING", "50000"))
+
+
+def upsert_progress(db, rows: list, update_cols: tuple, overrides: dict | None = None, returning=None):
+    """INSERT ... ON CONFLICT (user_id, lesson_id) DO UPDATE as one statement.
+
+    rows are full progress rows; on conflict the existing row takes
+    `update_cols` from the new values and `overrides` (column -> expression).
+    With `returning`, rows must hold a single row and that column is returned.
+    """
+    stmt = dialect_insert(db)(models.Progress)
+    values = {col: stmt.excluded[col] for col in update_cols}
+    values.update(overrides or {})
+    stmt = stmt.on_conflict_do_update(index_elements=["user_id", "lesson_id"], set_=values)
+    if returning is not None:
+        return db.execute(stmt.returning(returning), rows[0]).scalar()
+    db.execute(stmt, rows)
+
+
+class ProgressBuffer:
+    """Write-behind buffer for playback position heartbeats.
+
+    Heartbeats are coalesced per (user_id, lesson_id) keeping only the latest
+    position, and written to `progress.seconds_watched` in one batched upsert
+    every FLUSH_INTERVAL seconds and at shutdown. Reads check the buffer first,
+    so a viewer resuming on the same worker never sees a stale position; other
+    workers lag by at most one flush interval.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}  # (user_id, lesson_id) -> (seconds, at)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.heartbeats = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def record(self, user_id: int, lesson_id: int, seconds: int):
+        with self._lock:
+            self._pending[(user_id, lesson_id)] = (seconds, datetime.utcnow())
+            self.heartbeats += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def get(self, user_id: int, lesson_id: int) -> int | None:
+        with self._lock:
+            item = self._pending.get((user_id, lesson_id))
+        return item[0] if item else None
+
+    def flush(self, db=None) -> int:
+        """Upsert all pending positions in a single executemany statement"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        own = db is None
+        db = db or SessionLocal()
+        try:
+            upsert_progress(db, [
+                {"user_id": uid, "lesson_id": lid, "completed": False, "seconds_watched": seconds, "last_updated": at}
+                for (uid, lid), (seconds, at) in pending.items()
+            ], ("seconds_watched", "last_updated"))
+            db.commit()
+        except Exception:
+            db.rollback()
+            # put positions back unless a newer heartbeat arrived meanwhile
+            with self._lock:
+                for key, item in pending.items():
+                    self._pending.setdefault(key, item)
+            raise
+        finally:
+            if own:
+                db.close()
+        self.flushes += 1
+        self.flushed_rows += len(pending)
+        return len(pending)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ progress flush failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="progress-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "heartbeats": self.heartbeats,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
+
+
+progress_buffer = ProgressBuffer()
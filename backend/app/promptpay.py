@@ -1,8 +1,4 @@
-import qrcode
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
-from io import BytesIO
-from PIL import Image # เพิ่มบรรทัดนี้เพื่อใช้ Type Hint
+# qrcode / PIL are imported inside make_qr_image so importing the API stays cheap
 
 # ✅ ฟังก์ชันคำนวณ CRC16 (XMODEM)
 def crc16(data: bytes):
@@ -51,6 +47,10 @@ def make_qr_image(promptpay_id: str, amount: float = 0.0):
     full_payload = raw_data + f"{crc_val:04X}"
 
     # Generate QR Image
+    import qrcode
+    from qrcode.image.styledpil import StyledPilImage
+    from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
+
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional, Any, Dict
 from datetime import datetime
 
@@ -91,6 +91,7 @@ class CourseUpdate(BaseModel):
 class CourseRead(CourseBase):
     id: int
     total_lessons: int = 0
+    total_duration: int = 0
     created_at: Optional[datetime] = None
     
     class Config:
@@ -137,21 +138,55 @@ class LessonRead(LessonBase):
 class LessonOut(LessonRead):
     pass
 
+class ChapterDetailRead(ChapterRead):
+    lessons: List[LessonRead] = []
+
+class CourseDetailRead(CourseRead):
+    chapters: List[ChapterDetailRead] = []
+
+class SearchHit(BaseModel):
+    kind: str  # "course" | "lesson"
+    id: int
+    course_id: Optional[int] = None
+    title: Optional[str] = None
+    score: float
+
 # --- Enrollment & Progress ---
 class EnrollmentRead(BaseModel):
     id: int
     course_id: int
     user_id: int
     enrolled_at: datetime
+    completed_lessons: int = 0
+    total_lessons: int = 0
+    percent_complete: float = 0.0
     class Config: from_attributes = True
 
 class ProgressUpdate(BaseModel):
     seconds_watched: int
     completed: bool = False
 
+class ProgressHeartbeat(BaseModel):
+    seconds: int
+
 class StudyTimeCreate(BaseModel):
     minutes: int
 
+class StudyEvent(BaseModel):
+    minutes: int = Field(ge=1, le=60)
+    at: Optional[datetime] = None  # when it happened on the client; the server time if omitted
+    lesson_id: Optional[int] = None
+    activity: Optional[str] = None
+
+class StudyEventBatch(BaseModel):
+    events: List[StudyEvent] = Field(min_length=1, max_length=500)
+
+class StudyEventResult(BaseModel):
+    accepted: int
+    duplicates: int
+    skipped: int
+    total_minutes: int
+
 # --- Friends ---
 class FriendRead(BaseModel):
     id: int
@@ -161,6 +196,16 @@ class FriendRead(BaseModel):
     avatar_url: Optional[str]
     is_online: bool = False
     current_activity: Optional[str] = None
+    mutual_friends: int = 0
+    class Config: from_attributes = True
+
+class FriendSuggestion(BaseModel):
+    id: int
+    full_name: Optional[str]
+    nickname: Optional[str]
+    avatar_url: Optional[str]
+    mutual_friends: int = 0
+    shared_courses: int = 0
     class Config: from_attributes = True
 
 class FriendRequest(BaseModel):
@@ -170,16 +215,47 @@ class FriendRequest(BaseModel):
 class CommentCreate(BaseModel):
     text: str
 
+class CommentAuthor(BaseModel):
+    # only what the comment list shows
+    id: int
+    full_name: Optional[str] = None
+    class Config: from_attributes = True
+
 class CommentRead(BaseModel):
     id: int
     user_id: int
     text: str
     created_at: datetime
-    user: UserRead
+    user: Optional[CommentAuthor] = None
     class Config: from_attributes = True
 
 class RatingCreate(BaseModel):
-    score: int
+    score: int = Field(ge=1, le=5)
+
+class LessonRatingSummary(BaseModel):
+    lesson_id: int
+    avg: float
+    count: int
+    my: int = 0  # 0 = not rated by me
+
+class CourseRatings(BaseModel):
+    course_id: int
+    avg: float
+    count: int
+    lessons: List[LessonRatingSummary] = []
+
+class LearningRoomState(BaseModel):
+    """LearningRoom without the course, which is spliced in pre-serialized"""
+    lesson_id: Optional[int]  # None for a course without lessons
+    completed_ids: List[int]
+    seconds: int  # resume position in the lesson
+    comment_count: int
+    comments: List[CommentRead]  # newest first page
+    comments_next_cursor: Optional[str] = None
+    ratings: CourseRatings
+
+class LearningRoom(LearningRoomState):
+    course: CourseDetailRead
 
 # --- Coupons ---
 class CouponBase(BaseModel):
@@ -297,9 +373,20 @@ class ExamSubmit(BaseModel):
 class LeaderboardItem(BaseModel):
     id: int
     full_name: str
+    nickname: Optional[str] = None
     avatar_url: Optional[str] = None
     completed_count: int
     total_minutes: int
+    rank: int = 0
+    score: int = 0  # what the board ranks by: minutes, or completed lessons on a course board
+
+class LeaderboardMe(BaseModel):
+    scope: str
+    key: Optional[str] = None
+    rank: Optional[int] = None
+    score: int = 0
+    total: int = 0
+    around: List[LeaderboardItem] = []
 
 class BadgeOut(BaseModel):
     id: str
@@ -0,0 +1,192 @@
+import os
+import re
+
+from sqlalchemy import select, text
+
+from . import models
+
+# "auto" = pythainlp word segmentation when installed, otherwise Thai character bigrams.
+# The index and the queries must use the same segmenter: after changing it run
+#   python manage.py reindex-search
+SEARCH_SEGMENTER = os.getenv("SEARCH_SEGMENTER", "auto")
+MAX_QUERY_TERMS = 8
+
+FTS_TABLE = "search_fts"        # SQLite FTS5
+DOC_TABLE = "search_documents"  # Postgres tsvector + GIN
+
+# rowid / ref encoding for SQLite: one integer key per (kind, id), so updates hit the rowid index
+KINDS = {"course": 0, "lesson": 1}
+
+_TERM = re.compile(r"([\u0e00-\u0e7f]+)|([^\W_]+)")
+
+
+# ==========================================
+#  TOKENIZATION
+# ==========================================
+
+_thai_words = None
+
+def _thai_segmenter():
+    global _thai_words
+    if _thai_words is None:
+        _thai_words = _bigrams
+        if SEARCH_SEGMENTER in ("auto", "pythainlp"):
+            try:
+                from pythainlp.tokenize import word_tokenize  # optional, heavy: loaded on first use
+                _thai_words = lambda run: [w for w in word_tokenize(run, engine="newmm") if w.strip()]
+            except ImportError:
+                if SEARCH_SEGMENTER == "pythainlp":
+                    raise
+    return _thai_words
+
+def _bigrams(run: str) -> list:
+    # Thai has no spaces between words; overlapping bigrams + phrase queries find any substring
+    if len(run) < 2:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+def terms(value: str | None) -> list:
+    """Split text into terms; a Thai run becomes one term of several tokens (matched as a phrase)"""
+    out = []
+    for thai, other in _TERM.findall(value or ""):
+        if thai:
+            out.append(_thai_segmenter()(thai))
+        else:
+            out.append([other.lower()])
+    return out
+
+def tokens(*values) -> str:
+    return " ".join(tok for v in values for term in terms(v) for tok in term)
+
+
+def _fts_query(q: str) -> str | None:
+    parts = []
+    found = terms(q)[:MAX_QUERY_TERMS]
+    for i, term in enumerate(found):
+        phrase = '"' + " ".join(term) + '"'
+        # search-as-you-type: the last single-token term also matches as a prefix
+        if i == len(found) - 1 and len(term) == 1:
+            phrase += "*"
+        parts.append(phrase)
+    return " ".join(parts) or None
+
+def _ts_query(q: str) -> str | None:
+    parts = []
+    found = terms(q)[:MAX_QUERY_TERMS]
+    for i, term in enumerate(found):
+        part = " <-> ".join(term)
+        if i == len(found) - 1 and len(term) == 1:
+            part += ":*"
+        parts.append(f"({part})")
+    return " & ".join(parts) or None
+
+
+# ==========================================
+#  INDEX MAINTENANCE
+#  `conn` is a Session or a Connection; callers own the transaction
+# ==========================================
+
+def _dialect(conn) -> str:
+    return conn.get_bind().dialect.name if hasattr(conn, "get_bind") else conn.dialect.name
+
+def _rowid(kind: str, ref_id: int) -> int:
+    return ref_id * len(KINDS) + KINDS[kind]
+
+def _course_doc(c) -> dict:
+    return {
+        "kind": "course", "ref_id": c.id, "course_id": c.id, "title": c.title,
+        "head": tokens(c.title, c.category), "body": tokens(c.description, c.highlights),
+    }
+
+def _lesson_doc(l, course_id: int) -> dict:
+    return {"kind": "lesson", "ref_id": l.id, "course_id": course_id, "title": l.title, "head": tokens(l.title), "body": ""}
+
+def _write(conn, docs: list):
+    if not docs:
+        return
+    if _dialect(conn) == "postgresql":
+        conn.execute(text(
+            f"INSERT INTO {DOC_TABLE} (kind, ref_id, course_id, title, tsv) VALUES (:kind, :ref_id, :course_id, :title, "
+            "setweight(to_tsvector('simple', :head), 'A') || setweight(to_tsvector('simple', :body), 'B')) "
+            "ON CONFLICT (kind, ref_id) DO UPDATE SET course_id = EXCLUDED.course_id, title = EXCLUDED.title, tsv = EXCLUDED.tsv"
+        ), docs)
+    else:
+        rows = [{**d, "rowid": _rowid(d["kind"], d["ref_id"])} for d in docs]
+        conn.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), rows)
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, head, body, kind, ref_id, course_id, title) "
+            "VALUES (:rowid, :head, :body, :kind, :ref_id, :course_id, :title)"
+        ), rows)
+
+def index_course(conn, course):
+    _write(conn, [_course_doc(course)])
+
+def index_lesson(conn, lesson, course_id: int | None = None):
+    if course_id is None:
+        course_id = conn.execute(select(models.Chapter.course_id).where(models.Chapter.id == lesson.chapter_id)).scalar()
+    _write(conn, [_lesson_doc(lesson, course_id)])
+
+def remove_lesson(conn, lesson_id: int):
+    if _dialect(conn) == "postgresql":
+        conn.execute(text(f"DELETE FROM {DOC_TABLE} WHERE kind = 'lesson' AND ref_id = :id"), {"id": lesson_id})
+    else:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": _rowid("lesson", lesson_id)})
+
+def remove_course(conn, course_id: int):
+    """Drops the course and all of its lessons"""
+    table = DOC_TABLE if _dialect(conn) == "postgresql" else FTS_TABLE
+    conn.execute(text(f"DELETE FROM {table} WHERE course_id = :id"), {"id": course_id})
+
+def rebuild(conn, batch: int = 5000) -> int:
+    """Re-index every course and lesson; returns the number of documents"""
+    table = DOC_TABLE if _dialect(conn) == "postgresql" else FTS_TABLE
+    conn.execute(text(f"DELETE FROM {table}"))
+    n = 0
+    courses = conn.execute(select(models.Course.id, models.Course.title, models.Course.category,
+                                  models.Course.description, models.Course.highlights)).all()
+    for i in range(0, len(courses), batch):
+        _write(conn, [_course_doc(c) for c in courses[i:i + batch]])
+    n += len(courses)
+
+    res = conn.execute(
+        select(models.Lesson.id, models.Lesson.title, models.Chapter.course_id)
+        .join(models.Chapter, models.Chapter.id == models.Lesson.chapter_id)
+        .execution_options(yield_per=batch)
+    )
+    for part in res.partitions(batch):
+        _write(conn, [_lesson_doc(l, l.course_id) for l in part])
+        n += len(part)
+    return n
+
+
+# ==========================================
+#  QUERY
+# ==========================================
+
+def search(conn, q: str, limit: int = 20, kind: str | None = None) -> list:
+    """Ranked hits: [{kind, id, course_id, title, score}], best first.
+
+    Every match is ranked (a top-`limit` sort, not a full one), with a fixed
+    tie-break so equal scores come back in the same order on every call.
+    """
+    params = {"limit": limit, "kind": kind}
+    kind_filter = "AND kind = :kind" if kind else ""
+    if _dialect(conn) == "postgresql":
+        params["q"] = _ts_query(q)
+        if not params["q"]:
+            return []
+        rows = conn.execute(text(
+            f"SELECT kind, ref_id, course_id, title, ts_rank_cd(tsv, query) AS score "
+            f"FROM {DOC_TABLE}, to_tsquery('simple', :q) AS query WHERE tsv @@ query {kind_filter} "
+            f"ORDER BY score DESC, kind, ref_id LIMIT :limit"
+        ), params).all()
+    else:
+        params["q"] = _fts_query(q)
+        if not params["q"]:
+            return []
+        # rank = bm25 with head (titles, category) weighing 10x the body, see r0002; lower is better
+        rows = conn.execute(text(
+            f"SELECT kind, ref_id, course_id, title, -rank AS score FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH :q {kind_filter} ORDER BY rank, rowid LIMIT :limit"
+        ), params).all()
+    return [{"kind": k, "id": i, "course_id": c, "title": t, "score": float(s)} for k, i, c, t, s in rows]
@@ -0,0 +1,44 @@
+import os
+import time
+from contextlib import contextmanager
+
+# "check"  = compare schema_migrations with head, build/upgrade only when behind (default)
+# "create" = legacy Base.metadata.create_all on every start
+# "off"    = trust the database, do nothing
+STARTUP_SCHEMA_MODE = os.getenv("STARTUP_SCHEMA_MODE", "check")
+
+# phase name -> milliseconds, in the order the phases ran
+timings = {}
+
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+
+def record(name: str, started: float):
+    timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def ensure_schema(engine, metadata, mode: str = STARTUP_SCHEMA_MODE):
+    """Cheap schema-version check instead of running create_all on every boot"""
+    from . import migrations
+
+    if mode == "off":
+        return
+    if mode == "create":
+        metadata.create_all(bind=engine)
+        return
+    if migrations.current_version(engine) >= migrations.head():
+        return
+    # New or not-yet-migrated database: create missing tables, then apply revisions.
+    # Data rebuilds on a populated database are left to `manage.py migrate` so a worker's
+    # boot never holds the write lock for one; the worker refuses to serve a stale schema.
+    migrations.upgrade(engine, metadata=metadata, heavy=False)
+    version, head = migrations.current_version(engine), migrations.head()
+    if version < head:
+        raise RuntimeError(f"database schema is at {version:04d}, code needs {head:04d}: run `python manage.py migrate`")
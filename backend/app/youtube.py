@@ -0,0 +1,154 @@
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import or_, select, update
+
+from . import models
+from .catalog import catalog
+from .database import SessionLocal
+
+# {id} is replaced with the video id; point it at a local stub server in tests
+YOUTUBE_WATCH_URL = os.getenv("YOUTUBE_WATCH_URL", "https://www.youtube.com/watch?v={id}")
+YOUTUBE_TIMEOUT = float(os.getenv("YOUTUBE_TIMEOUT", "5"))
+# a failed id is not fetched again for this many seconds
+YOUTUBE_RETRY_SECONDS = float(os.getenv("YOUTUBE_RETRY_SECONDS", "600"))
+
+_LENGTH = re.compile(r'"lengthSeconds":"(\d+)"')
+
+
+def fetch_duration(video_id: str) -> int | None:
+    """Video length in minutes from the watch page, None when it cannot be resolved"""
+    import urllib.request
+
+    url = YOUTUBE_WATCH_URL.format(id=video_id)
+    try:
+        with urllib.request.urlopen(url, timeout=YOUTUBE_TIMEOUT) as response:
+            match = _LENGTH.search(response.read().decode(errors="replace"))
+    except Exception:
+        return None
+    # at least a minute: 0 means "unknown" to lessons and would send short clips back to the queue forever
+    return max(round(int(match.group(1)) / 60), 1) if match else None
+
+
+class DurationResolver:
+    """Resolves lesson durations off the request path.
+
+    Lessons are saved right away with whatever the youtube_durations cache
+    knows (0 when nothing); unknown ids go on a queue, a background thread
+    fetches them, stores the result in the cache and patches every lesson with
+    that youtube_id that still has no duration. `fetcher` is any callable
+    video_id -> minutes | None.
+    """
+
+    def __init__(self, fetcher=fetch_duration, retry_seconds: float = YOUTUBE_RETRY_SECONDS):
+        self.fetcher = fetcher
+        self.retry_seconds = retry_seconds
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._failed = {}  # youtube_id -> monotonic time of the last failure
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.fetched = 0
+        self.failures = 0
+        self.patched_lessons = 0
+
+    # --- request path ---
+    def cached(self, db, youtube_id: str) -> int | None:
+        row = db.get(models.YoutubeDuration, youtube_id)
+        # 0 rows predate the one-minute floor; fetching them once more replaces them
+        return row.duration if row and row.duration else None
+
+    def enqueue(self, youtube_id: str):
+        with self._lock:
+            if youtube_id in self._queued:
+                return
+            failed_at = self._failed.get(youtube_id)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+                return
+            self._queued.add(youtube_id)
+        self._queue.put(youtube_id)
+
+    # --- worker ---
+    def resolve(self, youtube_id: str, db=None) -> int | None:
+        """Cache lookup, else fetch + store; then patch lessons. Returns minutes or None"""
+        own = db is None
+        db = db or SessionLocal()
+        try:
+            duration = self.cached(db, youtube_id)
+            if duration is None:
+                duration = self.fetcher(youtube_id)
+                if duration is None:
+                    self.failures += 1
+                    with self._lock:
+                        self._failed[youtube_id] = time.monotonic()
+                    return None
+                self.fetched += 1
+                db.merge(models.YoutubeDuration(youtube_id=youtube_id, duration=duration, fetched_at=datetime.utcnow()))
+            res = db.execute(
+                update(models.Lesson)
+                .where(models.Lesson.youtube_id == youtube_id)
+                .where(or_(models.Lesson.duration == None, models.Lesson.duration == 0))
+                .values(duration=duration)
+            )
+            db.commit()
+            if res.rowcount and duration:
+                self.patched_lessons += res.rowcount
+                catalog.bump(db)
+            return duration
+        finally:
+            with self._lock:
+                self._queued.discard(youtube_id)
+            if own:
+                db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                youtube_id = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.resolve(youtube_id)
+            except Exception as e:
+                print(f"⚠️ youtube duration {youtube_id} failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # pick up lessons left unresolved by a previous run (the queue lives in memory)
+        try:
+            with SessionLocal() as db:
+                pending = db.scalars(
+                    select(models.Lesson.youtube_id).distinct()
+                    .where(or_(models.Lesson.duration == None, models.Lesson.duration == 0))
+                    .where(models.Lesson.youtube_id != None, models.Lesson.youtube_id != "")
+                ).all()
+            for youtube_id in pending:
+                self.enqueue(youtube_id)
+        except Exception as e:
+            print(f"⚠️ youtube duration warm-up failed: {e}")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="youtube-durations", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "fetched": self.fetched,
+            "failures": self.failures,
+            "patched_lessons": self.patched_lessons,
+        }
+
+
+duration_resolver = DurationResolver()
@@ -3,15 +3,22 @@
 Simple dev helper:
   python manage.py upgrade
   python manage.py promote-admin <email>
+  python manage.py migrate [<version>]
+  python manage.py migrations
+  python manage.py reindex-search
+  python manage.py backfill-study-daily
+  python manage.py check-completion [--fix]
+  python manage.py backfill-badges [<badge id> ...]
 """
 import os, sys, sqlite3
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
-if DB_URL.startswith("sqlite:///"):
-    DB_PATH = DB_URL.replace("sqlite:///", "", 1)
-else:
-    print("This helper supports only SQLite in dev.", file=sys.stderr)
-    sys.exit(1)
+DB_PATH = DB_URL.replace("sqlite:///", "", 1) if DB_URL.startswith("sqlite:///") else None
+
+def require_sqlite():
+    if DB_PATH is None:
+        print("This helper supports only SQLite in dev.", file=sys.stderr)
+        sys.exit(1)
 
 NEW_COLUMNS = [
     ("role", "TEXT NOT NULL DEFAULT 'student'"),
@@ -22,6 +29,7 @@ NEW_COLUMNS = [
 ]
 
 def upgrade():
+    require_sqlite()
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.cursor()
@@ -37,6 +45,7 @@ def upgrade():
         conn.close()
 
 def promote_admin(email: str):
+    require_sqlite()
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.cursor()
@@ -49,6 +58,69 @@ def promote_admin(email: str):
     finally:
         conn.close()
 
+def migrate(target: str | None = None):
+    # Versioned migrations work on any DATABASE_URL (SQLite or Postgres)
+    from app.database import engine
+    from app import migrations
+    done = migrations.upgrade(engine, int(target) if target else None)
+    print(f"Applied {len(done)} revision(s). Current version: {migrations.current_version(engine)}")
+
+def show_migrations():
+    from app.database import engine
+    from app import migrations
+    for version, name, applied in migrations.status(engine):
+        print(f"{version:04d} {name:<40} {'applied' if applied else 'pending'}")
+
+def reindex_search():
+    from app.database import engine
+    from app import search
+    with engine.begin() as conn:
+        print(f"Indexed {search.rebuild(conn)} documents.")
+
+def backfill_study_daily():
+    from app.database import engine
+    from app import crud
+    with engine.begin() as conn:
+        print(f"Rolled up {crud.rebuild_study_daily(conn)} study logs.")
+
+def check_completion(fix: bool):
+    from app.database import engine
+    from app import crud
+    with engine.begin() as conn:
+        checked, wrong = crud.check_completion_counters(conn, fix=fix)
+    print(f"{checked} enrollments checked, {wrong} counters {'fixed' if fix else 'out of date'}.")
+
+def backfill_badges(badge_ids: list):
+    # evaluates the given rules (those not backfilled yet when none given) over the whole history;
+    # run once per deploy that adds a rule, unlocks are committed chunk by chunk
+    import time
+    from app.database import engine
+    from app import badges
+    unknown = set(badge_ids) - set(badges.RULES)
+    if unknown:
+        print(f"No rule for: {', '.join(sorted(unknown))}", file=sys.stderr)
+        sys.exit(1)
+    t0, last, started, prev = time.perf_counter(), [0.0], {}, [time.perf_counter()]
+
+    def progress(source, done, total):
+        now = time.perf_counter()
+        began = started.setdefault(source, prev[0])  # a source starts where the previous chunk ended
+        prev[0] = now
+        if now - last[0] >= 2 or done == total:
+            last[0] = now
+            pct = f" ({done * 100 / total:.0f}%)" if total else ""
+            print(f"  {source:<12} {done:>12,} / {total or 0:,}{pct}  {done / (now - began):,.0f} rows/s", flush=True)
+
+    if not badge_ids:
+        with engine.connect() as conn:
+            badge_ids = badges.pending_rules(conn)
+        if not badge_ids:
+            print("Every badge rule is backfilled already.")
+            return
+        print(f"Backfilling {', '.join(badge_ids)}")
+    n = badges.run_backfill(engine, badge_ids, progress=progress)
+    print(f"Wrote {n} new badge unlocks in {time.perf_counter() - t0:.1f}s.")
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print(__doc__)
@@ -58,5 +130,17 @@ if __name__ == "__main__":
         upgrade()
     elif cmd == "promote-admin" and len(sys.argv) == 3:
         promote_admin(sys.argv[2])
+    elif cmd == "migrate":
+        migrate(sys.argv[2] if len(sys.argv) == 3 else None)
+    elif cmd == "migrations":
+        show_migrations()
+    elif cmd == "reindex-search":
+        reindex_search()
+    elif cmd == "backfill-study-daily":
+        backfill_study_daily()
+    elif cmd == "check-completion":
+        check_completion("--fix" in sys.argv[2:])
+    elif cmd == "backfill-badges":
+        backfill_badges(sys.argv[2:])
     else:
         print(__doc__)
@@ -0,0 +1,61 @@
+# backend/tools/bench_async_load.py
+"""
+Load test for the read-heavy public endpoints.
+
+  uvicorn app.main:app --port 8000 &
+  python tools/bench_async_load.py --url http://127.0.0.1:8000 --clients 500 --seconds 20
+
+Run it once against a build with the sync routes and once against this one to
+compare requests/sec. /lessons/{id}/comments needs a token (--token).
+"""
+import argparse, asyncio, time
+
+import httpx
+
+
+async def client_loop(client, paths, stop, stats, headers):
+    i = 0
+    while time.perf_counter() < stop:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            r = await client.get(path, headers=headers)
+            ok = r.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        stats["latencies"].append(time.perf_counter() - t0)
+        stats["ok" if ok else "errors"] += 1
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--clients", type=int, default=500)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--course-id", type=int, default=1)
+    ap.add_argument("--lesson-id", type=int, default=1)
+    ap.add_argument("--token", default=None)
+    args = ap.parse_args()
+
+    paths = ["/courses", f"/courses/{args.course_id}", "/leaderboard", "/settings"]
+    headers = {}
+    if args.token:
+        paths.append(f"/lessons/{args.lesson_id}/comments")
+        headers["Authorization"] = f"Bearer {args.token}"
+
+    stats = {"ok": 0, "errors": 0, "latencies": []}
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        stop = time.perf_counter() + args.seconds
+        await asyncio.gather(*[client_loop(client, paths, stop, stats, headers) for _ in range(args.clients)])
+
+    lat = sorted(stats["latencies"]) or [0.0]
+    pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1000
+    print(f"clients={args.clients} seconds={args.seconds}")
+    print(f"requests/sec: {stats['ok'] / args.seconds:.1f}  errors: {stats['errors']}")
+    print(f"latency ms: p50={pct(0.50):.1f} p95={pct(0.95):.1f} p99={pct(0.99):.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+# backend/tools/bench_badge_backfill.py
+"""
+Badge backfill throughput over a generated study history.
+
+  python tools/bench_badge_backfill.py [--users 100000] [--logs 5000000] [--baseline 1000000]
+
+Builds a temporary SQLite database with `--users` users and `--logs` study
+logs spread over two years, then times:
+
+  per-row   the first `--baseline` logs read as datetimes and passed one by
+            one through each rule's live check() (what re-running the event
+            path over history costs)
+  vector    badges.run_backfill() over everything: numpy chunks, bulk unlock
+            writes committed per chunk, while another thread keeps writing
+            study logs (the slowest of those writes is reported)
+
+Reports rows/s, peak RSS and the projected time for 50M logs.
+"""
+import argparse, os, random, resource, sys, tempfile, threading, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+
+from app import badges, models
+from app.database import Base, make_engine
+
+
+def build(path: str, users: int, logs: int, chunk: int = 200_000):
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(1)
+    start = datetime(2024, 10, 1)
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": i, "email": f"u{i}@bench", "hashed_password": "x", "total_minutes": rnd.randint(0, 500)}
+            for i in range(1, users + 1)
+        ])
+        for lo in range(0, logs, chunk):
+            conn.execute(insert(models.StudyLog), [
+                {"user_id": rnd.randint(1, users), "minutes": 1,
+                 "created_at": start + timedelta(seconds=rnd.randrange(730 * 86400))}
+                for _ in range(min(chunk, logs - lo))
+            ])
+    print(f"generated {users:,} users, {logs:,} study logs in {time.perf_counter() - t0:.1f}s ({path})")
+    return engine
+
+
+def per_row(engine, limit: int) -> float:
+    checks = [check for events, check, _ in badges.RULES.values() if "study" in events]
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        rows = conn.execute(select(models.StudyLog.user_id, models.StudyLog.created_at).limit(limit).execution_options(yield_per=100_000))
+        for part in rows.partitions():
+            for user_id, at in part:
+                for check in checks:
+                    check({"times": [at]})
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--logs", type=int, default=5_000_000)
+    ap.add_argument("--baseline", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    engine = build(os.path.join(tempfile.mkdtemp(), "bench_badges.db"), args.users, args.logs)
+    n = min(args.baseline, args.logs)
+    secs = per_row(engine, n)
+    print(f"per-row : {n:,} logs in {secs:.1f}s = {n / secs:>10,.0f} logs/s -> 50M in {50e6 / (n / secs) / 60:.1f} min")
+
+    with engine.begin() as conn:
+        conn.execute(delete(models.UserBadge))
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stop, waits = threading.Event(), []
+
+    def writer():
+        while not stop.wait(0.01):
+            t = time.perf_counter()
+            with engine.begin() as conn:
+                conn.execute(insert(models.StudyLog), [{"user_id": 1, "minutes": 1, "created_at": datetime.utcnow()}])
+            waits.append(time.perf_counter() - t)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    t0 = time.perf_counter()
+    try:
+        unlocks = badges.run_backfill(engine)
+    finally:
+        stop.set()
+        thread.join()
+    secs = time.perf_counter() - t0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"vector  : {args.logs:,} logs in {secs:.1f}s = {args.logs / secs:>10,.0f} logs/s -> 50M in {50e6 / (args.logs / secs) / 60:.1f} min")
+    print(f"          {unlocks:,} unlocks written, peak RSS {rss / 1024:.0f} MB (was {rss0 / 1024:.0f} MB before the run)")
+    print(f"          {len(waits):,} concurrent writes, slowest {max(waits, default=0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
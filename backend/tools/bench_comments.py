@@ -0,0 +1,116 @@
+# backend/tools/bench_comments.py
+"""
+First-page latency of a lesson's comments.
+
+  python tools/bench_comments.py [--comments 100000] [--users 20000] [--runs 200]
+
+Builds a temporary SQLite database with one lesson holding `--comments`
+comments by `--users` users, then times reading the newest page (50) as:
+
+  load all     every comment with joinedload(Comment.user) (the old endpoint)
+  keyset ORM   a keyset page of Comment entities with their full User rows
+  keyset slim  crud.get_lesson_comments: a keyset page of the shown columns only
+  api miss     crud_async.get_lesson_comments with an empty first-page cache
+  api hit      crud_async.get_lesson_comments served from the cache (one count lookup)
+"""
+import argparse, asyncio, os, random, statistics, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, joinedload
+
+from app import crud, crud_async, models, pagination
+from app.cache import comment_page_cache
+from app.database import Base, make_async_engine, make_engine
+
+
+def build(path: str, comments: int, users: int, chunk: int = 100_000):
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(1)
+    start = datetime(2025, 1, 1)
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": i, "email": f"u{i}@bench", "hashed_password": "x", "full_name": f"User {i}"}
+            for i in range(1, users + 1)
+        ])
+        conn.execute(insert(models.Lesson), [{"id": 1, "title": "popular", "youtube_id": "x", "duration": 600, "order": 1, "comment_count": comments}])
+        for lo in range(0, comments, chunk):
+            conn.execute(insert(models.Comment), [
+                {"user_id": rnd.randint(1, users), "lesson_id": 1, "text": f"comment {i} " + "x" * rnd.randint(10, 200),
+                 "created_at": start + timedelta(seconds=i * 30)}
+                for i in range(lo, min(lo + chunk, comments))
+            ])
+    print(f"generated {comments:,} comments by {users:,} users in {time.perf_counter() - t0:.1f}s ({path})")
+    return engine
+
+
+def summary(samples: list) -> str:
+    samples = sorted(s * 1000 for s in samples)
+    return f"median {statistics.median(samples):8.2f} ms, p99 {samples[max(int(len(samples) * 0.99) - 1, 0)]:8.2f} ms"
+
+
+def timed(fn, n: int) -> str:
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summary(samples)
+
+
+async def timed_async(fn, n: int) -> str:
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t0)
+    return summary(samples)
+
+
+async def api(path: str, runs: int):
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    engine = make_async_engine(f"sqlite:///{path}", profile="production")
+    async with AsyncSession(engine) as db:
+        async def miss():
+            comment_page_cache.clear()
+            await crud_async.get_lesson_comments(db, 1)
+
+        print("api miss    ", await timed_async(miss, runs))
+        await crud_async.get_lesson_comments(db, 1)
+        print("api hit     ", await timed_async(lambda: crud_async.get_lesson_comments(db, 1), runs))
+    await engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--comments", type=int, default=100_000)
+    ap.add_argument("--users", type=int, default=20_000)
+    ap.add_argument("--runs", type=int, default=200)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_comments.db")
+    engine = build(path, args.comments, args.users)
+    C = models.Comment
+    with Session(engine) as db:
+        def load_all():
+            db.query(C).options(joinedload(C.user)).filter(C.lesson_id == 1).order_by(C.created_at.desc()).all()
+            db.expunge_all()
+
+        def keyset_orm():
+            stmt = pagination.keyset(select(C).options(joinedload(C.user)).where(C.lesson_id == 1), C.id, None, 50, sort_col=C.created_at)
+            db.scalars(stmt).all()
+            db.expunge_all()
+
+        print("load all    ", timed(load_all, max(args.runs // 20, 3)))
+        print("keyset ORM  ", timed(keyset_orm, args.runs))
+        print("keyset slim ", timed(lambda: crud.get_lesson_comments(db, 1), args.runs))
+    asyncio.run(api(path, args.runs))
+
+
+if __name__ == "__main__":
+    main()
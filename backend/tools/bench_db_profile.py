@@ -0,0 +1,86 @@
+# backend/tools/bench_db_profile.py
+"""
+Concurrent reader/writer throughput on SQLite with and without the engine profile.
+
+  python tools/bench_db_profile.py [--readers 8] [--writers 4] [--seconds 10]
+
+Runs the same mixed workload twice against a fresh temporary database file:
+once with DB_PROFILE=default (rollback journal, default pool) and once with
+the production profile (WAL, synchronous=NORMAL, busy_timeout, mmap, cache).
+"""
+import argparse, os, sys, tempfile, threading, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.database import make_engine
+
+
+def run(profile: str, readers: int, writers: int, seconds: float, rows: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = make_engine(f"sqlite:///{path}", profile=profile)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE progress (id INTEGER PRIMARY KEY, user_id INTEGER, lesson_id INTEGER, seconds INTEGER)"))
+        conn.execute(text("CREATE INDEX ix_bench_user ON progress (user_id)"))
+        conn.execute(
+            text("INSERT INTO progress (user_id, lesson_id, seconds) VALUES (:u, :l, 0)"),
+            [{"u": i % 1000, "l": i} for i in range(rows)],
+        )
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def reader(n):
+        done = errors = 0
+        while time.perf_counter() < stop:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT lesson_id, seconds FROM progress WHERE user_id = :u"), {"u": (n * 7 + done) % 1000}).all()
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts["reads"] += done
+            counts["errors"] += errors
+
+    def writer(n):
+        done = errors = 0
+        while time.perf_counter() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text("UPDATE progress SET seconds = seconds + 5 WHERE id = :id"), {"id": (n * 13 + done) % rows + 1})
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts["writes"] += done
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    engine.dispose()
+    return {k: v / seconds for k, v in counts.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--rows", type=int, default=50000)
+    args = ap.parse_args()
+
+    print(f"readers={args.readers} writers={args.writers} seconds={args.seconds}")
+    print(f"{'profile':>12} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for profile in ("default", "production"):
+        r = run(profile, args.readers, args.writers, args.seconds, args.rows)
+        print(f"{profile:>12} {r['reads']:>10.0f} {r['writes']:>10.0f} {r['errors']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
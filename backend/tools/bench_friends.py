@@ -0,0 +1,88 @@
+# backend/tools/bench_friends.py
+"""
+Friend list, mutual-friend and suggestion latency around a well-connected user.
+
+  python tools/bench_friends.py [--users 200000] [--friends 5000] [--degree 20] [--courses 100] [--runs 50]
+
+Builds a temporary SQLite database with `--users` users, each with about
+`--degree` random friends and three enrollments, plus one hub user (id 1)
+with `--friends` friends, then times for the hub:
+
+  list         get_friends(): first page with mutual counts
+  list (deep)  get_friends() following the cursor to the last page
+  mutual       mutual_friend_counts() for 50 random users
+  suggest      suggest_friends(): friend-of-friend pool ranked by shared courses
+"""
+import argparse, os, random, statistics, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.database import Base, make_engine
+
+
+def build(path: str, users: int, friends: int, degree: int, courses: int):
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(1)
+    t0 = time.perf_counter()
+    edges = {(1, f) for f in rnd.sample(range(2, users + 1), friends)}
+    for u in range(2, users + 1):
+        edges.update((u, rnd.randint(2, users)) for _ in range(degree // 2))
+    edges = {(a, b) for a, b in edges if a != b}
+    edges |= {(b, a) for a, b in edges}
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": i, "email": f"u{i}@bench", "hashed_password": "x", "full_name": f"User {i}"} for i in range(1, users + 1)
+        ])
+        conn.execute(insert(models.Course), [{"id": c, "title": f"c{c}", "price": 0} for c in range(1, courses + 1)])
+        conn.execute(insert(models.Enrollment), [
+            {"user_id": i, "course_id": c} for i in range(1, users + 1) for c in rnd.sample(range(1, courses + 1), 3)
+        ])
+        conn.execute(insert(models.Friend), [{"user_id": a, "friend_id": b} for a, b in edges])
+    print(f"generated {users:,} users, {len(edges):,} friend rows in {time.perf_counter() - t0:.1f}s ({path})")
+    return engine
+
+
+def timed(fn, n):
+    samples = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return f"median {statistics.median(samples):7.2f} ms, p99 {samples[max(int(len(samples) * 0.99) - 1, 0)]:7.2f} ms"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200_000)
+    ap.add_argument("--friends", type=int, default=5_000)
+    ap.add_argument("--degree", type=int, default=20)
+    ap.add_argument("--courses", type=int, default=100)
+    ap.add_argument("--runs", type=int, default=50)
+    args = ap.parse_args()
+
+    engine = build(os.path.join(tempfile.mkdtemp(), "bench_friends.db"), args.users, args.friends, args.degree, args.courses)
+    rnd = random.Random(2)
+    with Session(engine) as db:
+        def walk(_):
+            cursor, pages = None, 0
+            while True:
+                _, cursor = crud.get_friends(db, 1, cursor, 100)
+                pages += 1
+                if not cursor:
+                    return pages
+
+        print(f"hub user: {args.friends:,} friends, {walk(0)} pages of 100\n")
+        print("list         ", timed(lambda i: crud.get_friends(db, 1, None, 20), args.runs))
+        print("list (deep)  ", timed(walk, max(args.runs // 10, 1)), "(whole list)")
+        print("mutual       ", timed(lambda i: crud.mutual_friend_counts(db, 1, rnd.sample(range(2, args.users + 1), 50)), args.runs))
+        print("suggest      ", timed(lambda i: crud.suggest_friends(db, 1, 10), args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# backend/tools/bench_import_time.py
+"""
+Import-time budget for the API module, based on `python -X importtime`.
+
+  python tools/bench_import_time.py [--budget-ms 1500] [--runs 5] [--top 15]
+
+Imports app.main in fresh interpreters, takes the median cumulative time of
+`app.main` and exits with status 1 when it exceeds the budget or when one of
+the modules that must stay lazy (qrcode, PIL, passlib, aiosqlite, asyncpg)
+shows up at import time.
+"""
+import argparse, os, re, statistics, subprocess, sys, tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ("qrcode", "PIL", "passlib", "aiosqlite", "asyncpg")
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure():
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/importtime.db")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        sys.exit(2)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            rows.append((name, int(self_us), int(cum_us), len(indent)))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")))
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    totals, last = [], []
+    for _ in range(args.runs):
+        last = measure()
+        totals.append(next(cum for name, _, cum, _ in last if name == "app.main") / 1000)
+    total = statistics.median(totals)
+
+    print(f"app.main cumulative import: median {total:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module (direct imports of app.main)")
+    top_level = [r for r in last if r[3] == 3]
+    for name, self_us, cum_us, _ in sorted(top_level, key=lambda r: -r[2])[: args.top]:
+        print(f"{cum_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    failed = False
+    leaked = sorted({name.split(".")[0] for name, *_ in last if name.split(".")[0] in LAZY_MODULES})
+    if leaked:
+        print(f"\n❌ modules that should load lazily were imported: {', '.join(leaked)}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"\n❌ import time regression: {total:.1f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("\n✅ within budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
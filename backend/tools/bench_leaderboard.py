@@ -0,0 +1,91 @@
+# backend/tools/bench_leaderboard.py
+"""
+Leaderboard rebuild time and lookup latency on a generated user base.
+
+  python tools/bench_leaderboard.py [--users 1000000] [--courses 200] [--lookups 20000]
+
+Builds a temporary SQLite database with `--users` users (random minutes,
+grade levels and dek codes), a weekly study_daily row for a third of them and
+two enrollments with completed lessons per user, then times
+Leaderboard.rebuild(), loading one course board, and on the rebuilt boards
+rank-and-neighbours lookups, top-10 reads and incremental score updates.
+"""
+import argparse, os, random, statistics, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from sqlalchemy import insert
+
+from app import models
+from app.crud import study_day
+from app.database import Base, make_engine
+from app.leaderboard import Leaderboard
+
+GRADES = ["M4", "M5", "M6", None]
+
+
+def build(path: str, users: int, courses: int, chunk: int = 100_000):
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(1)
+    today = study_day(datetime.utcnow())
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        for lo in range(1, users + 1, chunk):
+            ids = range(lo, min(lo + chunk, users + 1))
+            grades = [rnd.choice(GRADES) for _ in ids]
+            conn.execute(insert(models.User), [
+                {"id": i, "email": f"u{i}@bench", "hashed_password": "x", "total_minutes": rnd.randint(0, 20_000),
+                 "grade_level": g, "dek_code": {"M6": "69", "M5": "70", "M4": "71"}.get(g)}
+                for i, g in zip(ids, grades)
+            ])
+            conn.execute(insert(models.StudyDaily), [
+                {"user_id": i, "day": today, "minutes": rnd.randint(1, 600), "events": 1} for i in ids if i % 3 == 0
+            ])
+            conn.execute(insert(models.Enrollment), [
+                {"user_id": i, "course_id": c, "completed_lessons": rnd.randint(0, 40)}
+                for i in ids for c in rnd.sample(range(1, courses + 1), 2)
+            ])
+    print(f"generated {users:,} users in {time.perf_counter() - t0:.1f}s ({path})")
+    return engine
+
+
+def timed(fn, n):
+    samples = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return f"median {statistics.median(samples):.1f} µs, p99 {samples[int(len(samples) * 0.99) - 1]:.1f} µs"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1_000_000)
+    ap.add_argument("--courses", type=int, default=200)
+    ap.add_argument("--lookups", type=int, default=20_000)
+    args = ap.parse_args()
+
+    engine = build(os.path.join(tempfile.mkdtemp(), "bench_leaderboard.db"), args.users, args.courses)
+    board = Leaderboard()
+    with engine.connect() as conn:
+        seconds = board.rebuild(conn)
+        t0 = time.perf_counter()
+        board.load_course(1, conn)
+        course = time.perf_counter() - t0
+    print(f"rebuild: {seconds:.2f}s, {board.stats()['boards']} boards, {board.stats()['ranked_users']:,} ranked users")
+    print(f"course board: {course * 1000:.1f} ms for {len(board.board('course', 1)):,} users\n")
+
+    rnd = random.Random(2)
+    ids = [rnd.randint(1, args.users) for _ in range(args.lookups)]
+    print("my rank ±5 (all)   ", timed(lambda i: board.around("all", None, ids[i], 5), args.lookups))
+    print("my rank ±5 (grade) ", timed(lambda i: board.around("grade", "M6", ids[i], 5), args.lookups))
+    print("top 10 (week)      ", timed(lambda i: board.top("week", None, 10), args.lookups))
+    print("set minutes        ", timed(lambda i: board.set_minutes(ids[i], rnd.randint(0, 20_000), "M6", "69"), args.lookups))
+    print("set completed      ", timed(lambda i: board.set_completed(ids[i], 1, i % 40), args.lookups))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# backend/tools/bench_login.py
+"""
+Password verification throughput of the hashing pool (logins/sec).
+
+  python tools/bench_login.py [--logins 400] [--workers 1,4,8] [--rounds 29000]
+
+Each login is one pbkdf2_sha256 verify submitted through HashPool, the same
+path /auth/login uses. Worker counts above os.cpu_count() are still run but
+cannot scale past the number of physical cores.
+"""
+import argparse, asyncio, os, sys, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.hashing import HashPool, make_context
+
+
+async def run(workers: int, logins: int, rounds: int, hashed: str) -> float:
+    pool = HashPool(workers=workers, queue_size=logins, rounds=rounds)
+    # warm up the worker processes so process start-up is not measured
+    await asyncio.gather(*[pool.verify_and_update("password", hashed) for _ in range(workers)])
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[pool.verify_and_update("password", hashed) for _ in range(logins)])
+    elapsed = time.perf_counter() - t0
+    pool.shutdown()
+    assert all(ok for ok, _ in results)
+    return logins / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logins", type=int, default=400)
+    ap.add_argument("--workers", default="1,4,8")
+    ap.add_argument("--rounds", type=int, default=int(os.getenv("PASSWORD_HASH_ROUNDS", "29000")))
+    args = ap.parse_args()
+
+    hashed = make_context(args.rounds).hash("password")
+    print(f"cpu_count={os.cpu_count()} rounds={args.rounds} logins={args.logins}")
+    print(f"{'workers':>8} {'logins/sec':>12}")
+    for w in [int(x) for x in args.workers.split(",")]:
+        rate = asyncio.run(run(w, args.logins, args.rounds, hashed))
+        print(f"{w:>8} {rate:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# backend/tools/bench_pagination.py
+"""
+OFFSET vs keyset paging on a large audit log.
+
+  python tools/bench_pagination.py [--rows 5000000] [--page-size 50] [--deep-page 10000] [--repeat 5]
+
+Fills a temporary SQLite database with `--rows` audit_logs rows, then times
+crud.list_audit for page 1 and page `--deep-page`: once with the legacy OFFSET
+path (exact count) and once by walking the keyset cursor (no count). The
+keyset cursor for the deep page is taken from the row just before it, the same
+value a client would have received from the previous page.
+"""
+import argparse, os, statistics, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, pagination
+from app.database import make_engine
+
+
+def fill(engine, rows: int):
+    models.AuditLog.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows) "
+            "INSERT INTO audit_logs (action, actor_id, target_id, data, created_at) "
+            "SELECT CASE i % 4 WHEN 0 THEN 'update_user' WHEN 1 THEN 'create_course' "
+            "WHEN 2 THEN 'approve_payment' ELSE 'delete_lesson' END, "
+            "i % 97, i % 5000, NULL, datetime('2024-01-01', '+' || (i / 10) || ' seconds') FROM n"
+        ), {"rows": rows})
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5_000_000)
+    ap.add_argument("--page-size", type=int, default=pagination.DEFAULT_LIMIT)
+    ap.add_argument("--deep-page", type=int, default=10_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_pagination.db")
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    t0 = time.perf_counter()
+    fill(engine, args.rows)
+    print(f"filled {args.rows:,} audit_logs rows in {time.perf_counter() - t0:.1f}s ({path})")
+
+    db = sessionmaker(bind=engine)()
+    ps, deep = args.page_size, args.deep_page
+
+    def offset(page):
+        return lambda: crud.list_audit(db, None, None, None, None, None, page, ps, "created_at:desc", None, "exact")
+
+    # cursor a client would hold after reading page deep-1
+    last_id = db.execute(text("SELECT id FROM audit_logs ORDER BY id DESC LIMIT 1 OFFSET :o"), {"o": (deep - 1) * ps - 1}).scalar()
+    deep_cursor = pagination.encode_cursor([last_id])
+
+    def keyset(cursor):
+        return lambda: crud.list_audit(db, None, None, None, None, None, 1, ps, "created_at:desc", cursor, "none")
+
+    # the OFFSET path is page >= 2 only; page 1 always uses the keyset branch
+    results = [
+        ("offset + count, page 2", timed(offset(2), args.repeat)),
+        (f"offset + count, page {deep:,}", timed(offset(deep), args.repeat)),
+        ("keyset, page 1", timed(keyset(None), args.repeat)),
+        (f"keyset, page {deep:,}", timed(keyset(deep_cursor), args.repeat)),
+    ]
+    a = crud.list_audit(db, None, None, None, None, None, deep, ps, "", None, "none")[0]
+    b = crud.list_audit(db, None, None, None, None, None, 1, ps, "", deep_cursor, "none")[0]
+    assert [r.id for r in a] == [r.id for r in b], "offset and keyset pages differ"
+
+    print(f"\n{'query':<34} {'median ms':>10}")
+    for name, ms in results:
+        print(f"{name:<34} {ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
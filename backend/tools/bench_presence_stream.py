@@ -0,0 +1,168 @@
+# backend/tools/bench_presence_stream.py
+"""
+Idle friend presence streams held by one API process, and push latency.
+
+  python tools/bench_presence_stream.py [--conns 10000] [--degree 10] [--changes 50]
+
+Builds a temporary SQLite database with one user per connection and about
+`--degree` random friends each, starts a single uvicorn worker on it and opens
+`--conns` GET /users/me/friends/stream connections (one per user) from this
+process. It then reports:
+
+  connect   time to open every stream and receive its snapshot
+  memory    server RSS before and after, per connection
+  push      `--changes` users post a study event with a new activity; time until
+            every connected friend has received the presence event
+  idle      after two heartbeats, how many streams are still open
+
+Needs about `--conns` file descriptors in each process (ulimit -n).
+"""
+import argparse, asyncio, os, random, subprocess, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8799
+HEARTBEAT = 5
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def build(path: str, users: int, degree: int) -> dict:
+    from sqlalchemy import insert
+    from app import models
+    from app.database import Base, make_engine
+
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(1)
+    edges = {(u, rnd.randint(1, users)) for u in range(1, users + 1) for _ in range(degree // 2)}
+    edges = {(a, b) for a, b in edges if a != b}
+    edges |= {(b, a) for a, b in edges}
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": i, "email": f"u{i}@bench", "hashed_password": "x"} for i in range(1, users + 1)])
+        conn.execute(insert(models.Friend), [{"user_id": a, "friend_id": b} for a, b in edges])
+    engine.dispose()
+    friends = {}
+    for a, b in edges:
+        friends.setdefault(a, []).append(b)
+    print(f"generated {users:,} users, {len(edges):,} friend rows")
+    return friends
+
+
+class Stream:
+    def __init__(self):
+        self.presence = 0
+        self.pings = 0
+        self.open = False
+
+
+async def open_stream(uid: int, ticket: str, stream: Stream, ready: asyncio.Event):
+    reader, writer = await asyncio.open_connection("127.0.0.1", PORT)
+    writer.write(f"GET /users/me/friends/stream?ticket={ticket} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+    stream.open = True
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            if b"event: snapshot" in data:
+                ready.set()
+            stream.presence += data.count(b"event: presence")
+            stream.pings += data.count(b": ping")
+    finally:
+        stream.open = False
+        writer.close()
+
+
+async def run(args, friends: dict, tokens: dict, tickets: dict, pid: int):
+    import httpx
+
+    base = rss_mb(pid)
+    streams = {uid: Stream() for uid in tokens}
+    ready = {uid: asyncio.Event() for uid in tokens}
+    t0 = time.perf_counter()
+    tasks, sem = [], asyncio.Semaphore(200)
+
+    async def connect(uid):
+        async with sem:
+            tasks.append(asyncio.create_task(open_stream(uid, tickets[uid], streams[uid], ready[uid])))
+            await asyncio.wait_for(ready[uid].wait(), 60)
+
+    await asyncio.gather(*(connect(uid) for uid in tokens))
+    secs = time.perf_counter() - t0
+    rss = rss_mb(pid)
+    print(f"connect : {len(tokens):,} streams in {secs:.1f}s ({len(tokens) / secs:,.0f}/s)")
+    print(f"memory  : server RSS {base:.0f} MB -> {rss:.0f} MB, {(rss - base) * 1024 / len(tokens):.1f} KB per stream")
+
+    rnd = random.Random(2)
+    movers = rnd.sample(sorted(tokens), args.changes)
+    expected = sum(len(friends.get(uid, ())) for uid in movers)
+    before = sum(s.presence for s in streams.values())
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=30) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(
+            client.post("/users/me/study-events", json={"events": [{"minutes": 1, "activity": f"bench {i}"}]},
+                        headers={"Authorization": f"Bearer {tokens[uid]}"})
+            for i, uid in enumerate(movers)
+        ))
+        posted = time.perf_counter() - t0
+        # events to one stream may be coalesced, so wait for the count to stop growing
+        last, stable = -1, 0
+        while stable < 5 and time.perf_counter() - t0 < 30:
+            got = sum(s.presence for s in streams.values()) - before
+            stable = stable + 1 if got == last else 0
+            last = got
+            await asyncio.sleep(0.05)
+        secs = time.perf_counter() - t0 - 0.25
+    print(f"push    : {args.changes} changes for {expected:,} watching streams, requests {posted * 1000:.0f} ms, "
+          f"{last:,} presence events delivered within {secs * 1000:.0f} ms")
+
+    await asyncio.sleep(2 * HEARTBEAT + 1)
+    alive = sum(s.open for s in streams.values())
+    pinged = sum(s.pings > 0 for s in streams.values())
+    print(f"idle    : {alive:,} of {len(tokens):,} streams open after {2 * HEARTBEAT + 1}s, {pinged:,} received heartbeats")
+    for t in tasks:
+        t.cancel()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--conns", type=int, default=10_000)
+    ap.add_argument("--degree", type=int, default=10)
+    ap.add_argument("--changes", type=int, default=50)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_presence.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", SECRET_KEY="bench-secret", STARTUP_SCHEMA_MODE="off",
+               PASSWORD_HASH_WORKERS="0", EVENTS_HEARTBEAT_INTERVAL=str(HEARTBEAT),
+               STREAM_TICKET_SECONDS="3600")  # opening every stream takes longer than a real ticket lives
+    os.environ.update(env)
+    from app.auth import create_access_token, create_stream_ticket
+
+    friends = build(path, args.conns, args.degree)
+    tokens = {uid: create_access_token(f"u{uid}@bench") for uid in range(1, args.conns + 1)}
+    tickets = {uid: create_stream_ticket(t) for uid, t in tokens.items()}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning", "--backlog", "4096"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+    )
+    try:
+        time.sleep(5)
+        asyncio.run(run(args, friends, tokens, tickets, server.pid))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
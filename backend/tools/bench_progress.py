@@ -0,0 +1,111 @@
+# backend/tools/bench_progress.py
+"""
+Playback heartbeat throughput: direct writes vs the write-behind buffer.
+
+  python tools/bench_progress.py [--viewers 2000] [--threads 8] [--seconds 10] [--flush-interval 1]
+
+Each worker thread loops over its share of `--viewers` (user, lesson) pairs and
+posts a heartbeat for each one. The direct run calls
+crud.update_lesson_progress_time (one upsert + COMMIT per beat);
+the buffered run calls ProgressBuffer.record while a flusher thread writes
+batches every `--flush-interval` seconds. Reports heartbeats/s and the number
+of SQL statements sent to the database (an executemany counts once).
+"""
+import argparse, os, sys, tempfile, threading, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.database import Base, make_engine
+from app.progress_buffer import ProgressBuffer
+
+
+def setup():
+    engine = make_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_progress.db')}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    counter = {"statements": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_):
+        counter["statements"] += 1
+
+    return engine, sessionmaker(bind=engine), counter
+
+
+def drive(threads: int, viewers: int, seconds: float, beat):
+    beats = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def worker(n):
+        pairs = [(v, v % 50 + 1) for v in range(n, viewers, threads)]
+        done, pos = 0, 0
+        while time.perf_counter() < stop:
+            for user_id, lesson_id in pairs:
+                beat(user_id, lesson_id, pos)
+                done += 1
+            pos += 5
+        beats[n] = done
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return sum(beats)
+
+
+def run_direct(args):
+    engine, Session, counter = setup()
+    local = threading.local()
+
+    def beat(user_id, lesson_id, pos):
+        if not hasattr(local, "db"):
+            local.db = Session()
+        crud.update_lesson_progress_time(local.db, user_id, lesson_id, pos)
+
+    t0 = time.perf_counter()
+    beats = drive(args.threads, args.viewers, args.seconds, beat)
+    return beats, time.perf_counter() - t0, counter["statements"], engine
+
+
+def run_buffered(args):
+    engine, Session, counter = setup()
+    buf = ProgressBuffer(flush_interval=args.flush_interval)
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.wait(args.flush_interval):
+            with Session() as db:
+                buf.flush(db)
+
+    f = threading.Thread(target=flusher)
+    f.start()
+    t0 = time.perf_counter()
+    beats = drive(args.threads, args.viewers, args.seconds, buf.record)
+    elapsed = time.perf_counter() - t0
+    stop.set(); f.join()
+    with Session() as db:
+        buf.flush(db)
+    return beats, elapsed, counter["statements"], engine
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--viewers", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--flush-interval", type=float, default=1.0)
+    args = ap.parse_args()
+
+    print(f"{args.viewers} viewers, {args.threads} threads, {args.seconds:.0f}s per run\n")
+    print(f"{'mode':<10} {'heartbeats':>11} {'beats/s':>10} {'statements':>11} {'stmts/beat':>11} {'rows':>7}")
+    for name, fn in (("direct", run_direct), ("buffered", run_buffered)):
+        beats, elapsed, statements, engine = fn(args)
+        with engine.connect() as conn:
+            rows = conn.execute(select(func.count()).select_from(models.Progress)).scalar()
+        print(f"{name:<10} {beats:>11,} {beats / elapsed:>10,.0f} {statements:>11,} {statements / max(beats, 1):>11.4f} {rows:>7,}")
+
+
+if __name__ == "__main__":
+    main()
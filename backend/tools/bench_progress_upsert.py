@@ -0,0 +1,96 @@
+# backend/tools/bench_progress_upsert.py
+"""
+Progress write latency under concurrent writers: SELECT-then-write vs a single upsert.
+
+  python tools/bench_progress_upsert.py [--writers 64] [--writes 200] [--keys 2000] [--url postgresql://...]
+
+Every writer thread performs `--writes` progress writes on random
+(user, lesson) keys out of `--keys`, each in its own transaction:
+
+  select+write  SELECT the row, then UPDATE or INSERT (the old crud code path)
+  upsert        crud.update_lesson_progress_time: one INSERT ... ON CONFLICT
+
+Reports throughput, p50 / p95 / p99 latency and failed writes. The
+select+write path loses races on new keys against the unique index, which
+is where its errors come from. Without --url a temporary SQLite file is used;
+the pool is sized from DB_POOL_SIZE (64 unless set).
+"""
+import argparse, os, random, statistics, sys, tempfile, threading, time
+
+os.environ.setdefault("DB_POOL_SIZE", "64")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models
+from app.database import Base, make_engine
+
+
+def select_then_write(db, user_id, lesson_id, seconds):
+    P = models.Progress
+    pid = db.scalar(select(P.id).where(P.user_id == user_id, P.lesson_id == lesson_id))
+    if pid:
+        db.execute(update(P).where(P.id == pid).values(seconds_watched=seconds, last_updated=datetime.utcnow()))
+    else:
+        db.execute(insert(P).values(user_id=user_id, lesson_id=lesson_id, seconds_watched=seconds, completed=False))
+    db.commit()
+
+
+def run(Session, writers: int, writes: int, keys: int, fn):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        mine, failed = [], 0
+        with Session() as db:
+            for i in range(writes):
+                k = rnd.randrange(keys)
+                t0 = time.perf_counter()
+                try:
+                    fn(db, k // 50 + 1, k % 50 + 1, i)
+                except Exception:
+                    db.rollback()
+                    failed += 1
+                mine.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker, args=(n,)) for n in range(writers)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return time.perf_counter() - t0, sorted(latencies), errors[0]
+
+
+def pct(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--writers", type=int, default=64)
+    ap.add_argument("--writes", type=int, default=200)
+    ap.add_argument("--keys", type=int, default=2000)
+    ap.add_argument("--url")
+    args = ap.parse_args()
+
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_upsert.db')}"
+    engine = make_engine(url, profile="production")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    print(f"{args.writers} writers x {args.writes} writes over {args.keys} keys ({engine.dialect.name})\n")
+    print(f"{'path':<14} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, fn in (("select+write", select_then_write), ("upsert", crud.update_lesson_progress_time)):
+        with engine.begin() as conn:
+            conn.execute(delete(models.Progress))
+        elapsed, lat, errors = run(Session, args.writers, args.writes, args.keys, fn)
+        print(f"{name:<14} {len(lat) / elapsed:>9,.0f} {statistics.median(lat):>8.2f} {pct(lat, .95):>8.2f} {pct(lat, .99):>8.2f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# backend/tools/bench_search.py
+"""
+Search latency on a generated catalog.
+
+  python tools/bench_search.py [--lessons 100000] [--courses 2000] [--queries 200]
+
+Builds a temporary SQLite database with `--courses` courses and `--lessons`
+lessons (mixed Thai / English titles), indexes it through the r0002 migration
+and times search.search() for a set of Thai, English and prefix queries.
+Reports median / p95 / max in milliseconds.
+"""
+import argparse, os, random, statistics, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app import migrations, models, search
+from app.database import Base, make_engine
+
+SUBJECTS = ["คณิตศาสตร์", "ฟิสิกส์", "เคมี", "ชีววิทยา", "ภาษาอังกฤษ", "Math", "Physics", "English"]
+TOPICS = [
+    "สมการกำลังสอง", "ตรีโกณมิติ", "ลิมิตและความต่อเนื่อง", "อนุพันธ์", "ปริพันธ์", "เวกเตอร์",
+    "การเคลื่อนที่แนวตรง", "แรงและกฎการเคลื่อนที่", "พันธะเคมี", "กรดเบส", "เซลล์", "พันธุศาสตร์",
+    "grammar", "vocabulary", "reading", "matrix", "probability", "statistics", "kinematics", "optics",
+]
+QUERIES = ["สมการ", "ตรีโกณ", "อนุพันธ์", "กฎการเคลื่อนที่", "กรดเบส", "matrix", "prob", "vocab", "physics optics", "เซลล์"]
+
+
+def build(path: str, courses: int, lessons: int):
+    engine = make_engine(f"sqlite:///{path}", profile="production")
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(1)
+    per_course = max(lessons // courses, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Course), [
+            {"id": c, "title": f"{rnd.choice(SUBJECTS)} {rnd.choice(TOPICS)} ม.{rnd.randint(4, 6)}",
+             "description": " ".join(rnd.sample(TOPICS, 3)), "category": rnd.choice(SUBJECTS), "price": 0}
+            for c in range(1, courses + 1)
+        ])
+        conn.execute(insert(models.Chapter), [{"id": c, "course_id": c, "title": "บทที่ 1", "order": 1} for c in range(1, courses + 1)])
+        conn.execute(insert(models.Lesson), [
+            {"id": i, "chapter_id": (i - 1) // per_course % courses + 1, "title": f"{rnd.choice(TOPICS)} ตอนที่ {i % 50} {rnd.choice(TOPICS)}",
+             "youtube_id": "", "order": i % per_course}
+            for i in range(1, lessons + 1)
+        ])
+    t0 = time.perf_counter()
+    migrations.upgrade(engine, log=lambda *_: None)
+    print(f"indexed {courses + lessons:,} documents in {time.perf_counter() - t0:.1f}s ({path})")
+    return engine
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lessons", type=int, default=100_000)
+    ap.add_argument("--courses", type=int, default=2_000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--limit", type=int, default=20)
+    args = ap.parse_args()
+
+    engine = build(os.path.join(tempfile.mkdtemp(), "bench_search.db"), args.courses, args.lessons)
+    db = sessionmaker(bind=engine)()
+    search.search(db, QUERIES[0])  # warm the page cache
+
+    samples, hits = [], 0
+    for i in range(args.queries):
+        t0 = time.perf_counter()
+        hits += len(search.search(db, QUERIES[i % len(QUERIES)], args.limit))
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{args.queries} queries, {hits / args.queries:.1f} hits/query: "
+          f"median {statistics.median(samples):.2f} ms, p95 {p95:.2f} ms, max {samples[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
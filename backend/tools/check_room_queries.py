@@ -0,0 +1,138 @@
+# backend/tools/check_room_queries.py
+"""
+Query budget of the learning room endpoint.
+
+  python tools/check_room_queries.py [--lessons 40] [--comments 120]
+
+Builds a temporary SQLite database with one course (`--lessons` lessons in
+four chapters, progress on half of them, ratings and `--comments` comments
+on the opened lesson), then counts the SQL statements run for:
+
+  room         GET /courses/{cid}/lessons/{lid}/room, first comment page cached
+  room, cold   the same with an empty comment page cache
+  resume       GET /courses/{cid}/room (server picks the lesson)
+  old flow     the five requests the learning room used to make for one lesson
+               (its comments request runs on the async engine and is not counted)
+
+Statements and pool checkouts (one per request that reaches the database)
+are counted on the sync engine.
+The principal and catalog caches are warmed first, as on a live worker.
+Exits with status 1 when a room request runs more than crud.ROOM_QUERY_BUDGET
+statements, so it can gate CI.
+"""
+import argparse, os, sys, tempfile, time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'check_room.db')}"
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ["CATALOG_CHECK_INTERVAL"] = "3600"  # no version check inside a measured request
+
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+from app import crud, models
+from app.auth import create_access_token
+from app.cache import comment_page_cache
+from app.database import SessionLocal, engine
+from app.main import app
+
+
+def seed(lessons: int, comments: int):
+    per_chapter = max(lessons // 4, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [{"id": i, "email": f"u{i}@check", "hashed_password": "x", "full_name": f"User {i}"} for i in range(1, 51)])
+        conn.execute(insert(models.Course), [{"id": 1, "title": "course", "description": "", "price": 0}])
+        conn.execute(insert(models.Chapter), [{"id": c, "course_id": 1, "title": f"ch {c}", "order": c} for c in range(1, 5)])
+        conn.execute(insert(models.Lesson), [
+            {"id": l, "chapter_id": min((l - 1) // per_chapter + 1, 4), "title": f"lesson {l}", "youtube_id": "x", "duration": 600, "order": l}
+            for l in range(1, lessons + 1)
+        ])
+        conn.execute(insert(models.Progress), [
+            {"user_id": 1, "lesson_id": l, "completed": l <= lessons // 2, "seconds_watched": 30 * l} for l in range(1, lessons // 2 + 2)
+        ])
+    lesson = lessons // 2 + 1
+    with SessionLocal() as db:
+        for uid in range(1, 21):
+            crud.set_lesson_rating(db, uid, lesson, uid % 5 + 1)
+        start = datetime.utcnow() - timedelta(days=1)
+        for i in range(comments):
+            db.add(models.Comment(user_id=i % 50 + 1, lesson_id=lesson, text=f"comment {i}", created_at=start + timedelta(seconds=i)))
+        db.query(models.Lesson).filter_by(id=lesson).update({"comment_count": comments})
+        db.commit()
+    return lesson
+
+
+class Counter:
+    def __init__(self):
+        self.statements = []
+        self.checkouts = 0
+        event.listen(engine, "before_cursor_execute", self._on_statement)
+        event.listen(engine, "checkout", self._on_checkout)
+
+    def _on_statement(self, conn, cursor, statement, params, context, executemany):
+        self.statements.append(statement)
+
+    def _on_checkout(self, dbapi_conn, record, proxy):
+        self.checkouts += 1
+
+    def measure(self, fn):
+        self.statements, self.checkouts = [], 0
+        t0 = time.perf_counter()
+        fn()
+        return len(self.statements), self.checkouts, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lessons", type=int, default=40)
+    ap.add_argument("--comments", type=int, default=120)
+    ap.add_argument("-v", "--verbose", action="store_true", help="print the statements of each room request")
+    args = ap.parse_args()
+
+    with TestClient(app) as client:
+        lesson = seed(args.lessons, args.comments)
+        h = {"Authorization": f"Bearer {create_access_token('u1@check')}"}
+
+        def get(path):
+            r = client.get(path, headers=h)
+            assert r.status_code == 200, (path, r.status_code, r.text)
+            return r.json()
+
+        room_path = f"/courses/1/lessons/{lesson}/room"
+        room = get(room_path)  # warms the principal, catalog and comment caches
+        assert room["lesson_id"] == lesson and room["comment_count"] == args.comments
+        assert len(room["completed_ids"]) == args.lessons // 2 and room["seconds"] == 30 * lesson
+        assert get("/courses/1/room")["lesson_id"] == lesson
+
+        def cold():
+            comment_page_cache.clear()
+            get(room_path)
+
+        def old_flow():
+            for path in ("/courses/1", "/courses/1/my-progress", f"/courses/1/lessons/{lesson}/progress",
+                         f"/lessons/{lesson}/comments", f"/lessons/{lesson}/rating"):
+                get(path)
+
+        counter = Counter()
+        failed = False
+        for label, fn, budgeted in (
+            ("room", lambda: get(room_path), True),
+            ("room, cold", cold, True),
+            ("resume", lambda: get("/courses/1/room"), True),
+            ("old flow", old_flow, False),
+        ):
+            n, checkouts, ms = counter.measure(fn)
+            over = budgeted and n > crud.ROOM_QUERY_BUDGET
+            failed |= over
+            budget = f"budget {crud.ROOM_QUERY_BUDGET}" if budgeted else "5 requests"
+            print(f"{label:<11} {n:>2} statements ({budget}), {checkouts} checkouts, {ms:6.1f} ms{'  OVER BUDGET' if over else ''}")
+            if args.verbose or over:
+                for s in counter.statements:
+                    print("    " + " ".join(s.split())[:160])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()